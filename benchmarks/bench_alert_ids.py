@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark of the memory used by the alert IDs of a persistence entry once loaded, and of the time
+to build and save, load and look them up, comparing a set of strings saved as a JSON list, as
+persistent iterators used to keep them, with magnetsdk2.alertids.AlertIdSet saved in its binary
+encoding, with and without a Bloom filter.
+
+Usage: python benchmarks/bench_alert_ids.py [ids]
+"""
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from uuid import UUID
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from magnetsdk2.alertids import AlertIdSet  # noqa: E402
+
+
+def _ids(n, seed):
+    """Returns n random alert IDs, generated from a seed so runs are comparable."""
+    generator = random.Random(seed)
+    return [str(UUID(int=generator.getrandbits(128), version=4)) for _ in range(n)]
+
+
+def _time(func):
+    gc.collect()
+    start = time.time()
+    result = func()
+    return result, time.time() - start
+
+
+def _bench(name, ids, others, build, encode, decode):
+    data, save = _time(lambda: encode(build(ids)))
+    alert_ids, load = _time(lambda: decode(data))
+    # the memory used is that of the loaded IDs, which own their strings, unlike the built ones,
+    # and is measured on a second load as tracing slows it down; the first one is dropped by
+    # rebinding the name, as Python 2 can't delete a variable used by a nested function
+    alert_ids = None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        alert_ids = decode(data)
+        memory = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    _, hits = _time(lambda: sum(1 for x in ids[:100000] if x in alert_ids))
+    _, misses = _time(lambda: sum(1 for x in others if x in alert_ids))
+    return {'name': name, 'memory_bytes': memory, 'encoded_bytes': len(data),
+            'save_seconds': save, 'load_seconds': load,
+            'hit_us': hits / min(len(ids), 100000) * 1e6, 'miss_us': misses / len(others) * 1e6}
+
+
+def run(n=1000000):
+    """Runs the benchmark.
+    :param n: number of alert IDs
+    :return: a list with a dict of results for each representation
+    """
+    ids = _ids(n, 0)
+    others = _ids(100000, 1)
+    return [
+        _bench('set+json', ids, others, set,
+               lambda s: json.dumps(list(s)).encode('ascii'),
+               lambda d: set(json.loads(d.decode('ascii')))),
+        _bench('AlertIdSet+binary', ids, others, AlertIdSet,
+               lambda s: s.to_bytes(), AlertIdSet.from_bytes),
+        _bench('AlertIdSet+bloom', ids, others, lambda x: AlertIdSet(x, bloom_capacity=n),
+               lambda s: s.to_bytes(),
+               lambda d: AlertIdSet.from_bytes(d, bloom_capacity=n)),
+    ]
+
+
+if __name__ == '__main__':
+    print('%-18s %10s %10s %8s %8s %8s %8s' % ('', 'memory', 'encoded', 'build', 'load', 'hit',
+                                              'miss'))
+    for result in run(*[int(x) for x in sys.argv[1:2]]):
+        print('%-18s %8.1fMB %8.1fMB %7.2fs %7.2fs %6.2fus %6.2fus' % (
+            result['name'], result['memory_bytes'] / 1e6, result['encoded_bytes'] / 1e6,
+            result['save_seconds'], result['load_seconds'], result['hit_us'], result['miss_us']))
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark of the per-request overhead of logging in Connection._request. Requests are
+answered by a canned response instead of the network, so that only the SDK's own work is measured,
+with logging disabled, with DEBUG logging enabled and with structured request logging enabled.
+
+Usage: python benchmarks/bench_logging.py [requests]
+"""
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from requests import Response  # noqa: E402
+from requests.models import PreparedRequest  # noqa: E402
+
+from magnetsdk2.connection import Connection  # noqa: E402
+from magnetsdk2.jsonlog import JSONFormatter, RequestLogger  # noqa: E402
+
+_ENDPOINT = 'https://api.niddel.com/v2/'
+
+
+class _CannedSession(object):
+    """Stands in for requests.Session, answering every request with the same small response."""
+
+    def request(self, method, url, params=None, json=None, **kwargs):
+        request = PreparedRequest()
+        request.prepare(method=method, url=url, params=params, json=json)
+        response = Response()
+        response.status_code = 200
+        response._content = b'{"id": "00000000-0000-0000-0000-000000000001"}'
+        response.request = request
+        response.url = request.url
+        response.elapsed = _ZERO
+        return response
+
+    def close(self):
+        pass
+
+
+class _Zero(object):
+    def total_seconds(self):
+        return 0.0
+
+
+_ZERO = _Zero()
+
+
+def _connection():
+    conn = Connection(profile=None, api_key='secret', endpoint=_ENDPOINT)
+    conn._session = _CannedSession()
+    return conn
+
+
+def _time_requests(conn, n):
+    start = time.time()
+    for _ in range(n):
+        conn._request('GET', 'organizations/00000000-0000-0000-0000-000000000001')
+    return (time.time() - start) / n * 1e6
+
+
+def run(n=20000):
+    """Runs the benchmark.
+    :param n: number of requests performed in each scenario
+    :return: a dict with the mean microseconds per request of each scenario
+    """
+    logger = logging.getLogger('magnetsdk2')
+    level, propagate, handlers = logger.level, logger.propagate, logger.handlers
+    handler = logging.StreamHandler(open(os.devnull, 'w'))
+    handler.setFormatter(JSONFormatter())
+    logger.handlers, logger.propagate = [handler], False
+    results = {}
+    try:
+        conn = _connection()
+        logger.setLevel(logging.INFO)
+        results['baseline'] = _time_requests(conn, n)
+        logger.setLevel(logging.DEBUG)
+        results['debug'] = _time_requests(conn, n)
+
+        logger.setLevel(logging.WARNING)
+        conn.add_observer(RequestLogger())
+        results['json_disabled'] = _time_requests(conn, n)
+        logger.setLevel(logging.INFO)
+        results['json'] = _time_requests(conn, n)
+    finally:
+        logger.handlers, logger.propagate = handlers, propagate
+        logger.setLevel(level)
+        handler.stream.close()
+    return results
+
+
+if __name__ == '__main__':
+    for name, value in sorted(run(*[int(x) for x in sys.argv[1:2]]).items()):
+        print('%-14s %8.1f us/request' % (name, value))
@@ -0,0 +1,277 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite measuring the throughput in alerts per second and the peak memory usage of the
+main alert processing paths of magnetsdk2, at several dataset sizes, against a stub API server
+running in a separate process so that its own work is not measured.
+
+Each benchmark is run twice: once to measure time, and once with tracemalloc enabled to measure
+the peak memory allocated by Python while it runs, since tracing slows it down. Results are saved
+as JSON, and can be compared with the results of a previous run to find regressions.
+
+Usage: python benchmarks/suite.py [--sizes 10000,100000,1000000] [--only NAME,...]
+                                  [--output results.json] [--compare previous.json]
+"""
+from __future__ import print_function
+
+import argparse
+import gc
+import io
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from argparse import Namespace
+from datetime import datetime
+from itertools import cycle, islice
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from magnetsdk2 import __version__  # noqa: E402
+from magnetsdk2.cef import convert_alert, convert_alerts  # noqa: E402
+from magnetsdk2.cli import command_alerts  # noqa: E402
+from magnetsdk2.connection import Connection  # noqa: E402
+from magnetsdk2.iterator import FilePersistentAlertIterator  # noqa: E402
+from magnetsdk2.testing import Dataset, StubServer  # noqa: E402
+from magnetsdk2.validation import is_valid_uuid, parse_date  # noqa: E402
+
+SIZES = (10000, 100000, 1000000)
+
+# number of distinct alerts cycled through by the benchmarks that do not use the stub server
+_POOL_SIZE = 1000
+
+
+class _CountingSink(object):
+    """A file-like object that discards what is written to it, counting the records written as
+    the number of line separators, since each record is followed by one."""
+
+    def __init__(self):
+        self.records = 0
+
+    def write(self, data):
+        if data == os.linesep:
+            self.records += 1
+
+    def flush(self):
+        pass
+
+
+def _serve(dataset, pipe):
+    server = StubServer(dataset).start()
+    pipe.send((server.endpoint, server.api_key))
+    server.serve_forever()
+
+
+class _Environment(object):
+    """A stub server with one organization that has a given number of alerts, running in a child
+    process, and connections to it."""
+
+    def __init__(self, size):
+        self.dataset = Dataset(organizations=1, alerts=size, dates=10)
+        self.organization_id = self.dataset.organizations[0]['id']
+        parent, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(self.dataset, child))
+        self._process.daemon = True
+        self._process.start()
+        self.endpoint, self.api_key = parent.recv()
+        self.pool = [self.dataset.alert(0, i) for i in range(min(size, _POOL_SIZE))]
+
+    def connection(self):
+        return Connection(profile=None, api_key=self.api_key, endpoint=self.endpoint)
+
+    def alerts(self, n):
+        """Returns an iterator over n alerts cycled from a pool, so that they cost no time or
+        memory to produce."""
+        return islice(cycle(self.pool), n)
+
+    def close(self):
+        self._process.terminate()
+        self._process.join()
+
+
+def bench_iter_organization_alerts(env, n):
+    conn = env.connection()
+    count = sum(1 for _ in conn.iter_organization_alerts(env.organization_id))
+    conn.close()
+    return count
+
+
+def bench_iter_organization_alerts_stream(env, n):
+    conn = env.connection()
+    count = sum(1 for _ in conn.iter_organization_alerts(env.organization_id, stream=True))
+    conn.close()
+    return count
+
+
+def bench_file_persistent_iterator(env, n):
+    conn = env.connection()
+    fd, filename = tempfile.mkstemp(suffix='.json')
+    os.close(fd)
+    os.remove(filename)
+    try:
+        iterator = FilePersistentAlertIterator(filename, conn, env.organization_id)
+        count = sum(1 for _ in iterator)
+        iterator.save()
+    finally:
+        if os.path.exists(filename):
+            os.remove(filename)
+        conn.close()
+    return count
+
+
+def bench_cef_convert_alert(env, n):
+    out = io.BytesIO()
+    count = 0
+    for alert in env.alerts(n):
+        convert_alert(out, alert, env.organization_id)
+        count += 1
+        if out.tell() > 1 << 20:
+            out.seek(0)
+            out.truncate()
+    return count
+
+
+def bench_cef_convert_alerts(env, n):
+    with io.open(os.devnull, 'wb') as out:
+        return convert_alerts(out, env.alerts(n), env.organization_id)
+
+
+def bench_command_alerts_json(env, n):
+    conn = env.connection()
+    outfile = _CountingSink()
+    args = Namespace(organization=env.organization_id, persist=None, backfill=None,
+                     start=None, format='json', indent=None, outfile=outfile)
+    command_alerts(conn, args)
+    conn.close()
+    return outfile.records
+
+
+def bench_is_valid_uuid(env, n):
+    ids = [x['id'] for x in env.pool]
+    return sum(1 for x in islice(cycle(ids), n) if is_valid_uuid(x))
+
+
+def bench_parse_date(env, n):
+    dates = [x['createdAt'] for x in env.pool]
+    return sum(1 for x in islice(cycle(dates), n) if parse_date(x))
+
+
+BENCHMARKS = [
+    ('iter_organization_alerts', bench_iter_organization_alerts),
+    ('iter_organization_alerts_stream', bench_iter_organization_alerts_stream),
+    ('file_persistent_iterator', bench_file_persistent_iterator),
+    ('cef_convert_alert', bench_cef_convert_alert),
+    ('cef_convert_alerts', bench_cef_convert_alerts),
+    ('command_alerts_json', bench_command_alerts_json),
+    ('is_valid_uuid', bench_is_valid_uuid),
+    ('parse_date', bench_parse_date),
+]
+
+
+def _measure(func, env, n, memory):
+    gc.collect()
+    start = time.time()
+    count = func(env, n)
+    seconds = time.time() - start
+    if count != n:
+        raise AssertionError('expected %d alerts, got %d' % (n, count))
+    result = {'alerts': n, 'seconds': round(seconds, 4),
+              'alerts_per_second': round(n / seconds, 1) if seconds else None,
+              'peak_memory_bytes': None}
+    if memory and tracemalloc is not None:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            func(env, n)
+            result['peak_memory_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result
+
+
+def run(sizes=SIZES, only=None, memory=True, log=None):
+    """Runs the benchmark suite.
+    :param sizes: numbers of alerts to run each benchmark with
+    :param only: optional names of the benchmarks to run
+    :param memory: whether to measure peak memory usage
+    :param log: optional callable that receives a line of text as each benchmark finishes
+    :return: a dict with details of the environment and a list of 'results'
+    """
+    benchmarks = [(name, func) for name, func in BENCHMARKS if not only or name in only]
+    results = []
+    for size in sizes:
+        env = _Environment(size)
+        try:
+            for name, func in benchmarks:
+                result = _measure(func, env, size, memory)
+                result['benchmark'] = name
+                results.append(result)
+                if log is not None:
+                    log(_format(result))
+        finally:
+            env.close()
+    return {
+        'version': __version__,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'timestamp': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'results': results
+    }
+
+
+def _format(result, baseline=None):
+    memory = result['peak_memory_bytes']
+    line = '%-32s %9d alerts %12.1f alerts/s %10s' % (
+        result['benchmark'], result['alerts'], result['alerts_per_second'] or 0,
+        '%.1fMiB' % (memory / 1048576.0) if memory is not None else '-')
+    if baseline and baseline.get('alerts_per_second') and result['alerts_per_second']:
+        line += ' %+7.1f%% speed' % (
+            (result['alerts_per_second'] / baseline['alerts_per_second'] - 1) * 100)
+        if memory is not None and baseline.get('peak_memory_bytes'):
+            line += ' %+7.1f%% memory' % ((float(memory) / baseline['peak_memory_bytes'] - 1) * 100)
+    return line
+
+
+def compare(current, previous):
+    """Compares two sets of results of the suite.
+    :return: a list of lines of text with the change in speed and memory of each benchmark"""
+    baseline = dict(((x['benchmark'], x['alerts']), x) for x in previous['results'])
+    lines = ['compared with version %s (%s):' % (previous['version'], previous['timestamp'])]
+    for result in current['results']:
+        lines.append(_format(result, baseline.get((result['benchmark'], result['alerts']))))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the magnetsdk2 benchmark suite')
+    parser.add_argument('--sizes', default=','.join(str(x) for x in SIZES),
+                        help='comma-separated numbers of alerts to run benchmarks with')
+    parser.add_argument('--only', help='comma-separated names of the benchmarks to run, out of ' +
+                                       ', '.join(x[0] for x in BENCHMARKS))
+    parser.add_argument('--no-memory', action='store_true',
+                        help='do not measure peak memory, which requires a second run')
+    parser.add_argument('--output', default='benchmark-results.json',
+                        help='file to save the results to as JSON')
+    parser.add_argument('--compare', help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    only = args.only.split(',') if args.only else None
+    results = run([int(x) for x in args.sizes.split(',')], only, not args.no_memory, print)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            for line in compare(results, json.load(f)):
+                print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements the AsyncConnection class, which allows using the Niddel Magnet v2 API from
+asyncio code without blocking the event loop. Requires Python 3.6 or newer.
+
+Requests are still performed by a regular magnetsdk2.Connection, so configuration profiles,
+certificate pinning and proxy settings behave exactly the same, but each blocking HTTP exchange
+runs on a worker thread while the calling coroutine awaits its result.
+"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from magnetsdk2.connection import Connection, _initial_page_size
+
+_MAX_IN_FLIGHT = 10
+
+# get_event_loop is deprecated inside coroutines from Python 3.7, which added get_running_loop
+_get_running_loop = getattr(asyncio, 'get_running_loop', asyncio.get_event_loop)
+
+
+class AsyncConnection(object):
+    """ This class offers coroutine and async generator versions of the Connection methods. The
+    number of requests in flight at any given time is capped per instance.
+    """
+
+    def __init__(self, profile='default', api_key=None, endpoint=None,
+                 max_in_flight=_MAX_IN_FLIGHT, **kwargs):
+        """ Initializes the connection with the proper configuration data.
+        :param profile: the profile name to use in ~/.magnetsdk/config
+        :param api_key: if provided, this API key is used instead of the one on the
+        configuration file
+        :param endpoint: if provided this endpoint URL is used instead of the one on the
+        configuration file
+        :param max_in_flight: maximum number of concurrent requests performed by this connection
+        :param kwargs: additional keyword arguments passed on to magnetsdk2.Connection
+        """
+        if not isinstance(max_in_flight, int) or max_in_flight < 1:
+            raise ValueError("maximum number of requests in flight must be a positive integer")
+        kwargs.setdefault('pool_size', max_in_flight)
+        self._connection = Connection(profile=profile, api_key=api_key, endpoint=endpoint,
+                                      **kwargs)
+        self.max_in_flight = max_in_flight
+        self._executor = None
+        self._semaphore = None
+
+    @property
+    def connection(self):
+        """The underlying magnetsdk2.Connection used to perform requests."""
+        return self._connection
+
+    @property
+    def endpoint(self):
+        return self._connection.endpoint
+
+    @property
+    def api_key(self):
+        return self._connection.api_key
+
+    @property
+    def verify(self):
+        return self._connection.verify
+
+    def set_proxy(self, *args, **kwargs):
+        """Configure this connection to use an HTTPS proxy, see Connection.set_proxy."""
+        return self._connection.set_proxy(*args, **kwargs)
+
+    def set_proxy_url(self, proxy_url):
+        """Configure this connection to use an HTTPS proxy URL, see Connection.set_proxy_url."""
+        self._connection.set_proxy_url(proxy_url)
+
+    def clear_proxy(self):
+        """Removes the existing proxy configuration."""
+        self._connection.clear_proxy()
+
+    def pool_stats(self):
+        """Summarizes the state of the HTTP connection pools, see Connection.pool_stats."""
+        return self._connection.pool_stats()
+
+    async def close(self):
+        """ Closes the AsyncConnection object, waiting for requests in flight to finish.
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            await _get_running_loop().run_in_executor(None, executor.shutdown)
+        self._semaphore = None
+        self._connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def throttle_stats(self):
+        """Summarizes the time spent waiting for the rate limiter, see
+        Connection.throttle_stats."""
+        return self._connection.throttle_stats()
+
+    def add_observer(self, observer):
+        """Registers a callable that receives a RequestEvent after every request, see
+        Connection.add_observer. Observers are called on the executor's threads."""
+        self._connection.add_observer(observer)
+
+    def remove_observer(self, observer):
+        """Unregisters a callable previously registered with add_observer."""
+        self._connection.remove_observer(observer)
+
+    async def _run(self, func, *args, **kwargs):
+        """ Runs a blocking call on a worker thread, respecting the maximum number of requests in
+        flight. If the connection has a rate limiter, waits on the event loop until a token is
+        available so that worker threads are not parked sleeping.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            limiter = self._connection.rate_limiter
+            if limiter is not None:
+                delay = limiter.wait_time()
+                while delay > 0:
+                    await asyncio.sleep(delay)
+                    delay = limiter.wait_time()
+            return await _get_running_loop().run_in_executor(
+                self._executor, functools.partial(func, *args, **kwargs))
+
+    async def _iter_pages(self, path, params=None, page_size=None):
+        """ Async generator version of Connection._iter_pages, using a fixed page size.
+        """
+        size = _initial_page_size(self._connection._effective_page_size(page_size))
+        params = dict(params or {})
+        params['page'] = 1
+        params['size'] = size
+        while True:
+            page = await self._run(self._connection._get_page, path, dict(params))
+            if page is None:
+                return
+            for item in page:
+                yield item
+            if len(page) < size:
+                return
+            params['page'] += 1
+
+    def iter_organizations(self, page_size=None):
+        """ Async generator that allows iteration over all of the organizations that this
+        connections's API key has access to.
+        :param page_size: number of organizations per page, defaults to the connection's
+        :return: an async iterator over the decoded JSON objects that represent organizations.
+        """
+        return self._iter_pages('organizations', page_size=page_size)
+
+    async def get_organization(self, organization_id):
+        """ Retrieves detailed data from an organization, see Connection.get_organization.
+        """
+        return await self._run(self._connection.get_organization, organization_id)
+
+    async def get_organization_credentials(self, organization_id, cache=True):
+        """ Retrieves a set of temporary AWS credentials to allow access to an organization's
+        S3 bucket, see Connection.get_organization_credentials.
+        """
+        return await self._run(self._connection.get_organization_credentials, organization_id,
+                               cache=cache)
+
+    def iter_organization_alerts(self, organization_id, fromDate=None, toDate=None,
+                                 sortBy="logDate", status=None, page_size=None):
+        """ Async generator that allows iteration over an organization's alerts, with optional
+        filters. See Connection.iter_organization_alerts for a description of the parameters.
+        :return: an async iterator over the decoded JSON objects that represent alerts.
+        """
+        path, params = self._connection._organization_alerts_query(organization_id, fromDate,
+                                                                   toDate, sortBy, status)
+        return self._iter_pages(path, params, page_size)
+
+    async def list_organization_alert_dates(self, organization_id, sortBy="logDate"):
+        """ Lists all log or batch dates for which alerts exist on the organization, see
+        Connection.list_organization_alert_dates.
+        """
+        return await self._run(self._connection.list_organization_alert_dates, organization_id,
+                               sortBy)
+
+    async def poll_organization_alert_dates(self, organization_id, sortBy="logDate", etag=None):
+        """ Lists all log or batch dates for which alerts exist on the organization unless they
+        haven't changed, see Connection.poll_organization_alert_dates.
+        """
+        return await self._run(self._connection.poll_organization_alert_dates, organization_id,
+                               sortBy, etag)
+
+    async def get_me(self):
+        """Queries the API about the user that owns the API key in use.
+        :return: a dict representing the user details
+        """
+        return await self._run(self._connection.get_me)
+
+    async def list_organization_whitelists(self, organization_id):
+        """
+        Lists the white list entries of an organization.
+        :param organization_id: the organization ID
+        :return: a list of dicts representing white list entries
+        """
+        return await self._run(self._connection.list_organization_whitelists, organization_id)
+
+    async def list_organization_blacklists(self, organization_id):
+        """
+        Lists the black list entries of an organization.
+        :param organization_id: the organization ID
+        :return: a list of dicts representing black list entries
+        """
+        return await self._run(self._connection.list_organization_blacklists, organization_id)
+
+    async def get_organization_whitelists(self, organization_id, id):
+        """
+        Retrieves the details of a the white list entry.
+        :param organization_id: the organization ID
+        :param id: the white list entry ID
+        :return: a dict representing a white list entry
+        """
+        return await self._run(self._connection.get_organization_whitelists, organization_id, id)
+
+    async def get_organization_blacklists(self, organization_id, id):
+        """
+        Retrieves the details of a the black list entry.
+        :param organization_id: the organization ID
+        :param id: the black list entry ID
+        :return: a dict representing a black list entry
+        """
+        return await self._run(self._connection.get_organization_blacklists, organization_id, id)
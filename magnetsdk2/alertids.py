@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements a compact set of alert IDs, which persistent alert iterators use to track
+the alerts of the latest batch date that were already processed. IDs are kept as 128-bit integers
+split in two sorted arrays of 64-bit halves, which take 16 bytes per ID instead of the ~130 bytes
+of a string in a set, and the set has a binary encoding that is much faster to load and save than
+a JSON list of strings.
+"""
+from __future__ import absolute_import
+
+import math
+import random
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+from itertools import chain
+from uuid import UUID
+
+import six
+from six.moves import zip
+
+from magnetsdk2.validation import UUID_MATCH
+
+try:
+    from collections.abc import MutableSet
+except ImportError:
+    from collections import MutableSet
+
+_MASK = (1 << 64) - 1
+_LN2 = math.log(2)
+
+# header of the binary encoding: magic, version and number of IDs
+_HEADER = struct.Struct('<4sBQ')
+_MAGIC = b'MAID'
+_VERSION = 1
+
+# array type code of unsigned 64-bit integers, which Python 2 only has as 'L' on some platforms
+if 'Q' in getattr(array, 'typecodes', ''):
+    _TYPECODE = 'Q'
+elif array('L').itemsize == 8:
+    _TYPECODE = 'L'
+else:
+    _TYPECODE = None
+
+
+def _array(values=()):
+    if _TYPECODE is None:
+        return list(values)
+    return array(_TYPECODE, values)
+
+
+def _to_bytes(values):
+    if _TYPECODE is None:
+        return struct.pack('<%dQ' % len(values), *values)
+    if sys.byteorder != 'little':
+        values = array(_TYPECODE, values)
+        values.byteswap()
+    return values.tostring() if six.PY2 else values.tobytes()
+
+
+def _from_bytes(data):
+    if _TYPECODE is None:
+        return list(struct.unpack('<%dQ' % (len(data) // 8), data))
+    values = array(_TYPECODE)
+    if six.PY2:
+        values.fromstring(data)
+    else:
+        values.frombytes(data)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    return values
+
+
+def alert_id_to_int(value):
+    """Converts an alert ID to a 128-bit integer.
+    :param value: a string in UUID format or a uuid.UUID instance
+    :return: an integer, or None if value is not a valid alert ID
+    """
+    if isinstance(value, six.string_types):
+        if UUID_MATCH(value) is None:
+            return None
+        return int(value.replace('-', ''), 16)
+    if isinstance(value, UUID):
+        return value.int
+    return None
+
+
+def int_to_alert_id(value):
+    """Converts a 128-bit integer to an alert ID string in canonical lowercase UUID format."""
+    h = '%032x' % value
+    return '%s-%s-%s-%s-%s' % (h[:8], h[8:12], h[12:16], h[16:20], h[20:])
+
+
+class _BloomFilter(object):
+    """Pattern-blocked Bloom filter over 128-bit integers: the bits of an ID are set in a single
+    64-bit word, following one of a table of precomputed patterns, so that adding and testing one
+    take a few integer operations instead of a loop over hash functions. IDs are assumed to be
+    random enough to pick the word and pattern from their own bits, as UUIDs are."""
+
+    def __init__(self, capacity, error_rate):
+        # optimal number of bits and bits per ID for the capacity and false positive rate
+        bits = max(64, int(-capacity * math.log(error_rate) / (_LN2 * _LN2)))
+        hashes = max(1, min(16, int(round(bits / float(capacity) * _LN2))))
+        self.patterns = _patterns(hashes)
+        self.words = _array([0]) * ((bits + 63) // 64)
+
+    def add(self, value):
+        self.words[(value >> 64) % len(self.words)] |= self.patterns[value & _PATTERN_MASK]
+
+    def __contains__(self, value):
+        pattern = self.patterns[value & _PATTERN_MASK]
+        return self.words[(value >> 64) % len(self.words)] & pattern == pattern
+
+    def clear(self):
+        self.words = _array([0]) * len(self.words)
+
+
+# number of patterns of Bloom filter bits, minus one
+_PATTERN_MASK = 4095
+
+_PATTERNS = {}
+
+
+def _patterns(hashes):
+    """Returns a table of patterns of a number of bits set in a 64-bit word, generated once."""
+    if hashes not in _PATTERNS:
+        generator = random.Random(hashes)
+        _PATTERNS[hashes] = _array(sum(1 << x for x in generator.sample(range(64), hashes))
+                                   for _ in range(_PATTERN_MASK + 1))
+    return _PATTERNS[hashes]
+
+
+class AlertIdSet(MutableSet):
+    """Mutable set of alert IDs, stored as sorted arrays of the high and low 64 bits of each UUID
+    plus a small set of recently added ones, which is merged into the arrays as it grows. Accepts
+    strings in UUID format and uuid.UUID instances, and iterates over canonical lowercase strings
+    in no particular order. Membership tests on invalid IDs return False, while adding one raises
+    ValueError.
+
+    A Bloom filter sized for bloom_capacity IDs can be kept to rule out most IDs that are not in
+    the set without searching the arrays, which pays off when most tested IDs are new."""
+
+    def __init__(self, alert_ids=(), bloom_capacity=None, bloom_error_rate=0.01):
+        """Initializes an alert ID set.
+        :param alert_ids: optional iterable with the initial alert IDs
+        :param bloom_capacity: if provided, a Bloom filter is kept that has a false positive
+        rate of bloom_error_rate with up to this number of IDs
+        :param bloom_error_rate: false positive rate of the Bloom filter, between 0 and 1
+        """
+        if bloom_capacity is not None:
+            if bloom_capacity < 1:
+                raise ValueError('bloom_capacity must be positive')
+            if not 0 < bloom_error_rate < 1:
+                raise ValueError('bloom_error_rate must be between 0 and 1')
+            self._bloom = _BloomFilter(bloom_capacity, bloom_error_rate)
+        else:
+            self._bloom = None
+        self._hi = _array()
+        self._lo = _array()
+        self._pending = set()
+        values = []
+        for alert_id in alert_ids:
+            value = alert_id_to_int(alert_id)
+            if value is None:
+                raise ValueError('invalid alert ID: %r' % (alert_id,))
+            values.append(value)
+        self._store(sorted(set(values)))
+
+    def _store(self, values):
+        """Replaces the arrays with a sorted list of distinct integers."""
+        self._hi = _array(x >> 64 for x in values)
+        self._lo = _array(x & _MASK for x in values)
+        if self._bloom is not None:
+            for value in values:
+                self._bloom.add(value)
+
+    def _merge(self):
+        """Merges the recently added IDs into the arrays. The arrays are an already sorted run,
+        which sorted only needs linear time to merge the others into."""
+        if not self._pending:
+            return
+        values = sorted(chain(self._ints(), self._pending))
+        self._pending = set()
+        self._hi = _array(x >> 64 for x in values)
+        self._lo = _array(x & _MASK for x in values)
+
+    def _ints(self):
+        return ((h << 64) | l for h, l in zip(self._hi, self._lo))
+
+    def _find(self, value):
+        """Returns the index of an integer in the arrays, or -1 if it isn't there."""
+        hi, lo = value >> 64, value & _MASK
+        i = bisect_left(self._hi, hi)
+        n = len(self._hi)
+        while i < n and self._hi[i] == hi:
+            if self._lo[i] == lo:
+                return i
+            i += 1
+        return -1
+
+    def _contains_int(self, value):
+        if self._bloom is not None and value not in self._bloom:
+            return False
+        if value in self._pending:
+            return True
+        # inlined fast path of _find, as IDs with the same high half are very unlikely
+        hi_values = self._hi
+        hi = value >> 64
+        i = bisect_left(hi_values, hi)
+        if i == len(hi_values) or hi_values[i] != hi:
+            return False
+        return self._lo[i] == value & _MASK or self._find(value) >= 0
+
+    def __contains__(self, alert_id):
+        value = alert_id_to_int(alert_id)
+        return value is not None and self._contains_int(value)
+
+    def __len__(self):
+        return len(self._hi) + len(self._pending)
+
+    def __iter__(self):
+        for value in chain(self._ints(), list(self._pending)):
+            yield int_to_alert_id(value)
+
+    def add(self, alert_id):
+        value = alert_id_to_int(alert_id)
+        if value is None:
+            raise ValueError('invalid alert ID: %r' % (alert_id,))
+        if self._contains_int(value):
+            return
+        self._pending.add(value)
+        if self._bloom is not None:
+            self._bloom.add(value)
+        if len(self._pending) > max(1024, len(self._hi) >> 4):
+            self._merge()
+
+    def discard(self, alert_id):
+        value = alert_id_to_int(alert_id)
+        if value is None:
+            return
+        if value in self._pending:
+            self._pending.remove(value)
+            return
+        i = self._find(value)
+        if i >= 0:
+            del self._hi[i]
+            del self._lo[i]
+            # the Bloom filter can't forget IDs, so it is rebuilt from the remaining ones
+            if self._bloom is not None:
+                self._bloom.clear()
+                for x in chain(self._ints(), self._pending):
+                    self._bloom.add(x)
+
+    def clear(self):
+        self._hi = _array()
+        self._lo = _array()
+        self._pending = set()
+        if self._bloom is not None:
+            self._bloom.clear()
+
+    def to_bytes(self):
+        """Encodes the set in a binary format: a header with the number of IDs, followed by the
+        sorted high halves and then the low halves of the IDs, as little-endian 64-bit
+        integers.
+        :return: a bytes object
+        """
+        self._merge()
+        return _HEADER.pack(_MAGIC, _VERSION, len(self._hi)) + _to_bytes(self._hi) \
+            + _to_bytes(self._lo)
+
+    @classmethod
+    def from_bytes(cls, data, **kwargs):
+        """Decodes a set encoded with to_bytes.
+        :param data: a bytes object
+        :param kwargs: other parameters of the AlertIdSet constructor
+        :return: an AlertIdSet instance
+        """
+        if len(data) < _HEADER.size:
+            raise ValueError('truncated alert ID set')
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError('unsupported alert ID set encoding')
+        if len(data) != _HEADER.size + count * 16:
+            raise ValueError('truncated alert ID set')
+        middle = _HEADER.size + count * 8
+        result = cls(**kwargs)
+        result._hi = _from_bytes(data[_HEADER.size:middle])
+        result._lo = _from_bytes(data[middle:])
+        if result._bloom is not None:
+            for value in result._ints():
+                result._bloom.add(value)
+        return result
+
+    def __repr__(self):
+        return '%s(%d IDs)' % (self.__class__.__name__, len(self))
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements a resumable backfill of an organization's historical alerts, which splits
+a date range into partitions that are fetched in parallel and records completed partitions in a
+checkpoint file, so that an interrupted run can resume where it stopped.
+"""
+import datetime
+import json
+import logging
+
+import six
+
+from magnetsdk2.files import write_json
+from magnetsdk2.validation import is_valid_uuid, is_valid_alert_sortBy, parse_date
+
+
+def _to_date(value):
+    return datetime.datetime.strptime(value, '%Y-%m-%d').date()
+
+
+class Backfill(object):
+    """Iterable over all alerts of an organization between two dates. Alerts are yielded in the
+    order partitions complete, all alerts of a partition together. A partition is only recorded as
+    completed once the consumer asks for the alert following its last one, so an interrupted run
+    never skips alerts, though it may repeat those of partitions that were in progress."""
+
+    def __init__(self, connection, organization_id, from_date, to_date, workers=4, days=1,
+                 checkpoint=None, sortBy='batchDate', page_size=None, before_checkpoint=None):
+        """Initializes a backfill.
+        :param connection: the magnetsdk2.Connection to use
+        :param organization_id: string with the UUID-style unique ID of the organization
+        :param from_date: first date of the range, inclusive
+        :param to_date: last date of the range, inclusive
+        :param workers: number of partitions fetched in parallel
+        :param days: number of days in each partition
+        :param checkpoint: optional name of the JSON file that records completed partitions
+        :param sortBy: one of 'logDate' or 'batchDate', controls which date field the range
+        applies to
+        :param page_size: number of alerts per page, defaults to the connection's page size
+        :param before_checkpoint: optional callable invoked before each partition is recorded as
+        completed, e.g. to flush output
+        """
+        organization_id = str(organization_id)
+        if not is_valid_uuid(organization_id):
+            raise ValueError("organization id should be a string in UUID format")
+        if not is_valid_alert_sortBy(sortBy):
+            raise ValueError("sortBy must be either 'logDate' or 'batchDate'")
+        for name, value in (('workers', workers), ('days', days)):
+            if not isinstance(value, six.integer_types) or value < 1:
+                raise ValueError("%s must be a positive integer" % name)
+        self.connection = connection
+        self.organization_id = organization_id
+        self.from_date = parse_date(from_date)
+        self.to_date = parse_date(to_date)
+        if self.from_date > self.to_date:
+            raise ValueError("from date must not be after to date")
+        self.workers = workers
+        self.days = days
+        self.checkpoint = checkpoint
+        self.sortBy = sortBy
+        self.page_size = page_size
+        self.before_checkpoint = before_checkpoint
+        self.completed = set()
+        self._logger = logging.getLogger('magnetsdk2')
+        if checkpoint:
+            self._load_checkpoint()
+
+    def _settings(self):
+        return {'organization_id': self.organization_id, 'from_date': self.from_date,
+                'to_date': self.to_date, 'days': self.days, 'sortBy': self.sortBy}
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError):
+            return
+        if data.get('settings') != self._settings():
+            raise ValueError('checkpoint file %s belongs to a different backfill'
+                             % self.checkpoint)
+        self.completed = set(data['completed'])
+
+    def _save_checkpoint(self):
+        write_json(self.checkpoint, {'settings': self._settings(),
+                                     'completed': sorted(self.completed)}, fsync=True)
+
+    def partitions(self):
+        """Computes the partitions that contain alerts, using the organization's alert dates.
+        :return: a sorted list of (first date, last date) tuples in ISO 8601 format
+        """
+        start = _to_date(self.from_date)
+        end = _to_date(self.to_date)
+        partitions = set()
+        for d in self.connection.list_organization_alert_dates(self.organization_id,
+                                                               self.sortBy):
+            d = _to_date(parse_date(d))
+            if start <= d <= end:
+                first = start + datetime.timedelta(days=(d - start).days // self.days * self.days)
+                last = min(first + datetime.timedelta(days=self.days - 1), end)
+                partitions.add((first.isoformat(), last.isoformat()))
+        return sorted(partitions)
+
+    def _fetch(self, partition):
+        return list(self.connection.iter_organization_alerts(
+            self.organization_id, fromDate=partition[0], toDate=partition[1], sortBy=self.sortBy,
+            page_size=self.page_size))
+
+    def __iter__(self):
+        pending = [x for x in self.partitions() if x[0] not in self.completed]
+        self._logger.info('backfill of organization %s from %s to %s: %d partitions to fetch, '
+                          '%d already completed', self.organization_id, self.from_date,
+                          self.to_date, len(pending), len(self.completed))
+        pending.reverse()
+        # only imported when needed, to keep the CLI quick to start
+        from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        running = {}
+        try:
+            while pending or running:
+                # only keep as many partitions in memory as there are workers
+                while pending and len(running) < self.workers:
+                    partition = pending.pop()
+                    running[executor.submit(self._fetch, partition)] = partition
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    partition = running.pop(future)
+                    for alert in future.result():
+                        yield alert
+                    if self.before_checkpoint is not None:
+                        self.before_checkpoint()
+                    self.completed.add(partition[0])
+                    if self.checkpoint:
+                        self._save_checkpoint()
+                    self._logger.debug('backfill partition %s to %s completed', *partition)
+        finally:
+            for future in running:
+                future.cancel()
+            executor.shutdown(wait=False)
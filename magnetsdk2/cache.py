@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements optional caches for magnetsdk2.Connection.
+
+HTTPCache stores responses to slow-changing resources along with their ETag / Last-Modified
+validators, serves them directly while their time-to-live has not expired, and revalidates them
+with conditional requests afterwards, so that unchanged resources cost a 304 response with an
+empty body.
+
+TTLCache memoizes decoded API objects such as organization details, and can be persisted to a
+file so that short-lived processes like the CLI share it.
+"""
+from __future__ import absolute_import
+
+import atexit
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+import six
+from requests import Request, Response
+from requests.structures import CaseInsensitiveDict
+from six.moves.urllib.parse import urlencode
+
+from magnetsdk2.files import write_json
+
+_CACHE_DIR = os.path.join(os.path.expanduser('~/.magnetsdk'), 'cache')
+_STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# time-to-live in seconds of the resources cached by default, with 0 meaning cached responses are
+# always revalidated before being used
+DEFAULT_TTLS = {
+    'me': 300,
+    'organizations/{id}': 300,
+    'organizations/{id}/whitelists': 60,
+    'organizations/{id}/blacklists': 60,
+    'organizations/{id}/alerts/dates': 0
+}
+
+
+def cache_filename(api_key, name, directory=_CACHE_DIR):
+    """Builds the name of a cache file specific to an API key, without exposing the key itself.
+    :param api_key: string containing the API key
+    :param name: string identifying the kind of data in the file
+    :param directory: the directory the file should be in
+    :return: the file name
+    """
+    digest = hashlib.sha256(api_key.encode('UTF-8')).hexdigest()[:16]
+    return os.path.join(directory, '%s-%s.json' % (name, digest))
+
+
+class MemoryCacheBackend(object):
+    """Thread-safe in-memory cache storage that evicts the least recently used entries."""
+
+    def __init__(self, max_entries=256):
+        """Initializes an empty in-memory cache.
+        :param max_entries: maximum number of entries to keep
+        """
+        if not isinstance(max_entries, six.integer_types) or max_entries < 1:
+            raise ValueError("maximum number of entries must be a positive integer")
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self._entries[key] = entry
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = entry
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCacheBackend(object):
+    """Cache storage that keeps each entry as a JSON file in a directory, so that it can be shared
+    by multiple processes. Files are replaced atomically, so readers never see partial entries."""
+
+    def __init__(self, directory=_CACHE_DIR):
+        """Initializes an on-disk cache.
+        :param directory: the directory to store entries in, created if needed
+        """
+        self.directory = directory
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._filename(key), 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def set(self, key, entry):
+        write_json(self._filename(key), entry)
+
+    def delete(self, key):
+        try:
+            os.remove(self._filename(key))
+        except OSError:
+            pass
+
+    def clear(self):
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.json'):
+                    self.delete(name[:-5])
+
+
+class HTTPCache(object):
+    """Decides which responses are cached and for how long, and keeps hit / miss counters. The
+    actual storage is delegated to a backend such as MemoryCacheBackend or FileCacheBackend."""
+
+    def __init__(self, backend=None, ttls=None, default_ttl=None):
+        """Initializes an HTTP cache.
+        :param backend: the storage backend to use, defaults to a MemoryCacheBackend
+        :param ttls: dict mapping path templates (e.g. 'organizations/{id}') to the number of
+        seconds their responses can be used without revalidation, defaults to DEFAULT_TTLS
+        :param default_ttl: time-to-live of paths not in ttls, which are not cached if None
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.default_ttl = default_ttl
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    def ttl(self, path_template):
+        """Returns the time-to-live of a path template, or None if it shouldn't be cached."""
+        return self.ttls.get(path_template, self.default_ttl)
+
+    @staticmethod
+    def key(api_key, url, params=None):
+        """Computes the cache key of a request, which depends on the API key in use since
+        different keys may see different data.
+        """
+        if params:
+            url += '?' + urlencode(sorted(params.items()), doseq=True)
+        return hashlib.sha256((api_key + '\n' + url).encode('UTF-8')).hexdigest()
+
+    def get(self, key):
+        return self.backend.get(key)
+
+    @staticmethod
+    def is_fresh(entry, ttl):
+        return ttl > 0 and time.time() - entry['stored_at'] < ttl
+
+    @staticmethod
+    def conditional_headers(entry):
+        """Builds the headers needed to revalidate a cached entry."""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def store(self, key, response, ttl):
+        """Stores a successful response, if it can be revalidated later or has a positive
+        time-to-live.
+        :return: True if the response was stored
+        """
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified or ttl > 0):
+            return False
+        self.backend.set(key, {
+            'url': response.url,
+            'status': response.status_code,
+            'headers': dict((k, response.headers[k]) for k in _STORED_HEADERS
+                            if k in response.headers),
+            'body': response.content.decode('UTF-8'),
+            'etag': etag,
+            'last_modified': last_modified,
+            'stored_at': time.time()
+        })
+        self._count('stores')
+        return True
+
+    def refresh(self, key, entry, response):
+        """Updates a cached entry after a 304 response confirmed it is still valid."""
+        entry = dict(entry)
+        entry['etag'] = response.headers.get('ETag', entry.get('etag'))
+        entry['last_modified'] = response.headers.get('Last-Modified', entry.get('last_modified'))
+        entry['stored_at'] = time.time()
+        self.backend.set(key, entry)
+        return entry
+
+    @staticmethod
+    def response(entry, method='GET'):
+        """Builds a requests.Response object out of a cached entry, with its from_cache attribute
+        set to True."""
+        response = Response()
+        response.status_code = entry['status']
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response.url = entry['url']
+        response.encoding = 'UTF-8'
+        response._content = entry['body'].encode('UTF-8')
+        response.request = Request(method, entry['url']).prepare()
+        response.from_cache = True
+        return response
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def record_hit(self):
+        self._count('hits')
+
+    def record_revalidation(self):
+        self._count('revalidations')
+
+    def record_miss(self):
+        self._count('misses')
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'hits': 0, 'revalidations': 0, 'misses': 0, 'stores': 0}
+
+    def stats(self):
+        """Returns a snapshot of the cache counters.
+        :return: a dict with the number of 'hits' served without a request, 'revalidations' that
+        got a 304 response, 'misses' that required a full response and 'stores'
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self):
+        self.backend.clear()
+
+
+def _save_at_exit(reference):
+    cache = reference()
+    if cache is not None:
+        cache.save()
+
+
+class TTLCache(object):
+    """Thread-safe memoization cache whose entries expire after a time-to-live, with least
+    recently used entries evicted once the maximum size is reached. If a file name is provided,
+    the cache is loaded from it on creation and saved to it by save(), close() or at exit if it
+    changed, so it survives across processes. Keys must be strings and values must be serializable
+    as JSON."""
+
+    def __init__(self, ttl=300, max_size=128, filename=None):
+        """Initializes the cache.
+        :param ttl: number of seconds entries remain valid
+        :param max_size: maximum number of entries to keep
+        :param filename: optional JSON file to persist the cache to
+        """
+        if ttl < 0:
+            raise ValueError("time-to-live must not be negative")
+        if not isinstance(max_size, six.integer_types) or max_size < 1:
+            raise ValueError("maximum size must be a positive integer")
+        self.ttl = ttl
+        self.max_size = max_size
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._dirty = False
+        if filename:
+            self._load()
+            atexit.register(_save_at_exit, weakref.ref(self))
+
+    def _load(self):
+        try:
+            with open(self.filename, 'r') as f:
+                entries = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        now = time.time()
+        for key, (stored_at, value) in sorted(entries.items(), key=lambda x: x[1][0]):
+            if now - stored_at < self.ttl:
+                self._entries[key] = (stored_at, value)
+        self._evict()
+
+    def _save(self):
+        if self.filename and self._dirty:
+            try:
+                write_json(self.filename, dict(self._entries))
+            except (IOError, OSError):
+                return
+            self._dirty = False
+
+    def save(self):
+        """Saves the cache to its file, if it has one and the cache changed since it was last
+        saved."""
+        with self._lock:
+            self._save()
+
+    def close(self):
+        """Saves the cache to its file, if needed."""
+        self.save()
+
+    def _evict(self):
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def get(self, key):
+        """Retrieves a value from the cache.
+        :return: the value, or None if it is missing or expired
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            if time.time() - entry[0] >= self.ttl:
+                self._dirty = True
+                return None
+            self._entries[key] = entry
+            return entry[1]
+
+    def set(self, key, value):
+        """Stores a value in the cache, evicting the least recently used entries if needed."""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time(), value)
+            self._evict()
+            self._dirty = True
+
+    def invalidate(self, key=None):
+        """Removes an entry from the cache, or all entries if no key is provided. The file is
+        saved right away, so other processes stop using the entries."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            elif self._entries.pop(key, None) is None:
+                return
+            self._dirty = True
+            self._save()
+
+    def __len__(self):
+        return len(self._entries)
@@ -3,11 +3,15 @@
 This module implements writing CEF format events.
 """
 
+from itertools import compress, islice
 from math import ceil, trunc
+from os import linesep
 
 import six
+from six.moves import map
 
 from magnetsdk2.time import seconds_from_UTC_epoch
+from magnetsdk2.validation import memoize
 
 
 def escape_header_entry(x):
@@ -73,18 +77,22 @@ def timestamp(ts):
     return '{0:d}'.format(trunc(seconds_from_UTC_epoch(ts) * 1000))
 
 
-def convert_alert(obj, alert, organization):
+def _severity(alert):
+    return max(ceil(alert['confidence'] / 10), 0)
+
+
+def _alert_header(severity):
+    return header(device_vendor='Niddel', device_product='Magnet', device_version='1.0',
+                  signature_id='infected_outbound',
+                  name='Potentially Infected or Compromised Endpoint', severity=severity)
+
+
+def _alert_fields(alert, organization, timestamp=timestamp):
     """
-    Converts a Niddel Magnet v2 API alert into an approximate CEF version 0 representation.
-    :param obj: file-like object in binary mode to write to
-    :param alert: dict containing a Niddel Magnet v2 API
-    :return: an str / bytes object containing a CEF event
+    Builds the CEF extension fields of a Niddel Magnet v2 API alert.
+    :param timestamp: function used to convert timestamps
+    :return: a dict with the fields, whose names are all in _ALERT_FIELD_NAMES
     """
-    obj.write(header(device_vendor='Niddel', device_product='Magnet', device_version='1.0',
-                     signature_id='infected_outbound',
-                     name='Potentially Infected or Compromised Endpoint',
-                     severity=max(ceil(alert['confidence'] / 10), 0)).encode('UTF-8'))
-
     ext = {
         'cs1': organization,
         'cs1Label': 'organizationId',
@@ -130,6 +138,118 @@ def convert_alert(obj, alert, organization):
         ext['cs5'] = alert['netSrcProcessId']
         ext['cs5Label'] = 'netSrcProcessId'
 
+    return ext
+
+
+def convert_alert(obj, alert, organization):
+    """
+    Converts a Niddel Magnet v2 API alert into an approximate CEF version 0 representation.
+    :param obj: file-like object in binary mode to write to
+    :param alert: dict containing a Niddel Magnet v2 API
+    :return: an str / bytes object containing a CEF event
+    """
+    obj.write(_alert_header(_severity(alert)).encode('UTF-8'))
+
     # merge header and extension
-    obj.write(extension(ext).encode('UTF-8'))
+    obj.write(extension(_alert_fields(alert, organization)).encode('UTF-8'))
+
+
+# names of all fields _alert_fields can return, in the order extension writes them
+_ALERT_FIELD_NAMES = sorted([
+    'cs1', 'cs1Label', 'cs2', 'cs2Label', 'start', 'end', 'externalId', 'cfp1', 'cfp1Label', 'cnt',
+    'shost', 'src', 'dst', 'dhost', 'dpt', 'proto', 'app', 'suid', 'deviceCustomDate1',
+    'deviceCustomDate1Label', 'deviceCustomDate2', 'deviceCustomDate2Label', 'deviceDirection',
+    'dtz', 'act', 'cs3', 'cs3Label', 'cs4', 'cs4Label', 'cs5', 'cs5Label'])
+
+# headers of the 11 possible alert severities
+_ALERT_HEADERS = dict((x, _alert_header(x)) for x in range(11))
+
+_ESCAPE_TABLE = {ord('\\'): u'\\\\', ord('='): u'\\=', ord('\n'): u'\\n', ord('\r'): u'\\r'}
+
+
+def _escape_value(x):
+    """Same as escape_extension_value, but escapes text in a single pass."""
+    if not isinstance(x, six.string_types):
+        x = x.__str__()
+    if isinstance(x, six.text_type):
+        return x.translate(_ESCAPE_TABLE).strip()
+    return escape_extension_value(x)
+
 
+@memoize(1024)
+def _extension_template(present):
+    """
+    Builds the templates for the CEF extension of alerts with a given set of fields.
+    :param present: tuple with a boolean for each name in _ALERT_FIELD_NAMES, True if the field
+    is included
+    :return: a tuple with the template of the extension, the template of the values surrounded
+    by NUL characters, and the number of NULs in the latter
+    """
+    names = list(compress(_ALERT_FIELD_NAMES, present))
+    return (' '.join([name + '=%s' for name in names]), '\x00%s' * len(names) + '\x00',
+            len(names) + 1)
+
+
+def _memoized(func, cache):
+    """Wraps a function of one argument so that its results are kept in a dict."""
+    def wrapper(x):
+        try:
+            return cache[x]
+        except KeyError:
+            value = cache[x] = func(x)
+            return value
+    return wrapper
+
+
+def convert_alerts(obj, alerts, organization, batch_size=1000, separator=linesep):
+    """
+    Converts Niddel Magnet v2 API alerts into CEF version 0 events, producing the same bytes as
+    calling convert_alert on each alert and writing separator after it, but faster: the possible
+    headers are built in advance, the extension is rendered from a template for the fields the
+    alert has, values are only escaped if a single check finds they need it, timestamps shared
+    by alerts of a batch are converted once, and each batch is written at once.
+    :param obj: file-like object in binary mode to write to
+    :param alerts: iterable of dicts containing Niddel Magnet v2 API alerts
+    :param organization: the ID of the organization the alerts belong to
+    :param batch_size: number of alerts encoded before each write
+    :param separator: string written after each event
+    :return: the number of alerts written
+    """
+    if not isinstance(batch_size, six.integer_types) or batch_size < 1:
+        raise ValueError('batch size must be a positive integer')
+    if isinstance(separator, bytes):
+        separator = separator.decode('UTF-8')
+    headers = _ALERT_HEADERS
+    field_names = _ALERT_FIELD_NAMES
+    timestamps = {}
+    convert_timestamp = _memoized(timestamp, timestamps)
+    alerts = iter(alerts)
+    count = 0
+    while True:
+        parts = []
+        timestamps.clear()
+        for alert in islice(alerts, batch_size):
+            severity = _severity(alert)
+            event_header = headers.get(severity)
+            if event_header is None:
+                # out of range, so that header raises the same error convert_alert would
+                event_header = _alert_header(severity)
+            fields = _alert_fields(alert, organization, convert_timestamp)
+            values = tuple(map(fields.get, field_names))
+            present = tuple(map(bool, values))
+            template, check_template, nuls = _extension_template(present)
+            values = tuple(compress(values, present))
+            # values are rendered between NULs first to check whether escape_extension_value
+            # could change any of them: by escaping it, or by trimming it, which is only possible
+            # if there is whitespace, that split finds the same way strip does
+            check = check_template % values
+            if u'\\' in check or u'=' in check or len(check.split()) != 1 \
+                    or check.count(u'\x00') != nuls:
+                values = tuple(map(_escape_value, values))
+            parts.append(event_header)
+            parts.append(template % values)
+            parts.append(separator)
+        if not parts:
+            return count
+        obj.write(u''.join(parts).encode('UTF-8'))
+        count += len(parts) // 3
@@ -16,13 +16,15 @@ from os.path import expanduser, join, basename, isfile
 from sys import stdout, stderr, exc_info
 from uuid import UUID
 
-import botocore
-import boto3
 import six
 
 from magnetsdk2 import Connection, __version__
+from magnetsdk2.backfill import Backfill
+from magnetsdk2.cache import TTLCache, cache_filename
 from magnetsdk2.cef import convert_alert
+from magnetsdk2.credentials import CredentialProvider
 from magnetsdk2.iterator import FilePersistentAlertIterator
+from magnetsdk2.jsonlog import JSONFormatter, RequestLogger, UTCFormatter
 from magnetsdk2.time import UTC
 from magnetsdk2.validation import parse_date
 
@@ -30,8 +32,8 @@ from magnetsdk2.validation import parse_date
 logger = logging.getLogger('magnetsdk2')
 handler = logging.StreamHandler(stderr)
 handler.setFormatter(
-    logging.Formatter('%(asctime)s pid=%(process)d %(module)s %(levelname)s %(message)s',
-                      '%Y-%m-%dT%H:%M:%S%z'))
+    UTCFormatter('%(asctime)s pid=%(process)d %(module)s %(levelname)s %(message)s',
+                 '%Y-%m-%dT%H:%M:%SZ'))
 logger.addHandler(handler)
 
 
@@ -50,6 +52,13 @@ def main():
     parser.add_argument("-o", "--outfile",
                         help="destination file to write to, if exists will be overwritten",
                         type=argparse.FileType('wb'), default=stdout)
+    parser.add_argument("--no-cache", help="do not use or update the local cache of " +
+                                           "organization details and credentials in " +
+                                           "~/.magnetsdk/cache",
+                        action="store_true", default=False)
+    parser.add_argument("--log-json", help="write log messages to stderr as JSON, including " +
+                                           "one message per API request",
+                        action="store_true", default=False)
     parser.set_defaults(indent=None, parser=parser, func=None)
     subparsers = parser.add_subparsers()
 
@@ -81,7 +90,29 @@ def main():
                                     "that haven't been seen before are part of the output")
     alerts_parser.add_argument("-f", "--format", choices=['json', 'cef'], default='json',
                                help="format in which to output alerts")
-    alerts_parser.set_defaults(func=command_alerts, start=None, persist=None, parser=alerts_parser)
+    alerts_parser.add_argument("--save-every", type=int, metavar='N',
+                               help="with --persist, also save the state after every N alerts")
+    alerts_parser.add_argument("--save-interval", type=float, metavar='SECONDS',
+                               help="with --persist, also save the state every SECONDS seconds")
+    alerts_parser.add_argument("--stream", action="store_true", default=False,
+                               help="with --persist, output alerts as each page is downloaded " +
+                                    "instead of loading all alerts of a batch date first")
+    alerts_parser.add_argument("--prefetch", type=int, default=0, metavar='N',
+                               help="with --persist, retrieve the alerts of the next N batch " +
+                                    "dates in the background")
+    alerts_parser.add_argument("--lock", action="store_true", default=False,
+                               help="with --persist, fail if another process holds a lock on " +
+                                    "the state file")
+    alerts_parser.add_argument("--backfill", nargs=2, metavar=('FROM', 'TO'), type=parse_arg_date,
+                               help="retrieve all alerts with batch dates between FROM and TO, " +
+                                    "inclusive, in YYYY-MM-DD format")
+    alerts_parser.add_argument("--workers", type=int, default=4,
+                               help="number of dates retrieved in parallel during a backfill")
+    alerts_parser.add_argument("--checkpoint",
+                               help="file to record the progress of a backfill, so that an " +
+                                    "interrupted backfill resumes where it stopped")
+    alerts_parser.set_defaults(func=command_alerts, start=None, persist=None, backfill=None,
+                               checkpoint=None, parser=alerts_parser)
 
     # "whitelists" and "blacklists" commands
     for scope in ('white', 'black',):
@@ -140,15 +171,27 @@ def main():
         logger.setLevel(logging.DEBUG)
     else:
         logger.setLevel(logging.INFO)
+    if args.log_json:
+        handler.setFormatter(JSONFormatter())
 
     # open connection and dispatch to proper function
     if args.func:
         try:
             conn = Connection(profile=args.profile)
+            # only load the caches used by the command
+            if not args.no_cache and args.func in (command_organizations, command_logs_list,
+                                                   command_logs_upload):
+                conn.organization_cache = TTLCache(
+                    filename=cache_filename(conn.api_key, 'organizations'))
+            if not args.no_cache and args.func in (command_logs_list, command_logs_upload):
+                conn.credential_provider = CredentialProvider(
+                    background=False, filename=cache_filename(conn.api_key, 'credentials'))
+            if args.log_json:
+                conn.add_observer(RequestLogger())
             args.func(conn, args)
         except Exception as e:
             logger.debug("exception caught in processing", exc_info=True)
-            args.parser.error(e.message)
+            args.parser.error(str(e))
         else:
             if args.outfile != stdout:
                 args.outfile.close()
@@ -175,6 +218,7 @@ def parse_glob_files(x):
 
 
 def boto3_object_exists(obj):
+    import botocore.exceptions
     try:
         obj.load()
         return True
@@ -208,12 +252,23 @@ def command_organizations(conn, args):
 def command_alerts(conn, args):
     if not args.organization:
         args.organization = UUID(conn.get_me()['defaultOrganizationId'])
-        logger.info('using default organization %s' % args.organization)
-
-    if args.persist:
+        logger.info('using default organization %s', args.organization)
+
+    if args.backfill:
+        if args.persist or args.start:
+            args.parser.error("--backfill cannot be combined with --persist or --start")
+        iterator = Backfill(conn, args.organization, args.backfill[0], args.backfill[1],
+                            workers=args.workers, checkpoint=args.checkpoint,
+                            before_checkpoint=args.outfile.flush)
+    elif args.persist:
         iterator = FilePersistentAlertIterator(filename=args.persist, connection=conn,
                                                organization_id=args.organization,
-                                               start_date=args.start)
+                                               start_date=args.start, stream=args.stream,
+                                               checkpoint_every=args.save_every,
+                                               checkpoint_interval=args.save_interval,
+                                               before_checkpoint=args.outfile.flush,
+                                               lock=args.lock, lock_timeout=0,
+                                               prefetch=args.prefetch)
     else:
         iterator = conn.iter_organization_alerts(organization_id=args.organization,
                                                  fromDate=args.start, sortBy='batchDate')
@@ -237,12 +292,14 @@ def command_alerts(conn, args):
 
     if args.persist:
         iterator.save()
+        iterator.close()
 
 
 def command_logs_list(conn, args):
+    import boto3  # slow to import, so only done by the commands that use S3
     if not args.organization:
         args.organization = UUID(conn.get_me()['defaultOrganizationId'])
-        logger.info('using default organization %s' % args.organization)
+        logger.info('using default organization %s', args.organization)
 
     # connect to S3
     creds = conn.get_organization_credentials(args.organization)
@@ -273,9 +330,10 @@ def command_logs_list(conn, args):
 
 
 def command_logs_upload(conn, args):
+    import boto3  # slow to import, so only done by the commands that use S3
     if not args.organization:
         args.organization = UUID(conn.get_me()['defaultOrganizationId'])
-        logger.info('using default organization %s' % args.organization)
+        logger.info('using default organization %s', args.organization)
 
     # get all source files and perform basic sanity checking
     srcfiles = parse_glob_files(args.src)
@@ -337,7 +395,7 @@ def command_logs_upload(conn, args):
 def command_wl_bl(conn, args):
     if not args.organization:
         args.organization = UUID(conn.get_me()['defaultOrganizationId'])
-        logger.info('using default organization %s' % args.organization)
+        logger.info('using default organization %s', args.organization)
 
     if args.id:
         json.dump(conn._get_organization_wblist_entry(args.scope, args.organization,
@@ -3,16 +3,29 @@
 This module implements the Connection class, which is used for low-level interaction with the
 Niddel Magnet v2 API.
 """
+from __future__ import absolute_import
+
 import logging
 import os
-import sys
+import re
+import threading
+import time
+from collections import deque
 
 import six
-from requests import request
+from requests import Session
+from requests.exceptions import ChunkedEncodingError
 from six.moves.configparser import RawConfigParser
 from six.moves.urllib.parse import urlsplit, quote_plus
 
-from magnetsdk2.time import UTC
+from magnetsdk2.cache import HTTPCache, TTLCache
+from magnetsdk2.credentials import CredentialProvider
+from magnetsdk2.fanout import iter_all_organization_alerts
+from magnetsdk2.jsonstream import IncompleteJSONError, iter_json_array
+from magnetsdk2.metrics import RequestEvent, TimingAdapter
+from magnetsdk2.pagination import PAGE_SIZE, AdaptivePageSize, validate_page_size
+from magnetsdk2.ratelimit import TokenBucket, get_rate_limiter
+from magnetsdk2.retry import RetryPolicy, CircuitBreaker, CircuitOpenError, RetryStats
 from magnetsdk2.validation import is_valid_uuid, is_valid_uri, is_valid_port, \
     is_valid_alert_sortBy, is_valid_alert_status, parse_date
 
@@ -21,7 +34,40 @@ _CONFIG_DIR = os.path.expanduser('~/.magnetsdk')
 _CONFIG_FILE = os.path.join(_CONFIG_DIR, "config")
 _DEFAULT_CONFIG = {'endpoint': 'https://api.niddel.com/v2'}
 _API_KEY_HEADER = 'X-Api-Key'
-_PAGE_SIZE = 100
+_POOL_SIZE = 10
+_STREAM_CHUNK_SIZE = 64 * 1024
+_HEADERS = {
+    "Accept-Encoding": "gzip, deflate",
+    "User-Agent": "magnet-sdk-python",
+    "Accept": "application/json"
+}
+_UUID_SEGMENT = re.compile(r'(?<=/)[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}(?=/|$)')
+
+
+def _initial_page_size(page_size):
+    """Returns the fixed page size, or the initial size of an adaptive one."""
+    if isinstance(page_size, AdaptivePageSize):
+        return page_size.initial
+    return page_size
+
+
+def _path_template(path):
+    """Converts a request path into its template by replacing IDs, e.g.
+    'organizations/{id}/alerts', so that requests to the same endpoint can be grouped.
+    """
+    return _UUID_SEGMENT.sub('{id}', '/' + path)[1:]
+
+
+def _iter_json_response(response):
+    """Decodes the JSON array in the body of a streamed response as it arrives. A body cut short
+    without a Content-Length to tell is raised as a ChunkedEncodingError, like any other read
+    error, so that it is retried."""
+    try:
+        for item in iter_json_array(response.iter_content(_STREAM_CHUNK_SIZE),
+                                    response.encoding or 'UTF-8'):
+            yield item
+    except IncompleteJSONError as e:
+        raise ChunkedEncodingError(e, response=response)
 
 
 class Connection(object):
@@ -30,17 +76,74 @@ class Connection(object):
      the requests library that is used for all accesses.
     """
 
-    def __init__(self, profile='default', api_key=None, endpoint=None):
+    def __init__(self, profile='default', api_key=None, endpoint=None, pool_size=_POOL_SIZE,
+                 keep_alive=True, retry_policy=None, circuit_breaker=None, rate_limit=None,
+                 rate_burst=None, cache=None, organization_cache=None, credential_provider=None,
+                 page_size=PAGE_SIZE, observers=None):
         """ Initializes the connection with the proper configuration data.
         :param profile: the profile name to use in ~/.magnetsdk/config
         :param api_key: if provided, this API key is used instead of the one on the
         configuration file
         :param endpoint: if provided this endpoint URL is used instead of the one on the
         configuration file
+        :param pool_size: maximum number of HTTP connections kept open to the API endpoint
+        :param keep_alive: if False, every request asks the server to close the connection
+        afterwards instead of returning it to the pool
+        :param retry_policy: a magnetsdk2.retry.RetryPolicy instance controlling how failed
+        requests are retried, a default policy is used if omitted
+        :param circuit_breaker: a magnetsdk2.retry.CircuitBreaker instance, which can be shared
+        between connections, a new one is used if omitted
+        :param rate_limit: maximum number of requests per second to perform with this API key,
+        shared with all other connections using it in this process, or a
+        magnetsdk2.ratelimit.TokenBucket instance to use instead; if omitted, the rate_limit value
+        in the configuration profile is used, if any, or else whatever limit is already in place
+        for the API key
+        :param rate_burst: maximum number of requests that can be performed back to back when
+        rate_limit is a number
+        :param cache: a magnetsdk2.cache.HTTPCache instance used to cache and conditionally
+        revalidate responses to slow-changing resources, none is used if omitted
+        :param organization_cache: a magnetsdk2.cache.TTLCache instance used to memoize
+        organization details, none is used if omitted
+        :param credential_provider: a magnetsdk2.credentials.CredentialProvider instance used to
+        cache organization credentials, a new in-memory one is used if omitted
+        :param page_size: default number of records to request per page from paginated
+        resources, or a magnetsdk2.pagination.AdaptivePageSize instance to adjust it based on
+        measured page latency and size
+        :param observers: callables that receive a magnetsdk2.metrics.RequestEvent after every
+        request, see add_observer
         """
-        # initialize logger and credential cache
+        # initialize logger and HTTP session
         self._logger = logging.getLogger('magnetsdk2')
-        self._org_creds_cache = {}
+        self._session = None
+        self._session_lock = threading.Lock()
+
+        if not isinstance(pool_size, six.integer_types) or pool_size < 1:
+            raise ValueError("pool size must be a positive integer")
+        self.pool_size = pool_size
+        self.keep_alive = bool(keep_alive)
+
+        if retry_policy is not None and not isinstance(retry_policy, RetryPolicy):
+            raise ValueError("retry policy must be a RetryPolicy instance")
+        self.retry_policy = retry_policy or RetryPolicy()
+        if circuit_breaker is not None and not isinstance(circuit_breaker, CircuitBreaker):
+            raise ValueError("circuit breaker must be a CircuitBreaker instance")
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        self.retry_stats = RetryStats()
+
+        if cache is not None and not isinstance(cache, HTTPCache):
+            raise ValueError("cache must be an HTTPCache instance")
+        self.cache = cache
+        if organization_cache is not None and not isinstance(organization_cache, TTLCache):
+            raise ValueError("organization cache must be a TTLCache instance")
+        self.organization_cache = organization_cache
+        if credential_provider is not None \
+                and not isinstance(credential_provider, CredentialProvider):
+            raise ValueError("credential provider must be a CredentialProvider instance")
+        self.credential_provider = credential_provider or CredentialProvider()
+        self.page_size = validate_page_size(page_size)
+        self._observers = []
+        for observer in observers or ():
+            self.add_observer(observer)
 
         # initially get configuration from environment
         self.endpoint = os.getenv('MAGNETSDK_API_ENDPOINT', _DEFAULT_CONFIG['endpoint'])
@@ -54,6 +157,10 @@ class Connection(object):
                 raise ValueError('profile %s not found in %s' % (profile, _CONFIG_FILE))
             self.api_key = parser.get(profile, 'api_key')
             self.endpoint = parser.get(profile, 'endpoint')
+            if rate_limit is None and parser.has_option(profile, 'rate_limit'):
+                rate_limit = parser.getfloat(profile, 'rate_limit')
+                if rate_burst is None and parser.has_option(profile, 'rate_burst'):
+                    rate_burst = parser.getint(profile, 'rate_burst')
 
         # explicit parameters override whatever was read previously
         if api_key is not None:
@@ -81,6 +188,14 @@ class Connection(object):
         else:
             self.verify = True
 
+        # set up client-side rate limiting, shared by API key unless a bucket was provided
+        if isinstance(rate_limit, TokenBucket):
+            self.rate_limiter = rate_limit
+        else:
+            self.rate_limiter = get_rate_limiter(self.api_key, rate_limit, rate_burst)
+        self._throttle_lock = threading.Lock()
+        self._throttle_stats = {'requests': 0, 'throttled': 0, 'wait_time': 0.0}
+
         self._logger.debug('%s: endpoint=%r, verify=%r', self.__class__.__name__, self.endpoint,
                            self.verify)
         self._proxies = None
@@ -128,7 +243,7 @@ class Connection(object):
             proxy_url += ":%i" % proxy_port
             proxy_url_sanitized += ":%i" % proxy_port
         self.set_proxy_url(proxy_url)
-        self._logger.debug('using proxy URL ' + proxy_url_sanitized)
+        self._logger.debug('using proxy URL %s', proxy_url_sanitized)
         return proxy_url
 
     def set_proxy_url(self, proxy_url):
@@ -136,135 +251,510 @@ class Connection(object):
         URL as per http://docs.python-requests.org/en/master/user/advanced/#proxies
         :param proxy_url: string containing the proxy URL
         """
+        self._reset_session()
         self._proxies = {
             'http': proxy_url,
             'https': proxy_url
         }
 
     def clear_proxy(self):
-        """Removes the existing proxy configuration so that """
+        """Removes the existing proxy configuration so that the API endpoint is accessed
+        directly."""
         if self._proxies:
-            self.close()
+            self._reset_session()
             self._proxies = None
 
-    def close(self):
-        """ Closes the Connection object.
+    @property
+    def session(self):
+        """The requests.Session used to perform requests, which is created on first use and
+        keeps a pool of persistent connections to the API endpoint (or proxy)."""
+        with self._session_lock:
+            if self._session is None:
+                self._session = self._new_session()
+            return self._session
+
+    def _new_session(self):
+        session = Session()
+        adapter = TimingAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(_HEADERS)
+        session.headers[_API_KEY_HEADER] = self.api_key
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        self._logger.debug('%s: new HTTP session with pool_size=%d, keep_alive=%r',
+                           self.__class__.__name__, self.pool_size, self.keep_alive)
+        return session
+
+    def pool_stats(self):
+        """Summarizes the state of the HTTP connection pools of the current session.
+        :return: a dict with the number of 'pools', the number of 'connections' created, the number
+        of 'requests' sent, how many of those 'reused' an existing connection and how many
+        connections are currently 'idle' in the pools
+        """
+        stats = {'pools': 0, 'connections': 0, 'requests': 0, 'reused': 0, 'idle': 0}
+        session = getattr(self, '_session', None)
+        if session is None:
+            return stats
+        managers = []
+        for adapter in set(session.adapters.values()):
+            managers.append(adapter.poolmanager)
+            managers.extend(adapter.proxy_manager.values())
+        for manager in managers:
+            for key in manager.pools.keys():
+                pool = manager.pools.get(key)
+                if pool is None:
+                    continue
+                stats['pools'] += 1
+                stats['connections'] += pool.num_connections
+                stats['requests'] += pool.num_requests
+                if pool.pool is not None:
+                    stats['idle'] += sum(1 for x in list(pool.pool.queue) if x is not None)
+        stats['reused'] = max(stats['requests'] - stats['connections'], 0)
+        return stats
+
+    def add_observer(self, observer):
+        """Registers a callable that receives a magnetsdk2.metrics.RequestEvent after every
+        request this connection performs, including those served by the HTTP cache and those that
+        fail. Observers are called on the thread that performed the request, so they must be
+        thread-safe and fast; exceptions they raise are logged and ignored.
+        :param observer: the callable, e.g. a magnetsdk2.metrics.MetricsAggregator instance
+        """
+        if not callable(observer):
+            raise ValueError("observer must be callable")
+        self._observers = self._observers + [observer]
+
+    def remove_observer(self, observer):
+        """Unregisters a callable previously registered with add_observer."""
+        self._observers = [x for x in self._observers if x != observer]
+
+    def _notify(self, event):
+        for observer in self._observers:
+            try:
+                observer(event)
+            except Exception:
+                self._logger.warning('request observer %r failed', observer, exc_info=True)
+
+    def _request_event(self, method, path, response, start, attempt, from_cache, stream):
+        """Builds the RequestEvent describing a response received from the API."""
+        connect = getattr(response, 'connect_time', 0.0)
+        ttfb = max(response.elapsed.total_seconds() - connect, 0.0)
+        download = None
+        response_bytes = response.headers.get('Content-Length')
+        if not stream:
+            download = max(time.time() - start - connect - ttfb, 0.0)
+            response_bytes = len(response.content)
+        elif response_bytes is not None:
+            response_bytes = int(response_bytes)
+        return RequestEvent(method, _path_template(path), response.status_code, connect, ttfb,
+                            download, len(response.request.body or b''), response_bytes,
+                            attempt, from_cache, response.throttle_wait)
+
+    def throttle_stats(self):
+        """Summarizes the time this connection spent waiting for the client-side rate limiter,
+        which is not included in the latency (requests.Response.elapsed) of the requests.
+        :return: a dict with the number of 'requests' performed, how many of those were
+        'throttled' and the total 'wait_time' in seconds
         """
-        pass
+        with self._throttle_lock:
+            return dict(self._throttle_stats)
 
-    def _request(self, method, path, params=None, body=None):
+    def _throttle(self):
+        """Waits for the rate limiter, if any, before performing a request.
+        :return: the time in seconds spent waiting
+        """
+        waited = self.rate_limiter.acquire() if self.rate_limiter is not None else 0.0
+        with self._throttle_lock:
+            self._throttle_stats['requests'] += 1
+            if waited > 0:
+                self._throttle_stats['throttled'] += 1
+                self._throttle_stats['wait_time'] += waited
+        return waited
+
+    def _reset_session(self):
+        """Releases the current HTTP session and its pooled connections, so that a new one is
+        created on next use."""
+        lock = getattr(self, '_session_lock', None)
+        if lock is None:
+            return
+        with lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+
+    def close(self):
+        """ Closes the Connection object, releasing the HTTP session and its pooled
+        connections, stopping background refreshes of credentials and saving the organization
+        cache. A new session is created if the object is used again.
+        """
+        self._reset_session()
+        if getattr(self, 'organization_cache', None) is not None:
+            self.organization_cache.close()
+        if getattr(self, 'credential_provider', None) is not None:
+            self.credential_provider.close()
+
+    def _request(self, method, path, params=None, body=None, stream=False, attempt=1,
+                 headers=None):
         """ Performs an HTTP operation using the base API endpoint, API key and SSL validation /
         cert pinning obtained from the configuration file.
         :param method: string with the the HTTP method to use ('GET', 'PUT', etc.)
         :param path: string with the path to append to the base API endpoint
         :param params: dict with the query parameters to submit
-        :return: the requests.Response object
+        :param body: object to send JSON-encoded as the request body
+        :param stream: if True, the response body is only downloaded as it is consumed and the
+        HTTP cache is bypassed
+        :param attempt: number of the attempt this request is, reported to observers
+        :param headers: optional dict with extra request headers; the HTTP cache is bypassed if
+        provided, as they may conflict with its conditional request headers
+        :return: the requests.Response object, with the time spent waiting for the rate limiter
+        in its throttle_wait attribute and whether it was served by the HTTP cache in from_cache
         """
-        response = request(method=method, url=self.endpoint + path, params=params, json=body,
-                           verify=self.verify,
-                           proxies=self._proxies, timeout=(5, 60),
-                           headers={_API_KEY_HEADER: self.api_key,
-                                    "Accept-Encoding": "gzip, deflate",
-                                    "User-Agent": "magnet-sdk-python",
-                                    "Accept": "application/json"})
-        if response.request.body:
-            msg = '{0:s} {1:s} ({2:d} bytes in body)'.format(response.request.method,
-                                                             response.request.url,
-                                                             len(response.request.body))
-            self._logger.debug(msg)
-        else:
-            self._logger.debug('{0:s} {1:s}'.format(response.request.method, response.request.url))
-        self._logger.debug("got {0:d} response".format(response.status_code))
+        url = self.endpoint + path
+
+        # check the HTTP cache, if any, for a usable or revalidatable response
+        cache, ttl, entry = self.cache, None, None
+        if cache is not None and method == 'GET' and not stream and headers is None:
+            ttl = cache.ttl(_path_template(path))
+        if ttl is not None:
+            key = cache.key(self.api_key, url, params)
+            entry = cache.get(key)
+            if entry is not None:
+                if cache.is_fresh(entry, ttl):
+                    cache.record_hit()
+                    response = cache.response(entry, method)
+                    response.throttle_wait = 0.0
+                    self._logger.debug('%s %s served from cache', method, response.url)
+                    if self._observers:
+                        self._notify(RequestEvent(method, _path_template(path), 200,
+                                                  request_bytes=0,
+                                                  response_bytes=len(response.content),
+                                                  attempt=attempt, from_cache=True))
+                    return response
+                headers = cache.conditional_headers(entry)
+
+        throttle_wait = self._throttle()
+        start = time.time()
+        try:
+            response = self.session.request(method=method, url=url, params=params, json=body,
+                                            headers=headers, verify=self.verify,
+                                            proxies=self._proxies, timeout=(5, 60),
+                                            stream=stream)
+        except Exception as e:
+            if self._observers:
+                self._notify(RequestEvent(method, _path_template(path), attempt=attempt,
+                                          throttle_wait=throttle_wait, error=e))
+            raise
+        response.throttle_wait = throttle_wait
+        response.from_cache = False
+        if self._observers:
+            event = self._request_event(method, path, response, start, attempt,
+                                        response.status_code == 304 and entry is not None,
+                                        stream)
+            self._notify(event)
+
+        if ttl is not None:
+            if response.status_code == 304 and entry is not None:
+                cache.record_revalidation()
+                self._logger.debug('%s %s not modified, using cached response', method,
+                                   response.url)
+                response.close()
+                response = cache.response(cache.refresh(key, entry, response), method)
+                response.throttle_wait = throttle_wait
+                return response
+            cache.record_miss()
+            if response.status_code == 200:
+                cache.store(key, response, ttl)
+        if self._logger.isEnabledFor(logging.DEBUG):
+            self._logger.debug('%s %s (%d bytes in body): got %d response', method,
+                               response.request.url, len(response.request.body or b''),
+                               response.status_code)
         return response
 
-    def _request_retry(self, method, path, params=None, body=None, ok_status=(200, 404), retries=5):
-        """ Wrapper around self._request that retries on exceptions and unexpected status codes.
+    def _request_retry(self, method, path, params=None, body=None, ok_status=(200, 404),
+                       retries=None, stream=False, headers=None):
+        """ Wrapper around self._request that retries on network exceptions and retryable status
+        codes according to the connection's retry policy, waiting between attempts, and fails fast
+        while the circuit breaker for the endpoint is open.
+        :param ok_status: status codes that are never retried
+        :param retries: if provided, overrides the maximum number of attempts of the retry policy
+        :param headers: optional dict with extra request headers
+        :return: the requests.Response object of the last attempt
         """
-        i = 1
+        policy = self.retry_policy
+        status_retries, error_retries = policy.status_retries, policy.error_retries
+        if retries is not None:
+            status_retries = error_retries = max(retries - 1, 0)
+        endpoint = _path_template(path)
+        try:
+            self.circuit_breaker.before_request(endpoint)
+        except CircuitOpenError:
+            self.retry_stats.record_circuit_open()
+            raise
+
+        status_attempts = error_attempts = 0
         while True:
             try:
-                response = self._request(method, path, params, body)
-                if i >= retries or response.status_code in ok_status:
-                    return response
-            except:
-                self._logger.exception('error at try %i of %s request for %s with params=%s', i,
-                                       method, path, repr(params))
-                if i >= retries:
-                    six.reraise(*sys.exc_info())
-            i += 1
-
-    def iter_organizations(self):
-        """ Generator that allows iteration over all of the organizations that this connections's
-        API key has access to.
-        :return: an iterator over the decoded JSON objects that represent organizations.
+                response = self._request(method, path, params, body, stream,
+                                         status_attempts + error_attempts + 1, headers)
+            except Exception as e:
+                if not policy.is_retryable_exception(e):
+                    # still recorded, so that a failed trial request doesn't leave the circuit
+                    # waiting for its outcome forever
+                    self.circuit_breaker.record_failure(endpoint)
+                    raise
+                if error_attempts >= error_retries:
+                    self.circuit_breaker.record_failure(endpoint)
+                    self.retry_stats.record_exhausted()
+                    raise
+                error_attempts += 1
+                self.retry_stats.record_error(e)
+                delay = policy.delay(error_attempts)
+                self._logger.warning('error at try %i of %s request for %s with params=%r, '
+                                     'retrying in %.2fs: %s', error_attempts, method, path, params,
+                                     delay, e)
+                time.sleep(delay)
+                continue
+
+            status = response.status_code
+            if status in ok_status or not policy.is_retryable_status(status):
+                self.circuit_breaker.record_success(endpoint)
+                return response
+            if status_attempts >= status_retries:
+                self.circuit_breaker.record_failure(endpoint)
+                self.retry_stats.record_exhausted()
+                return response
+            status_attempts += 1
+            self.retry_stats.record_status(status)
+            delay = policy.delay(status_attempts, response)
+            self._logger.warning('got %d at try %i of %s request for %s with params=%r, '
+                                 'retrying in %.2fs', status, status_attempts, method, path,
+                                 params, delay)
+            response.close()
+            time.sleep(delay)
+
+    def _get_page(self, path, params, stats=None):
+        """ Retrieves a single page of a paginated resource.
+        :param path: string with the path to append to the base API endpoint
+        :param params: dict with the query parameters to submit, including page and size
+        :param stats: optional dict in which the page 'latency' in seconds and its size in
+        'bytes' are stored
+        :return: the decoded JSON list, or None if the resource was not found
         """
-        params = {
-            'page': 1,
-            'size': _PAGE_SIZE
-        }
+        response = self._request_retry("GET", path=path, params=params)
+        if stats is not None:
+            stats['latency'] = response.elapsed.total_seconds()
+            stats['bytes'] = len(response.content)
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            return None
+        else:
+            response.raise_for_status()
+
+    def _effective_page_size(self, page_size=None):
+        """ Resolves the page size to use for a call, falling back to the connection's.
+        :return: a fixed page size or an AdaptivePageSize instance
+        """
+        if page_size is None:
+            return self.page_size
+        return validate_page_size(page_size)
+
+    def _iter_pages(self, path, params=None, prefetch=None, stream=False, page_size=None):
+        """ Walks through the pages of a paginated resource in order, stopping at the first page
+        shorter than the page size in effect or when the resource is not found.
+        :param path: string with the path to append to the base API endpoint
+        :param params: dict with additional query parameters to submit
+        :param prefetch: if provided, the number of pages to fetch concurrently ahead of the
+        consumer
+        :param stream: if True, each page is decoded incrementally as it is downloaded
+        :param page_size: number of records per page or an AdaptivePageSize instance, defaults to
+        the connection's page size; adaptive page sizes only change when neither prefetch nor
+        stream are used
+        :return: an iterator over the decoded JSON objects in each page
+        """
+        params = dict(params or {})
+        page_size = self._effective_page_size(page_size)
+        if stream:
+            if prefetch is not None:
+                raise ValueError("prefetch and stream cannot be used together")
+            return self._iter_pages_stream(path, params, _initial_page_size(page_size))
+        if prefetch is None:
+            return self._iter_pages_sequential(path, params, page_size)
+        if not isinstance(prefetch, six.integer_types) or prefetch < 1:
+            raise ValueError("prefetch must be a positive integer")
+        return self._iter_pages_prefetch(path, params, prefetch, _initial_page_size(page_size))
+
+    def _iter_pages_sequential(self, path, params, page_size):
+        adaptive = page_size if isinstance(page_size, AdaptivePageSize) else None
+        size = _initial_page_size(page_size)
+        offset = 0
+        stats = {} if adaptive else None
         while True:
-            response = self._request_retry("GET", path='organizations', params=params)
-            if response.status_code == 200:
-                organization_list = response.json()
-                for organization in organization_list:
-                    yield organization
-                if len(organization_list) < _PAGE_SIZE:
-                    return
-            elif response.status_code == 404:
+            params['size'] = size
+            params['page'] = offset // size + 1
+            page = self._get_page(path, params, stats)
+            if page is None:
+                return
+            for item in page:
+                yield item
+            if len(page) < size:
+                return
+            offset += size
+            if adaptive:
+                new_size = adaptive.next_size(size, offset, stats['latency'], stats['bytes'])
+                if new_size != size:
+                    self._logger.debug('page size for %s changed from %d to %d', path, size,
+                                       new_size)
+                    size = new_size
+
+    def _iter_pages_stream(self, path, params, size):
+        policy = self.retry_policy
+        params['page'] = 1
+        params['size'] = size
+        while True:
+            # items of the page already yielded, which are skipped if the body fails half way
+            # and the page has to be requested again
+            count = 0
+            error_attempts = 0
+            while True:
+                response = self._request_retry("GET", path=path, params=params, stream=True)
+                try:
+                    if response.status_code == 404:
+                        return
+                    elif response.status_code != 200:
+                        response.raise_for_status()
+                    read = 0
+                    try:
+                        for item in _iter_json_response(response):
+                            read += 1
+                            if read > count:
+                                count = read
+                                yield item
+                    except Exception as e:
+                        if not policy.is_retryable_exception(e):
+                            raise
+                        if error_attempts >= policy.error_retries:
+                            self.retry_stats.record_exhausted()
+                            raise
+                        error_attempts += 1
+                        self.retry_stats.record_error(e)
+                        delay = policy.delay(error_attempts)
+                        self._logger.warning('error at try %i reading page %d of %s, retrying '
+                                             'in %.2fs: %s', error_attempts, params['page'], path,
+                                             delay, e)
+                        time.sleep(delay)
+                        continue
+                finally:
+                    response.close()
+                break
+            if count < size:
                 return
-            else:
-                response.raise_for_status()
             params['page'] += 1
 
-    def get_organization(self, organization_id):
+    def _iter_pages_prefetch(self, path, params, prefetch, size):
+        # at most prefetch pages are either being fetched or waiting to be consumed, so memory
+        # usage stays bounded no matter how slow the consumer is
+        params['size'] = size
+        from concurrent.futures import ThreadPoolExecutor  # only imported when needed
+        executor = ThreadPoolExecutor(max_workers=prefetch)
+        pending = deque()
+        next_page = 1
+        last_page_seen = False
+        try:
+            while True:
+                while not last_page_seen and len(pending) < prefetch:
+                    page_params = dict(params)
+                    page_params['page'] = next_page
+                    pending.append(executor.submit(self._get_page, path, page_params))
+                    next_page += 1
+                if not pending:
+                    return
+                page = pending.popleft().result()
+                if page is None or len(page) < size:
+                    # pages requested after this one are past the end, discard them
+                    last_page_seen = True
+                    while pending:
+                        pending.pop().cancel()
+                for item in page or ():
+                    yield item
+        finally:
+            while pending:
+                pending.pop().cancel()
+            executor.shutdown(wait=False)
+
+    def iter_organizations(self, prefetch=None, page_size=None):
+        """ Generator that allows iteration over all of the organizations that this connections's
+        API key has access to.
+        :param prefetch: if provided, the number of pages to fetch concurrently ahead of the
+        consumer, which should not exceed the connection's pool size
+        :param page_size: number of organizations per page or an AdaptivePageSize instance,
+        defaults to the connection's page size
+        :return: an iterator over the decoded JSON objects that represent organizations.
+        """
+        return self._iter_pages('organizations', prefetch=prefetch, page_size=page_size)
+
+    def get_organization(self, organization_id, cache=True):
         """ Retrieves detailed data from an organization this API key has accessed to based on its
         ID.
         :param organization_id: string with the UUID-style unique ID of the organization
+        :param cache: boolean controlling whether the connection's organization cache, if any, is
+        used
         :return: decoded JSON objects that represents the organization or None if not found
         """
         if not is_valid_uuid(organization_id):
             raise ValueError("organization id should be a string in UUID format")
+        organization_cache = self.organization_cache if cache else None
+        if organization_cache is not None:
+            organization = organization_cache.get(str(organization_id))
+            if organization is not None:
+                return organization
+
         response = self._request_retry("GET", path='organizations/%s' % organization_id)
         if response.status_code == 200:
-            return response.json()
+            organization = response.json()
+            if organization_cache is not None:
+                organization_cache.set(str(organization_id), organization)
+            return organization
         elif response.status_code == 404:
             return None
         else:
             response.raise_for_status()
 
+    def invalidate_organization(self, organization_id=None):
+        """ Removes an organization, or all organizations if no ID is provided, from the
+        connection's organization cache.
+        :param organization_id: string with the UUID-style unique ID of the organization
+        """
+        if self.organization_cache is not None:
+            self.organization_cache.invalidate(
+                str(organization_id) if organization_id is not None else None)
+
     def get_organization_credentials(self, organization_id, cache=True):
-        """ Retrieves a new set of temporary AWS credentials to allow access to an organization's
-        S3 bucket. Typically used to upload log files. Will cache the response and return the same
-        credentials if they have at least 10 minutes before expiration.
+        """ Retrieves a set of temporary AWS credentials to allow access to an organization's
+        S3 bucket. Typically used to upload log files. Will cache the response using the
+        connection's credential provider, which only returns credentials with at least 10 minutes
+        before expiration by default and refreshes them in the background ahead of time.
         :param organization_id: string with the UUID-style unique ID of the organization
         :param cache: boolean controlling whether credentials are cached in this connection
         :return: decoded JSON objects that represents the credentials
         """
         if not is_valid_uuid(organization_id):
             raise ValueError("organization id should be a string in UUID format")
-
-        # try cached response first, must have at least 10 minutes validity
         if cache:
-            cached_response = self._org_creds_cache.get(organization_id, None)
-            if cached_response:
-                exp = iso8601.parse_date(cached_response['expiration'])
-                if exp >= (datetime.datetime.now(UTC) + datetime.timedelta(minutes=10)):
-                    return cached_response
-                else:
-                    del self._org_creds_cache[organization_id]
-
-        # get a new credential
+            return self.credential_provider.get(organization_id,
+                                                self._fetch_organization_credentials)
+        return self._fetch_organization_credentials(organization_id)
+
+    def _fetch_organization_credentials(self, organization_id):
         response = self._request_retry("GET", path='organizations/%s/credentials' % organization_id)
         if response.status_code == 200:
-            cached_response = response.json()
-            if cache:
-                self._org_creds_cache[organization_id] = cached_response
-            return cached_response
+            return response.json()
         else:
             response.raise_for_status()
 
     def iter_organization_alerts(self, organization_id, fromDate=None, toDate=None,
-                                 sortBy="logDate", status=None):
+                                 sortBy="logDate", status=None, prefetch=None, stream=False,
+                                 page_size=None):
         """ Generator that allows iteration over an organization's alerts, with optional filters.
         :param organization_id: string with the UUID-style unique ID of the organization
         :param fromDate: only list alerts with dates >= this parameter
@@ -273,8 +763,26 @@ class Connection(object):
         toDate apply to
         :param status: a list or set containing one or more of 'new', 'under_investigation',
         'rejected', 'resolved'
+        :param prefetch: if provided, the number of pages to fetch concurrently ahead of the
+        consumer, which should not exceed the connection's pool size
+        :param stream: if True, alerts are decoded and yielded as each page is downloaded, which
+        lowers memory usage and the time until the first alert, but cannot be combined with
+        prefetch
+        :param page_size: number of alerts per page or an AdaptivePageSize instance, defaults to
+        the connection's page size
         :return: an iterator over the decoded JSON objects that represent alerts.
         """
+        path, params = self._organization_alerts_query(organization_id, fromDate, toDate, sortBy,
+                                                       status)
+        return self._iter_pages(path, params, prefetch, stream, page_size)
+
+    @staticmethod
+    def _organization_alerts_query(organization_id, fromDate=None, toDate=None, sortBy="logDate",
+                                   status=None):
+        """ Validates the parameters of an alert listing and converts them to the request path
+        and query parameters to use.
+        :return: a tuple with the path and a dict with the query parameters
+        """
         if not is_valid_uuid(organization_id):
             raise ValueError("organization id should be a string in UUID format")
         if not is_valid_alert_sortBy(sortBy):
@@ -284,33 +792,34 @@ class Connection(object):
                 "status must be an iterable with one or more of 'new', 'under_investigation', " +
                 "'rejected' or 'resolved'")
 
-        # loop over alert pages and yield them
-        params = {
-            'page': 1,
-            'size': _PAGE_SIZE,
-            'sortBy': sortBy
-        }
+        params = {'sortBy': sortBy}
         if fromDate:
             params['fromDate'] = parse_date(fromDate)
         if toDate:
             params['toDate'] = parse_date(toDate)
         if status:
             params['status'] = status
-
-        while True:
-            response = self._request_retry("GET", path='organizations/%s/alerts' % organization_id,
-                                           params=params)
-            if response.status_code == 200:
-                alert_list = response.json()
-                for alert in alert_list:
-                    yield alert
-                if len(alert_list) < _PAGE_SIZE:
-                    return
-            elif response.status_code == 404:
-                return
-            else:
-                response.raise_for_status()
-            params['page'] += 1
+        return 'organizations/%s/alerts' % organization_id, params
+
+    def iter_all_organization_alerts(self, organization_ids=None, max_workers=8, merge=False,
+                                     progress=None, **kwargs):
+        """ Generator that retrieves the alerts of many organizations concurrently, under a global
+        concurrency limit. Failures on one organization are logged and reported but do not
+        interrupt the others. See magnetsdk2.fanout.iter_all_organization_alerts for details.
+        :param organization_ids: IDs of the organizations to query, defaults to all organizations
+        this connection's API key has access to
+        :param max_workers: maximum number of organizations queried at the same time, which
+        should not exceed the connection's pool size
+        :param merge: if True, alerts are yielded in increasing order of the date selected by
+        sortBy instead of as they arrive
+        :param progress: optional callable that receives a magnetsdk2.fanout.OrganizationProgress
+        instance as each organization is finished
+        :param kwargs: fromDate, toDate, sortBy, status and page_size filters, as in
+        iter_organization_alerts, and buffer_size to limit the alerts fetched ahead of the consumer
+        :return: an iterator over (organization ID, alert) tuples
+        """
+        return iter_all_organization_alerts(self, organization_ids, max_workers, merge, progress,
+                                            **kwargs)
 
     def list_organization_alert_dates(self, organization_id, sortBy="logDate"):
         """ Lists all log or batch dates for which alerts exist on the organization.
@@ -333,6 +842,35 @@ class Connection(object):
         else:
             response.raise_for_status()
 
+    def poll_organization_alert_dates(self, organization_id, sortBy="logDate", etag=None):
+        """ Lists all log or batch dates for which alerts exist on the organization, unless they
+        haven't changed since a previous call, which makes polling them cheap.
+        :param organization_id: string with the UUID-style unique ID of the organization
+        :param sortBy: one of 'logDate' or 'batchDate', controls which date field to return
+        :param etag: the ETag returned by a previous call, if any
+        :return: a tuple with a set of ISO 8601 dates for which alerts exist, or None if they
+        haven't changed since the call that returned etag, and the ETag of the dates, which is None
+        if the API didn't provide one
+        """
+        if not is_valid_uuid(organization_id):
+            raise ValueError("organization id should be a string in UUID format")
+        if not is_valid_alert_sortBy(sortBy):
+            raise ValueError("sortBy must be either 'logDate' or 'batchDate'")
+
+        response = self._request_retry("GET",
+                                       path='organizations/%s/alerts/dates' % organization_id,
+                                       params={'sortBy': sortBy}, ok_status=(200, 304, 404),
+                                       headers={'If-None-Match': etag} if etag else None)
+        if response.status_code == 304 and etag:
+            response.close()
+            return None, etag
+        elif response.status_code == 200:
+            return set(response.json()), response.headers.get('ETag')
+        elif response.status_code == 404:
+            return set(), None
+        else:
+            response.raise_for_status()
+
     def get_me(self):
         """Queries the API about the user that owns the API key in use.
         :return: a dict representing the user details
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements the caching of the temporary AWS credentials that give access to an
+organization's S3 bucket. Credentials are refreshed in the background before they get close to
+expiring, concurrent callers share a single refresh, and they can optionally be persisted to a
+locked file so that multiple processes on the same host share them.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import sys
+import threading
+import time
+
+import six
+
+from magnetsdk2.files import FileLock, write_json
+from magnetsdk2.time import seconds_from_UTC_epoch
+
+
+class _Flight(object):
+    """A refresh in progress, which callers arriving later wait on instead of starting their
+    own."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.exc_info = None
+
+
+class CredentialProvider(object):
+    """Thread-safe cache of organization credentials, which should only be shared by connections
+    that use the same API key."""
+
+    def __init__(self, refresh_margin=600, refresh_ahead=300, background=True, filename=None,
+                 lock_timeout=30):
+        """Initializes a credential provider.
+        :param refresh_margin: credentials that expire in less than this number of seconds are
+        never returned to callers
+        :param refresh_ahead: number of seconds before reaching refresh_margin at which
+        credentials that are in use are refreshed in the background
+        :param background: if False, credentials are only refreshed when a caller needs them
+        :param filename: optional JSON file used to share credentials between processes
+        :param lock_timeout: maximum number of seconds to wait for other processes to release the
+        file
+        """
+        if refresh_margin < 0 or refresh_ahead < 0:
+            raise ValueError("refresh margins must not be negative")
+        self.refresh_margin = refresh_margin
+        self.refresh_ahead = refresh_ahead
+        self.background = background
+        self.filename = filename
+        self.lock_timeout = lock_timeout
+        self._logger = logging.getLogger('magnetsdk2')
+        self._lock = threading.Lock()
+        self._credentials = {}
+        self._flights = {}
+        self._timers = {}
+        self._used = set()
+
+    @staticmethod
+    def _remaining(credentials):
+        return seconds_from_UTC_epoch(credentials['expiration']) - time.time()
+
+    def _is_valid(self, credentials):
+        return credentials is not None and self._remaining(credentials) >= self.refresh_margin
+
+    def _read_file(self, organization_id):
+        try:
+            with open(self.filename, 'r') as f:
+                return json.load(f).get(organization_id)
+        except (IOError, OSError, ValueError):
+            return None
+
+    def get(self, organization_id, fetch):
+        """Returns valid credentials for an organization, fetching new ones if needed.
+        :param organization_id: string with the UUID-style unique ID of the organization
+        :param fetch: callable that receives the organization ID and requests new credentials
+        :return: a dict with the credentials
+        """
+        organization_id = str(organization_id)
+        with self._lock:
+            credentials = self._credentials.get(organization_id)
+            if self._is_valid(credentials):
+                self._used.add(organization_id)
+                return credentials
+
+        # another process may have refreshed the credentials already
+        if self.filename:
+            credentials = self._read_file(organization_id)
+            if self._is_valid(credentials):
+                self._store(organization_id, credentials, fetch)
+                return credentials
+
+        return self._refresh(organization_id, fetch)
+
+    def _refresh(self, organization_id, fetch, force=False):
+        """Refreshes an organization's credentials, unless another thread is already doing it,
+        in which case its result is shared.
+        :param force: if False, valid credentials stored by a refresh that ended after the caller
+        looked for them are returned instead of fetching new ones
+        """
+        with self._lock:
+            flight = self._flights.get(organization_id)
+            leader = flight is None
+            if leader and not force:
+                credentials = self._credentials.get(organization_id)
+                if self._is_valid(credentials):
+                    self._used.add(organization_id)
+                    return credentials
+            if leader:
+                flight = self._flights[organization_id] = _Flight()
+        if not leader:
+            flight.event.wait()
+            if flight.exc_info:
+                six.reraise(*flight.exc_info)
+            return flight.result
+
+        try:
+            flight.result = self._fetch(organization_id, fetch)
+            return flight.result
+        except Exception:
+            flight.exc_info = sys.exc_info()
+            raise
+        finally:
+            with self._lock:
+                del self._flights[organization_id]
+            flight.event.set()
+
+    def _fetch(self, organization_id, fetch):
+        with self._lock:
+            current = self._credentials.get(organization_id)
+        if not self.filename:
+            credentials = fetch(organization_id)
+        else:
+            with FileLock(self.filename + '.lock', timeout=self.lock_timeout):
+                # use credentials from the file if another process got newer ones meanwhile
+                credentials = self._read_file(organization_id)
+                if not self._is_valid(credentials) or (
+                        current is not None and
+                        self._remaining(credentials) <= self._remaining(current)):
+                    credentials = fetch(organization_id)
+                    self._write_file(organization_id, credentials)
+        self._store(organization_id, credentials, fetch)
+        return credentials
+
+    def _write_file(self, organization_id, credentials):
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            data = {}
+        data = dict((k, v) for k, v in six.iteritems(data) if self._remaining(v) > 0)
+        data[organization_id] = credentials
+        write_json(self.filename, data)
+
+    def _store(self, organization_id, credentials, fetch):
+        with self._lock:
+            self._credentials[organization_id] = credentials
+            self._used.discard(organization_id)
+            timer = self._timers.pop(organization_id, None)
+            if timer is not None:
+                timer.cancel()
+            if self.background:
+                delay = max(self._remaining(credentials) - self.refresh_margin
+                            - self.refresh_ahead, 0)
+                timer = threading.Timer(delay, self._refresh_in_background,
+                                        (organization_id, fetch))
+                timer.daemon = True
+                self._timers[organization_id] = timer
+                timer.start()
+
+    def _refresh_in_background(self, organization_id, fetch):
+        with self._lock:
+            self._timers.pop(organization_id, None)
+            # only keep refreshing credentials that have been used since the last refresh
+            if organization_id not in self._used:
+                return
+        try:
+            self._refresh(organization_id, fetch, force=True)
+        except Exception:
+            self._logger.warning('background refresh of credentials for organization %s failed',
+                                 organization_id, exc_info=True)
+
+    def invalidate(self, organization_id=None):
+        """Discards the cached credentials of an organization, or of all organizations if no ID is
+        provided. Credentials persisted to a file are not affected."""
+        with self._lock:
+            keys = list(self._credentials) if organization_id is None else [str(organization_id)]
+            for key in keys:
+                self._credentials.pop(key, None)
+                self._used.discard(key)
+                timer = self._timers.pop(key, None)
+                if timer is not None:
+                    timer.cancel()
+
+    def close(self):
+        """Stops all background refreshes."""
+        with self._lock:
+            timers, self._timers = self._timers, {}
+        for timer in timers.values():
+            timer.cancel()
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements concurrent retrieval of alerts from many organizations at once, which is
+what MSSP-style deployments with hundreds of organizations typically need.
+"""
+import logging
+import threading
+
+import six
+from six.moves.queue import Queue, Empty, Full
+
+from magnetsdk2.validation import are_valid_uuids, parse_date
+
+_DONE = object()
+_POLL_INTERVAL = 0.1
+
+
+class OrganizationProgress(object):
+    """Reports the outcome of fetching the alerts of one organization during a fan-out."""
+
+    def __init__(self, organization_id, alerts, error=None):
+        self.organization_id = organization_id
+        self.alerts = alerts
+        self.error = error
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def __repr__(self):
+        return "%s(organization_id=%s, alerts=%d, error=%r)" \
+               % (self.__class__.__name__, self.organization_id, self.alerts, self.error)
+
+
+def iter_all_organization_alerts(connection, organization_ids=None, max_workers=8, merge=False,
+                                 progress=None, buffer_size=1000, fromDate=None, toDate=None,
+                                 sortBy="logDate", status=None, page_size=None):
+    """Generator that retrieves the alerts of many organizations concurrently. Failures on one
+    organization are logged and reported but do not interrupt the others.
+    :param connection: the magnetsdk2.Connection to use
+    :param organization_ids: IDs of the organizations to query, defaults to all organizations the
+    API key has access to
+    :param max_workers: maximum number of organizations queried at the same time
+    :param merge: if False, alerts are yielded as they arrive; if True, they are yielded in
+    increasing order of the date selected by sortBy, one date at a time
+    :param progress: optional callable that receives an OrganizationProgress instance when an
+    organization is finished
+    :param buffer_size: maximum number of alerts fetched but not yet consumed
+    :param fromDate: only list alerts with dates >= this parameter
+    :param toDate: only list alerts with dates <= this parameter
+    :param sortBy: one of 'logDate' or 'batchDate', controls which date field fromDate, toDate and
+    merge apply to
+    :param status: a list or set containing one or more of 'new', 'under_investigation',
+    'rejected', 'resolved'
+    :param page_size: number of alerts per page, defaults to the connection's page size
+    :return: an iterator over (organization ID, alert) tuples
+    """
+    if not isinstance(max_workers, six.integer_types) or max_workers < 1:
+        raise ValueError("maximum number of workers must be a positive integer")
+    if not isinstance(buffer_size, six.integer_types) or buffer_size < 1:
+        raise ValueError("buffer size must be a positive integer")
+    if organization_ids is not None:
+        organization_ids = [str(x) for x in organization_ids]
+        if not are_valid_uuids(organization_ids):
+            raise ValueError("organization ids should be strings in UUID format")
+    query = {'fromDate': fromDate, 'toDate': toDate, 'sortBy': sortBy, 'status': status,
+             'page_size': page_size}
+    fan_out = _FanOut(connection, max_workers, progress, buffer_size)
+    if merge:
+        return fan_out.iter_merged(organization_ids, query)
+    return fan_out.iter_unordered(organization_ids, query)
+
+
+class _FanOut(object):
+    def __init__(self, connection, max_workers, progress, buffer_size):
+        self._connection = connection
+        self._max_workers = max_workers
+        self._progress = progress
+        self._buffer_size = buffer_size
+        self._logger = logging.getLogger('magnetsdk2')
+
+    def _organization_ids(self, organization_ids):
+        if organization_ids is None:
+            organization_ids = [x['id'] for x in self._connection.iter_organizations()]
+        return organization_ids
+
+    def _report(self, organization_id, alerts, error):
+        if error is not None:
+            self._logger.warning('failed to retrieve alerts of organization %s after %d alerts: '
+                                 '%s', organization_id, alerts, error)
+        if self._progress is not None:
+            self._progress(OrganizationProgress(organization_id, alerts, error))
+
+    def _run(self, executor, tasks):
+        """Runs a set of (organization ID, query) tasks concurrently, yielding
+        (organization ID, alert) tuples as they arrive and (organization ID, _DONE, count, error)
+        tuples as each task ends."""
+        queue = Queue(maxsize=self._buffer_size)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    queue.put(item, timeout=_POLL_INTERVAL)
+                    return True
+                except Full:
+                    pass
+            return False
+
+        def work(organization_id, query):
+            count = 0
+            try:
+                for alert in self._connection.iter_organization_alerts(organization_id, **query):
+                    if not put((organization_id, alert)):
+                        return
+                    count += 1
+            except Exception as e:
+                put((organization_id, _DONE, count, e))
+            else:
+                put((organization_id, _DONE, count, None))
+
+        futures = [executor.submit(work, organization_id, query)
+                   for organization_id, query in tasks]
+        remaining = len(futures)
+        try:
+            while remaining:
+                try:
+                    item = queue.get(timeout=_POLL_INTERVAL)
+                except Empty:
+                    continue
+                if len(item) > 2:
+                    remaining -= 1
+                yield item
+        finally:
+            stop.set()
+            for future in futures:
+                future.cancel()
+
+    def iter_unordered(self, organization_ids, query):
+        organization_ids = self._organization_ids(organization_ids)
+        from concurrent.futures import ThreadPoolExecutor  # only imported when needed
+        executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            for item in self._run(executor, [(x, query) for x in organization_ids]):
+                if len(item) > 2:
+                    self._report(item[0], item[2], item[3])
+                else:
+                    yield item
+        finally:
+            executor.shutdown(wait=False)
+
+    def iter_merged(self, organization_ids, query):
+        organization_ids = self._organization_ids(organization_ids)
+        sortBy = query['sortBy']
+        fromDate = parse_date(query['fromDate']) if query['fromDate'] else None
+        toDate = parse_date(query['toDate']) if query['toDate'] else None
+        from concurrent.futures import ThreadPoolExecutor  # only imported when needed
+        executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        try:
+            # find out which dates have alerts on each organization
+            futures = [(x, executor.submit(self._connection.list_organization_alert_dates, x,
+                                           sortBy))
+                       for x in organization_ids]
+            dates = {}
+            for organization_id, future in futures:
+                try:
+                    dates[organization_id] = set(
+                        d for d in future.result()
+                        if (fromDate is None or d >= fromDate) and (toDate is None or d <= toDate))
+                except Exception as e:
+                    self._report(organization_id, 0, e)
+            for organization_id in [x for x in dates if not dates[x]]:
+                del dates[organization_id]
+                self._report(organization_id, 0, None)
+            counts = dict((x, 0) for x in dates)
+
+            # fetch one date at a time from all organizations that have alerts on it
+            for date in sorted(set().union(*dates.values())):
+                tasks = []
+                for organization_id in sorted(dates):
+                    if date in dates[organization_id]:
+                        date_query = dict(query)
+                        date_query['fromDate'] = date_query['toDate'] = date
+                        tasks.append((organization_id, date_query))
+                for item in self._run(executor, tasks):
+                    if len(item) == 2:
+                        counts[item[0]] += 1
+                        yield item
+                        continue
+                    organization_id, _, _, error = item
+                    dates[organization_id].discard(date)
+                    if error is not None or not dates[organization_id]:
+                        # organization is finished, either successfully or not
+                        del dates[organization_id]
+                        self._report(organization_id, counts[organization_id], error)
+        finally:
+            executor.shutdown(wait=False)
@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements helpers to safely share state files between processes: atomic
+replacement of file contents and advisory file locks.
+"""
+from __future__ import absolute_import
+
+import errno
+import json
+import os
+import tempfile
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+def replace(src, dst):
+    """Atomically replaces dst with src, where supported by the platform."""
+    if hasattr(os, 'replace'):
+        os.replace(src, dst)
+    else:
+        if os.name == 'nt' and os.path.exists(dst):
+            os.remove(dst)
+        os.rename(src, dst)
+
+
+def write_atomic(filename, data, fsync=False):
+    """Writes a file by writing to a temporary file on the same directory and then renaming it,
+    so that readers see either the previous or the new contents, never a partial file. The file
+    is only readable by the current user.
+    :param filename: name of the file to write
+    :param data: string or bytes to write
+    :param fsync: if True, data is flushed to disk before the rename, so the new contents also
+    survive a system crash
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    fd, tmpname = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(filename),
+                                   suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb' if isinstance(data, bytes) else 'w') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        replace(tmpname, filename)
+    except Exception:
+        os.remove(tmpname)
+        raise
+
+
+def write_json(filename, data, fsync=False):
+    """Atomically writes an object as a JSON file, see write_atomic."""
+    write_atomic(filename, json.dumps(data), fsync)
+
+
+class FileLock(object):
+    """Advisory inter-process lock based on a lock file, to be used as a context manager. On
+    platforms without fcntl or msvcrt, locking is a no-op."""
+
+    def __init__(self, filename, timeout=None, poll_interval=0.05):
+        """Initializes the lock, without acquiring it.
+        :param filename: name of the lock file, created if needed
+        :param timeout: maximum number of seconds to wait for the lock, or None to wait forever
+        :param poll_interval: seconds to wait between attempts when a timeout is set
+        """
+        self.filename = filename
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+        self._fd = None
+
+    def _try_lock(self, blocking):
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            fcntl.flock(self._fd, flags)
+        elif msvcrt is not None:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+
+    def acquire(self):
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._fd = os.open(self.filename, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            if self.timeout is None:
+                self._try_lock(True)
+                return
+            deadline = time.time() + self.timeout
+            while True:
+                try:
+                    self._try_lock(False)
+                    return
+                except (IOError, OSError) as e:
+                    if e.errno not in (errno.EACCES, errno.EAGAIN, errno.EDEADLK) \
+                            or time.time() >= deadline:
+                        raise
+                time.sleep(self.poll_interval)
+        except Exception:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def release(self):
+        if self._fd is None:
+            return
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
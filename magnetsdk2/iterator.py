@@ -3,15 +3,91 @@
 This module allows persistent iteration of alerts. Some use cases include opening tickets based
 on new alerts, or even automating responses for some high-confidence alerts.
 """
+from __future__ import absolute_import
+
 import json
+import logging
+import threading
+import time
 from abc import ABCMeta, abstractmethod
-from collections import Iterable, Iterator
+from base64 import b64decode, b64encode
+from bisect import bisect_left
 from os.path import isfile
 
-from six import python_2_unicode_compatible
+import six
+from six import integer_types, python_2_unicode_compatible
+
+try:
+    from collections.abc import Iterable, Iterator
+except ImportError:
+    from collections import Iterable, Iterator
 
+from magnetsdk2.alertids import AlertIdSet
 from magnetsdk2.connection import Connection
-from magnetsdk2.validation import is_valid_uuid, parse_date
+from magnetsdk2.files import FileLock, write_json
+from magnetsdk2.validation import are_valid_uuids, is_valid_uuid, parse_date
+
+
+@python_2_unicode_compatible
+class AlertDateIndex(object):
+    """Sorted list of the batch dates for which an organization has alerts, along with the ETag
+    the API returned them with, so that refreshing it is a conditional request that only
+    downloads the dates when they have changed."""
+
+    def __init__(self, dates=None, etag=None):
+        """Initializes an alert date index.
+        :param dates: optional iterable with batch dates in ISO 8601 format
+        :param etag: the ETag of the API response the dates came from, if any
+        """
+        self._dates = sorted(parse_date(x) for x in dates) if dates else []
+        self._etag = etag
+        self.changed = False
+
+    @property
+    def dates(self):
+        """A sorted list of the batch dates in ISO 8601 format."""
+        return self._dates
+
+    @property
+    def etag(self):
+        return self._etag
+
+    def since(self, date):
+        """Returns the sorted list of batch dates that are the same or later than a date, or all
+        of them if date is None."""
+        if date is None:
+            return list(self._dates)
+        return self._dates[bisect_left(self._dates, parse_date(date)):]
+
+    def refresh(self, connection, organization_id):
+        """Updates the dates from the API, which only sends them if they changed since they
+        were last retrieved.
+        :param connection: an instance of magnetsdk2.Connection
+        :param organization_id: a string containing an organization ID in UUID format
+        :return: True if the dates were updated, False if they had not changed
+        """
+        dates, etag = connection.poll_organization_alert_dates(organization_id, 'batchDate',
+                                                               self._etag)
+        if dates is None:
+            return False
+        dates = sorted(dates)
+        updated = dates != self._dates
+        self.changed = self.changed or updated or etag != self._etag
+        self._dates = dates
+        self._etag = etag
+        return updated
+
+    def as_dict(self):
+        """Returns the index as a JSON-serializable dict."""
+        return {'dates': self._dates, 'etag': self._etag}
+
+    @classmethod
+    def from_dict(cls, data):
+        """Creates an index from a dict returned by as_dict."""
+        return cls(data.get('dates'), data.get('etag'))
+
+    def __str__(self):
+        return "%s(dates=%d, etag=%s)" % (self.__class__.__name__, len(self._dates), self._etag)
 
 
 @python_2_unicode_compatible
@@ -40,29 +116,49 @@ class PersistenceEntry(object):
     @property
     def latest_alert_ids(self):
         """A set of string in UUID format that indicate which alerts on the latest batch date
-        have already been processed."""
+        have already been processed, or a magnetsdk2.alertids.AlertIdSet if one was assigned,
+        which takes less memory but is slower to look up."""
         return self._latest_alert_ids
 
     @latest_alert_ids.setter
     def latest_alert_ids(self, latest_alert_ids):
         if latest_alert_ids is None:
-            self._latest_alert_ids = set()
+            # an AlertIdSet in use is replaced with an empty one, so the entry stays compact
+            self._latest_alert_ids = self._latest_alert_ids.__class__()
+        elif isinstance(latest_alert_ids, AlertIdSet):
+            self._latest_alert_ids = latest_alert_ids
         else:
             if not isinstance(latest_alert_ids, Iterable):
                 raise ValueError('latest alert IDs must be iterable')
-            if latest_alert_ids and not all(is_valid_uuid(x) for x in latest_alert_ids):
+            latest_alert_ids = set(latest_alert_ids)
+            if not are_valid_uuids(latest_alert_ids):
                 raise ValueError('latest alert IDs must only contain UUIDs')
-            self._latest_alert_ids = {x for x in latest_alert_ids}
+            self._latest_alert_ids = latest_alert_ids
 
     def add_alert_id(self, alert_id):
         if not is_valid_uuid(alert_id):
             raise ValueError("invalid alert ID")
         self._latest_alert_ids.add(alert_id)
 
-    def __init__(self, organization_id, latest_batch_date=None, latest_alert_ids=None):
+    @property
+    def alert_dates(self):
+        """An AlertDateIndex of the organization's batch dates, or None if they were never
+        retrieved."""
+        return self._alert_dates
+
+    @alert_dates.setter
+    def alert_dates(self, alert_dates):
+        if alert_dates is not None and not isinstance(alert_dates, AlertDateIndex):
+            raise ValueError('alert dates must be an AlertDateIndex instance')
+        self._alert_dates = alert_dates
+
+    def __init__(self, organization_id, latest_batch_date=None, latest_alert_ids=None,
+                 alert_dates=None):
         if not is_valid_uuid(organization_id):
             raise ValueError('invalid organization ID')
         self._organization_id = organization_id
+        self._alert_dates = None
+        self.alert_dates = alert_dates
 
         self._latest_alert_ids = set()
         self._latest_batch_date = None
@@ -75,6 +171,85 @@ class PersistenceEntry(object):
                   self.latest_alert_ids)
 
 
+class _Prefetcher(object):
+    """Retrieves all alerts of upcoming batch dates of an organization on background threads,
+    holding at most max_alerts of them in memory."""
+
+    def __init__(self, connection, organization_id, depth, max_alerts, page_size):
+        self._connection = connection
+        self._organization_id = organization_id
+        self._depth = depth
+        self._max_alerts = max_alerts
+        self._page_size = page_size
+        from concurrent.futures import ThreadPoolExecutor  # only imported when needed
+        self._executor = ThreadPoolExecutor(max_workers=depth)
+        self._futures = {}
+        self._lock = threading.Lock()
+        self._buffered = 0
+        self._closed = False
+        self._logger = logging.getLogger('magnetsdk2')
+
+    def schedule(self, dates):
+        """Starts retrieving the first depth dates of a sorted list of upcoming dates, and
+        discards those retrieved for dates no longer in it."""
+        wanted = dates[:self._depth]
+        for date in [x for x in self._futures if x not in wanted]:
+            self._discard(self._futures.pop(date))
+        for date in wanted:
+            if date not in self._futures:
+                self._futures[date] = self._executor.submit(self._fetch, date)
+
+    def take(self, date):
+        """Returns the list of alerts of a date, waiting for them to be retrieved if needed, or
+        None if the date wasn't scheduled, held too many alerts or could not be retrieved."""
+        future = self._futures.pop(date, None)
+        if future is None:
+            return None
+        try:
+            alerts = future.result()
+        except Exception as e:
+            self._logger.debug('prefetch of batch date %s failed: %s', date, e)
+            return None
+        self._release(future)
+        return alerts
+
+    def _fetch(self, date):
+        alerts = []
+        try:
+            for alert in self._connection.iter_organization_alerts(
+                    organization_id=self._organization_id, fromDate=date, toDate=date,
+                    sortBy='batchDate', page_size=self._page_size):
+                with self._lock:
+                    if self._closed or self._buffered >= self._max_alerts:
+                        self._buffered -= len(alerts)
+                        return None
+                    self._buffered += 1
+                alerts.append(alert)
+        except Exception:
+            # _release skips failed futures, so the alerts counted so far are given back here
+            with self._lock:
+                self._buffered -= len(alerts)
+            raise
+        return alerts
+
+    def _release(self, future):
+        if not future.cancelled() and future.exception() is None and future.result() is not None:
+            with self._lock:
+                self._buffered -= len(future.result())
+
+    def _discard(self, future):
+        if not future.cancel():
+            future.add_done_callback(self._release)
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        for future in self._futures.values():
+            self._discard(future)
+        self._futures = {}
+        self._executor.shutdown(wait=False)
+
+
 @python_2_unicode_compatible
 class AbstractPersistentAlertIterator(Iterator):
     """Abstract class that encapsulates the logic of walking through an organization's alerts in
@@ -83,11 +258,27 @@ class AbstractPersistentAlertIterator(Iterator):
 
     __metaclass__ = ABCMeta
 
-    def __init__(self, connection, organization_id, start_date=None):
+    def __init__(self, connection, organization_id, start_date=None, stream=False,
+                 page_size=None, checkpoint_every=None, checkpoint_interval=None,
+                 before_checkpoint=None, prefetch=0, prefetch_max_alerts=10000):
         """Initializes a persistent alert iterator.
         :param connection: an instance of magnetsdk2.Connection
         :param organization_id: a string containing an organization ID in UUID format
         :param start_date: optional date that represents the initial batch date to load alerts from
+        :param stream: if False, all unseen alerts of a batch date are loaded before the first one
+        is returned; if True, alerts are returned as each page is downloaded and decoded, so that
+        at most one page of alerts is held in memory
+        :param page_size: number of alerts per page, defaults to the connection's page size
+        :param checkpoint_every: if provided, the state is saved automatically once this number of
+        alerts has been returned since the last save
+        :param checkpoint_interval: if provided, the state is saved automatically once this number
+        of seconds has passed since the last save
+        :param before_checkpoint: optional callable invoked before each automatic save, e.g. to
+        flush output
+        :param prefetch: number of upcoming batch dates whose alerts are retrieved on background
+        threads while the alerts of the current one are being processed
+        :param prefetch_max_alerts: maximum number of prefetched alerts held in memory; dates with
+        more alerts than fit are retrieved when they are reached instead
         """
         if not isinstance(connection, Connection):
             raise ValueError('invalid connection')
@@ -103,6 +294,28 @@ class AbstractPersistentAlertIterator(Iterator):
             self._start_date = None
         self._persistence_entry = None
         self._alerts = []
+        self._stream = bool(stream)
+        self._page_size = page_size
+        self._streamed = None
+
+        if checkpoint_every is not None and (not isinstance(checkpoint_every, integer_types)
+                                             or checkpoint_every < 1):
+            raise ValueError('checkpoint_every must be a positive integer')
+        if checkpoint_interval is not None and checkpoint_interval <= 0:
+            raise ValueError('checkpoint_interval must be positive')
+        self._checkpoint_every = checkpoint_every
+        self._checkpoint_interval = checkpoint_interval
+        self._before_checkpoint = before_checkpoint
+        self._unsaved = 0
+        self._saved_at = time.time()
+
+        if not isinstance(prefetch, integer_types) or prefetch < 0:
+            raise ValueError('prefetch must be a non-negative integer')
+        if not isinstance(prefetch_max_alerts, integer_types) or prefetch_max_alerts < 1:
+            raise ValueError('prefetch_max_alerts must be a positive integer')
+        self._prefetch = prefetch
+        self._prefetch_max_alerts = prefetch_max_alerts
+        self._prefetcher = None
 
     @property
     def organization_id(self):
@@ -116,6 +329,10 @@ class AbstractPersistentAlertIterator(Iterator):
     def connection(self):
         return self._connection
 
+    @property
+    def stream(self):
+        return self._stream
+
     @property
     def persistence_entry(self):
         if not self._persistence_entry:
@@ -152,30 +369,48 @@ class AbstractPersistentAlertIterator(Iterator):
     def __iter__(self):
         return self
 
+    def _candidate_dates(self):
+        # get the candidate dates in order, and discard the ones we've already fully processed;
+        # the date index saved with the state only downloads them again when they change
+        persistence_entry = self.persistence_entry
+        if persistence_entry.alert_dates is None:
+            persistence_entry.alert_dates = AlertDateIndex()
+        persistence_entry.alert_dates.refresh(self.connection, persistence_entry.organization_id)
+        return persistence_entry.alert_dates.since(persistence_entry.latest_batch_date)
+
+    def _date_alerts(self, dates, i, stream=False):
+        """Returns an iterable over the alerts of the i-th of the candidate dates, which were
+        prefetched if prefetching is enabled, and starts prefetching the dates after it."""
+        alerts = None
+        if self._prefetch:
+            if self._prefetcher is None:
+                self._prefetcher = _Prefetcher(self._connection, self._organization_id,
+                                               self._prefetch, self._prefetch_max_alerts,
+                                               self._page_size)
+            alerts = self._prefetcher.take(dates[i])
+            self._prefetcher.schedule(dates[i + 1:])
+        if alerts is None:
+            alerts = self._connection.iter_organization_alerts(
+                organization_id=self._persistence_entry.organization_id,
+                fromDate=dates[i], toDate=dates[i], sortBy='batchDate', stream=stream,
+                page_size=self._page_size)
+        return alerts
+
     def _load_alerts(self):
         # if we already have cached alerts, do nothing
         if self._alerts:
             return
 
-        # get the candidate dates in order, and discard the ones we've already fully processed
-        dates = sorted([x for x in
-                        self.connection.list_organization_alert_dates(
-                            self.persistence_entry.organization_id,
-                            'batchDate')])
-        if self.persistence_entry.latest_batch_date:
-            dates = [x for x in dates if x >= self.persistence_entry.latest_batch_date]
-
         # loop over candidate dates
-        for d in dates:
+        dates = self._candidate_dates()
+        for i, d in enumerate(dates):
             # if candidate date is newer, reset persistence data to it
             if d != self._persistence_entry.latest_batch_date:
                 self._persistence_entry.latest_batch_date = d
                 self._persistence_entry.latest_alert_ids = None
 
             # add any alerts on the candidate date we haven't processed yet to the cache
-            for alert in self._connection.iter_organization_alerts(
-                    organization_id=self._persistence_entry.organization_id,
-                    fromDate=d, toDate=d, sortBy='batchDate'):
+            for alert in self._date_alerts(dates, i):
                 if alert['id'] not in self._persistence_entry.latest_alert_ids:
                     self._alerts.append(alert)
 
@@ -183,24 +418,86 @@ class AbstractPersistentAlertIterator(Iterator):
             if self._alerts:
                 return
 
+    def _stream_alerts(self):
+        """Generator over the unseen alerts of the candidate dates, in the order the API returns
+        them. The persistence entry only moves on to a date once every alert of the previous one
+        has been consumed, and alerts are checked against it as they are consumed, so alerts that
+        shift between pages while a date is being read are still only returned once."""
+        dates = self._candidate_dates()
+        for i, d in enumerate(dates):
+            if d != self._persistence_entry.latest_batch_date:
+                self._persistence_entry.latest_batch_date = d
+                self._persistence_entry.latest_alert_ids = None
+
+            for alert in self._date_alerts(dates, i, stream=True):
+                if alert['id'] not in self._persistence_entry.latest_alert_ids:
+                    yield alert
+
     def save(self):
         self._save()
+        self._unsaved = 0
+        self._saved_at = time.time()
+
+    def _checkpoint(self):
+        """Saves the state if an automatic checkpoint is due. Called before an alert is returned,
+        when every alert returned before it has been processed by the caller."""
+        if not self._unsaved:
+            return
+        if (self._checkpoint_every is not None and self._unsaved >= self._checkpoint_every) or \
+                (self._checkpoint_interval is not None and
+                 time.time() - self._saved_at >= self._checkpoint_interval):
+            if self._before_checkpoint is not None:
+                self._before_checkpoint()
+            self.save()
 
     def load(self):
         self._persistence_entry = None
         self._alerts = []
+        self._unsaved = 0
+        if self._streamed is not None:
+            self._streamed.close()
+            self._streamed = None
+
+    def close(self):
+        """Releases the resources held by the iterator, without saving its state."""
+        if self._streamed is not None:
+            self._streamed.close()
+            self._streamed = None
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+            self._prefetcher = None
+
+    def __enter__(self):
+        return self
 
-    def next(self):
-        if not self._alerts:
-            self._load_alerts()
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
-        if self._alerts:
-            alert = self._alerts.pop()
-            self._persistence_entry.latest_batch_date = alert['batchDate']
-            self._persistence_entry.add_alert_id(alert['id'])
-            return alert
+    def next(self):
+        self._checkpoint()
+        if self._stream:
+            if self._streamed is None:
+                self._streamed = self._stream_alerts()
+            try:
+                alert = next(self._streamed)
+            except StopIteration:
+                # start over on the next call, in case new alerts have arrived by then
+                self._streamed = None
+                raise
         else:
-            raise StopIteration
+            if not self._alerts:
+                self._load_alerts()
+            if not self._alerts:
+                raise StopIteration
+            alert = self._alerts.pop()
+
+        self._persistence_entry.latest_batch_date = alert['batchDate']
+        self._persistence_entry.add_alert_id(alert['id'])
+        self._unsaved += 1
+        return alert
+
+    def __next__(self):
+        return self.next()
 
     def __str__(self):
         return "%s(organization_id=%s, start_date=%s, persistence_entry=%s)" \
@@ -211,12 +508,31 @@ class AbstractPersistentAlertIterator(Iterator):
 @python_2_unicode_compatible
 class FilePersistentAlertIterator(AbstractPersistentAlertIterator):
     """Subclass of AbstractPersistentAlertIterator that saves the persistence state as a JSON object
-    on a given text file. Does not lock the file or otherwise prevent multiple processes corrupting
-    the state, so any such control is left up to the caller. Assumes one file per organization, as
+    on a given text file. The file is replaced atomically on each save, so a crash never leaves it
+    half-written. Unless lock is True, nothing prevents multiple processes from using the same file
+    at once, so any such control is left up to the caller. Assumes one file per organization, as
     the save method completely overwrites the file contents."""
 
     def __init__(self, filename, *args, **kwargs):
+        """Initializes a file persistent alert iterator.
+        :param filename: name of the JSON file with the persistence state
+        :param lock: if True, an advisory lock on filename + '.lock' is held from the time the
+        state is loaded until close is called, so that other processes using the same lock can't
+        use the file meanwhile
+        :param lock_timeout: maximum number of seconds to wait for the lock, or None to wait
+        forever
+        :param compact: if True, alert IDs are kept in a magnetsdk2.alertids.AlertIdSet, which
+        takes a fraction of the memory of a set but is slower to look up, and saved in its binary
+        encoding as a base64 string, which is smaller and much faster to load and save than a
+        list of strings, but can't be read by versions of the SDK before it; either format is
+        loaded
+        The remaining parameters are those of AbstractPersistentAlertIterator.
+        """
         self._filename = filename
+        lock, lock_timeout = kwargs.pop('lock', False), kwargs.pop('lock_timeout', None)
+        self._compact = bool(kwargs.pop('compact', False))
+        self._lock = FileLock(filename + '.lock', lock_timeout) if lock else None
+        self._locked = False
         super(FilePersistentAlertIterator, self).__init__(*args, **kwargs)
 
     @property
@@ -224,23 +540,270 @@ class FilePersistentAlertIterator(AbstractPersistentAlertIterator):
         return self._filename
 
     def _load(self):
+        if self._lock is not None and not self._locked:
+            try:
+                self._lock.acquire()
+            except (IOError, OSError) as e:
+                raise IOError('unable to lock %s, is another process using it? %s'
+                              % (self._filename, e))
+            self._locked = True
         if isfile(self._filename):
             with open(self._filename, 'r') as f:
                 pe = json.load(f)
+                alert_ids = pe['latest_alert_ids']
+                if isinstance(alert_ids, six.string_types):
+                    alert_ids = AlertIdSet.from_bytes(b64decode(alert_ids))
+                    if not self._compact:
+                        alert_ids = set(alert_ids)
+                elif self._compact:
+                    alert_ids = AlertIdSet(alert_ids)
+                alert_dates = pe.get('alert_dates')
+                if alert_dates is not None:
+                    alert_dates = AlertDateIndex.from_dict(alert_dates)
                 return PersistenceEntry(pe['organization_id'], pe['latest_batch_date'],
-                                        pe['latest_alert_ids'])
+                                        alert_ids, alert_dates)
+        elif self._compact:
+            return PersistenceEntry(self.organization_id, latest_alert_ids=AlertIdSet())
         else:
             return None
 
     def _save(self):
+        alert_ids = self.persistence_entry.latest_alert_ids
+        if self._compact:
+            if not isinstance(alert_ids, AlertIdSet):
+                alert_ids = AlertIdSet(alert_ids)
+            alert_ids = b64encode(alert_ids.to_bytes()).decode('ascii')
+        else:
+            alert_ids = [x for x in alert_ids]
         pe = {
             'organization_id': self.persistence_entry.organization_id,
             'latest_batch_date': self.persistence_entry.latest_batch_date,
-            'latest_alert_ids': [x for x in self.persistence_entry.latest_alert_ids]
+            'latest_alert_ids': alert_ids
         }
-        with open(self._filename, 'w') as f:
-            json.dump(pe, f)
+        if self.persistence_entry.alert_dates is not None:
+            pe['alert_dates'] = self.persistence_entry.alert_dates.as_dict()
+        write_json(self._filename, pe, fsync=True)
+
+    def close(self):
+        super(FilePersistentAlertIterator, self).close()
+        if self._locked:
+            self._lock.release()
+            self._locked = False
 
     def __str__(self):
         return super(FilePersistentAlertIterator, self).__str__()[:-1] + ", filename=%s)" \
                                                                          % self._filename
+
+
+class SQLitePersistenceStore(object):
+    """Stores the PersistenceEntry of any number of organizations in a single SQLite database in
+    WAL mode, so that several threads or processes can use it at once: readers never block, and
+    writers wait up to timeout seconds for each other. Alert IDs are stored one per row, so saving
+    only inserts the IDs added since the previous save instead of rewriting all of them."""
+
+    _SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS persistence_entry ('
+        'organization_id TEXT PRIMARY KEY, latest_batch_date TEXT)',
+        'CREATE TABLE IF NOT EXISTS latest_alert_id ('
+        'organization_id TEXT NOT NULL, alert_id TEXT NOT NULL, '
+        'PRIMARY KEY (organization_id, alert_id)) WITHOUT ROWID',
+        'CREATE TABLE IF NOT EXISTS alert_date_index ('
+        'organization_id TEXT PRIMARY KEY, dates TEXT NOT NULL, etag TEXT)'
+    )
+
+    def __init__(self, filename, timeout=30.0):
+        """Opens or creates a persistence database.
+        :param filename: name of the SQLite database file
+        :param timeout: maximum number of seconds to wait for another writer to finish
+        """
+        import sqlite3  # only imported when needed, to keep the CLI quick to start
+        self._filename = filename
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(filename, timeout=timeout, isolation_level=None,
+                                   check_same_thread=False)
+        self._db.execute('PRAGMA busy_timeout = %d' % int(timeout * 1000))
+        self._db.execute('PRAGMA journal_mode = WAL')
+        self._db.execute('PRAGMA synchronous = NORMAL')
+        # the schema is only created when missing, so that opening a database doesn't wait for
+        # writers
+        with self._transaction(write=False):
+            tables = self._db.execute("SELECT count(*) FROM sqlite_master WHERE type = 'table' "
+                                      "AND name IN ('persistence_entry', 'latest_alert_id', "
+                                      "'alert_date_index')").fetchone()[0]
+        if tables < len(self._SCHEMA):
+            with self._transaction():
+                for statement in self._SCHEMA:
+                    self._db.execute(statement)
+
+    @property
+    def filename(self):
+        return self._filename
+
+    def _transaction(self, write=True):
+        return _Transaction(self._db, self._lock, write)
+
+    def load(self, organization_id):
+        """Loads the persistence data of an organization.
+        :param organization_id: a string containing an organization ID in UUID format
+        :return: a PersistenceEntry instance, or None if nothing was saved for the organization
+        """
+        organization_id = str(organization_id)
+        with self._transaction(write=False):
+            row = self._db.execute('SELECT latest_batch_date FROM persistence_entry '
+                                   'WHERE organization_id = ?', (organization_id,)).fetchone()
+            if row is None:
+                return None
+            alert_ids = [x[0] for x in self._db.execute(
+                'SELECT alert_id FROM latest_alert_id WHERE organization_id = ?',
+                (organization_id,))]
+            index = self._db.execute('SELECT dates, etag FROM alert_date_index '
+                                     'WHERE organization_id = ?', (organization_id,)).fetchone()
+        alert_dates = AlertDateIndex(json.loads(index[0]), index[1]) if index else None
+        return PersistenceEntry(organization_id, row[0], alert_ids, alert_dates)
+
+    def save(self, persistence_entry, new_alert_ids=None, saved_batch_date=None):
+        """Saves the persistence data of an organization.
+        :param persistence_entry: the PersistenceEntry instance to save
+        :param new_alert_ids: if provided, the alert IDs added to the entry since it was last
+        saved or loaded, which are the only ones inserted if the latest batch date didn't change;
+        otherwise all of the entry's alert IDs replace the saved ones
+        :param saved_batch_date: the latest batch date of the entry when it was last saved or
+        loaded, used along with new_alert_ids
+        The entry's alert date index is only written if it changed since it was loaded.
+        """
+        organization_id = str(persistence_entry.organization_id)
+        incremental = new_alert_ids is not None \
+            and saved_batch_date == persistence_entry.latest_batch_date
+        with self._transaction():
+            self._db.execute('INSERT OR REPLACE INTO persistence_entry '
+                             '(organization_id, latest_batch_date) VALUES (?, ?)',
+                             (organization_id, persistence_entry.latest_batch_date))
+            if incremental:
+                alert_ids = new_alert_ids
+            else:
+                self._db.execute('DELETE FROM latest_alert_id WHERE organization_id = ?',
+                                 (organization_id,))
+                alert_ids = persistence_entry.latest_alert_ids
+            self._db.executemany('INSERT OR IGNORE INTO latest_alert_id '
+                                 '(organization_id, alert_id) VALUES (?, ?)',
+                                 ((organization_id, str(x)) for x in alert_ids))
+            index = persistence_entry.alert_dates
+            if index is not None and index.changed:
+                self._db.execute('INSERT OR REPLACE INTO alert_date_index '
+                                 '(organization_id, dates, etag) VALUES (?, ?, ?)',
+                                 (organization_id, json.dumps(index.dates), index.etag))
+        if index is not None:
+            index.changed = False
+
+    def delete(self, organization_id):
+        """Removes the persistence data of an organization."""
+        organization_id = str(organization_id)
+        with self._transaction():
+            for table in ('latest_alert_id', 'alert_date_index', 'persistence_entry'):
+                self._db.execute('DELETE FROM %s WHERE organization_id = ?' % table,
+                                 (organization_id,))
+
+    def organization_ids(self):
+        """Returns a list with the IDs of the organizations that have saved persistence data."""
+        with self._transaction(write=False):
+            return [x[0] for x in self._db.execute(
+                'SELECT organization_id FROM persistence_entry ORDER BY organization_id')]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        return "%s(filename=%s)" % (self.__class__.__name__, self._filename)
+
+
+class _Transaction(object):
+    """Context manager that runs statements on a SQLite connection in autocommit mode as one
+    transaction. Write transactions hold the write lock from the start so that concurrent writers
+    wait for each other instead of failing to upgrade a read lock, while read-only ones are
+    deferred, so that in WAL mode they read a consistent snapshot without taking it."""
+
+    def __init__(self, db, lock, write=True):
+        self._db = db
+        self._lock = lock
+        self._write = write
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._db.execute('BEGIN IMMEDIATE' if self._write else 'BEGIN')
+        except Exception:
+            self._lock.release()
+            raise
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            self._db.execute('COMMIT' if exc_type is None else 'ROLLBACK')
+        finally:
+            self._lock.release()
+
+
+@python_2_unicode_compatible
+class SQLitePersistentAlertIterator(AbstractPersistentAlertIterator):
+    """Subclass of AbstractPersistentAlertIterator that saves the persistence state in a
+    SQLitePersistenceStore, which can hold the state of many organizations and be shared by
+    iterators in several threads or processes, e.g.:
+
+        with SQLitePersistenceStore('persistence.db') as store:
+            for organization_id in organization_ids:
+                with SQLitePersistentAlertIterator(store, conn, organization_id) as iterator:
+                    ...
+    """
+
+    def __init__(self, store, *args, **kwargs):
+        """Initializes a SQLite persistent alert iterator.
+        :param store: a SQLitePersistenceStore instance, or the name of a database file to open
+        one on, which is then closed along with the iterator
+        The remaining parameters are those of AbstractPersistentAlertIterator.
+        """
+        if isinstance(store, SQLitePersistenceStore):
+            self._owns_store = False
+        else:
+            store = SQLitePersistenceStore(store)
+            self._owns_store = True
+        self._store = store
+        self._new_alert_ids = []
+        self._saved_batch_date = None
+        super(SQLitePersistentAlertIterator, self).__init__(*args, **kwargs)
+
+    @property
+    def store(self):
+        return self._store
+
+    def _load(self):
+        persistence_entry = self._store.load(self.organization_id)
+        self._new_alert_ids = []
+        self._saved_batch_date = persistence_entry.latest_batch_date \
+            if persistence_entry is not None else None
+        return persistence_entry
+
+    def _save(self):
+        persistence_entry = self.persistence_entry
+        self._store.save(persistence_entry, self._new_alert_ids, self._saved_batch_date)
+        self._new_alert_ids = []
+        self._saved_batch_date = persistence_entry.latest_batch_date
+
+    def next(self):
+        alert = super(SQLitePersistentAlertIterator, self).next()
+        self._new_alert_ids.append(alert['id'])
+        return alert
+
+    def close(self):
+        super(SQLitePersistentAlertIterator, self).close()
+        if self._owns_store:
+            self._store.close()
+
+    def __str__(self):
+        return super(SQLitePersistentAlertIterator, self).__str__()[:-1] + ", store=%s)" \
+                                                                           % self._store
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements structured logging for magnetsdk2: a formatter that writes each log
+record as a single line of JSON with a UTC timestamp, and a request observer that logs every
+request a Connection performs as a structured event.
+"""
+from __future__ import absolute_import
+
+import json
+import logging
+import time
+
+# name of the logger used by RequestLogger by default
+REQUEST_LOGGER = 'magnetsdk2.requests'
+
+
+class UTCFormatter(logging.Formatter):
+    """Formatter that renders timestamps in UTC, so that a trailing 'Z' can be used in the date
+    format instead of '%z', which is not portable."""
+    converter = time.gmtime
+
+
+class JSONFormatter(logging.Formatter):
+    """Formatter that writes each record as a JSON object on a single line, with the 'time' in
+    ISO 8601 UTC format, 'level', 'logger', 'message', the 'request' event logged by
+    RequestLogger, if any, and the formatted 'exception', if any."""
+    converter = time.gmtime
+
+    def format(self, record):
+        data = {
+            'time': '%s.%03dZ' % (self.formatTime(record, '%Y-%m-%dT%H:%M:%S'), record.msecs),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        request = getattr(record, 'request', None)
+        if request is not None:
+            data['request'] = request
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, separators=(',', ':'), sort_keys=True)
+
+
+class RequestLogger(object):
+    """Request observer for Connection.add_observer that logs each magnetsdk2.metrics.RequestEvent
+    with the event attached to the log record as its 'request' attribute, for JSONFormatter to
+    output. Nothing is computed unless the logger is enabled for the level in use."""
+
+    def __init__(self, logger=REQUEST_LOGGER, level=logging.INFO):
+        """Initializes a request logger.
+        :param logger: the logging.Logger instance, or name of the logger, to log to
+        :param level: the level at which requests are logged
+        """
+        if not isinstance(logger, logging.Logger):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.level = level
+
+    def __call__(self, event):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        self.logger.log(self.level, '%s %s %s in %.3fs', event.method, event.path,
+                        event.status if event.status is not None else 'failed', event.latency,
+                        extra={'request': event.as_dict()})
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements incremental decoding of JSON arrays, so that the elements of a large
+response body can be processed as soon as they arrive instead of after the whole body has been
+received and decoded.
+"""
+import codecs
+import json
+
+_WHITESPACE = ' \t\n\r'
+
+# parser states: before the opening bracket, before the first element, after a comma and after
+# an element
+_START, _FIRST, _VALUE, _SEPARATOR = range(4)
+
+
+class IncompleteJSONError(ValueError):
+    """Raised when the text ends before the JSON array is closed, as happens when a response body
+    is cut short."""
+    pass
+
+
+def iter_json_array(chunks, encoding='UTF-8', decoder=None):
+    """Generator that decodes a JSON array from an iterable of chunks of its text, yielding each
+    element as soon as it is complete. Only a single element plus one chunk are ever buffered.
+    :param chunks: iterable of bytes or strings with consecutive parts of the JSON text
+    :param encoding: encoding used to decode chunks that are bytes
+    :param decoder: json.JSONDecoder instance to decode elements with
+    :return: an iterator over the decoded elements of the array
+    """
+    decoder = decoder or json.JSONDecoder()
+    incremental = codecs.getincrementaldecoder(encoding)()
+    chunks = iter(chunks)
+    buf = ''
+    pos = 0
+    eof = False
+    state = _START
+
+    while True:
+        # skip whitespace, refilling the buffer as needed
+        while True:
+            while pos < len(buf) and buf[pos] in _WHITESPACE:
+                pos += 1
+            if pos < len(buf) or eof:
+                break
+            buf, pos, eof = _refill(buf, pos, chunks, incremental)
+        if pos >= len(buf):
+            raise IncompleteJSONError('unexpected end of JSON array')
+
+        char = buf[pos]
+        if state == _START:
+            if char != '[':
+                raise ValueError('JSON array expected')
+            state = _FIRST
+            pos += 1
+        elif char == ']' and state in (_FIRST, _SEPARATOR):
+            pos += 1
+            break
+        elif char == ',' and state == _SEPARATOR:
+            state = _VALUE
+            pos += 1
+        elif state in (_FIRST, _VALUE):
+            # an element is only known to be complete if a separator follows it, since numbers
+            # could otherwise be truncated at a chunk boundary
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                following = end
+                while following < len(buf) and buf[following] in _WHITESPACE:
+                    following += 1
+                complete = eof or (following < len(buf) and buf[following] in ',]')
+            except ValueError:
+                if not eof:
+                    complete = False
+                elif not buf.rstrip(_WHITESPACE).endswith(']'):
+                    raise IncompleteJSONError('unexpected end of JSON array')
+                else:
+                    raise
+            if not complete:
+                buf, pos, eof = _refill(buf, pos, chunks, incremental)
+                continue
+            pos = end
+            state = _SEPARATOR
+            yield value
+        else:
+            raise ValueError('unexpected character %r in JSON array' % char)
+
+    # only whitespace may follow the array
+    while True:
+        if buf[pos:].strip(_WHITESPACE):
+            raise ValueError('extra data after JSON array')
+        if eof:
+            return
+        buf, pos, eof = _refill('', 0, chunks, incremental)
+
+
+def _refill(buf, pos, chunks, incremental):
+    """Reads the next chunk, discarding the part of the buffer that was already consumed.
+    :return: a tuple with the new buffer, position and whether the end was reached
+    """
+    buf = buf[pos:]
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = incremental.decode(chunk)
+        if chunk:
+            return buf + chunk, 0, False
+    return buf + incremental.decode(b'', final=True), 0, True
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements per-request instrumentation of magnetsdk2.Connection: the RequestEvent
+objects passed to observers registered with Connection.add_observer, the HTTP adapter that
+measures how long establishing connections takes, and a MetricsAggregator observer that keeps
+latency histograms and exports them in the Prometheus text format.
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from bisect import bisect_left
+
+import six
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# seconds spent establishing connections by the request being sent on the current thread
+_timing = threading.local()
+
+
+class RequestEvent(object):
+    """Describes a single HTTP request performed by a Connection. Latencies are in seconds, and
+    those that could not be measured are None: the connect and TTFB times when the response came
+    from the cache or the request failed, and the download time of streamed responses, whose body
+    is only read later."""
+
+    def __init__(self, method, path, status=None, connect=None, ttfb=None, download=None,
+                 request_bytes=0, response_bytes=None, attempt=1, from_cache=False,
+                 throttle_wait=0.0, error=None):
+        """Initializes a request event.
+        :param method: string with the HTTP method
+        :param path: string with the path template, e.g. 'organizations/{id}/alerts'
+        :param status: the HTTP status code, or None if no response was received
+        :param connect: time spent establishing a new connection, 0 if one was reused
+        :param ttfb: time from sending the request until the response headers arrived, not
+        including connect
+        :param download: time spent reading the response body
+        :param request_bytes: size of the request body
+        :param response_bytes: size of the decoded response body
+        :param attempt: 1 for the first try of a request, 2 for the first retry and so on
+        :param from_cache: whether the response came from the HTTP cache, either directly or
+        after revalidation
+        :param throttle_wait: time spent waiting for the rate limiter before sending the request
+        :param error: the exception raised, if the request failed
+        """
+        self.method = method
+        self.path = path
+        self.status = status
+        self.connect = connect
+        self.ttfb = ttfb
+        self.download = download
+        self.request_bytes = request_bytes
+        self.response_bytes = response_bytes
+        self.attempt = attempt
+        self.from_cache = from_cache
+        self.throttle_wait = throttle_wait
+        self.error = error
+
+    @property
+    def latency(self):
+        """Total time spent on the request, not counting throttling."""
+        return sum(x for x in (self.connect, self.ttfb, self.download) if x is not None)
+
+    def as_dict(self):
+        """Returns the event as a JSON-serializable dict, with the error converted to a
+        string."""
+        return {'method': self.method, 'path': self.path, 'status': self.status,
+                'latency': self.latency, 'connect': self.connect, 'ttfb': self.ttfb,
+                'download': self.download, 'request_bytes': self.request_bytes,
+                'response_bytes': self.response_bytes, 'attempt': self.attempt,
+                'from_cache': self.from_cache, 'throttle_wait': self.throttle_wait,
+                'error': None if self.error is None else repr(self.error)}
+
+    def __repr__(self):
+        return "%s(method=%r, path=%r, status=%r, latency=%.3f, attempt=%d, from_cache=%r)" \
+               % (self.__class__.__name__, self.method, self.path, self.status, self.latency,
+                  self.attempt, self.from_cache)
+
+
+class _TimedHTTPConnection(HTTPConnection):
+    def connect(self):
+        start = time.time()
+        try:
+            super(_TimedHTTPConnection, self).connect()
+        finally:
+            _timing.connect = getattr(_timing, 'connect', 0.0) + time.time() - start
+
+
+class _TimedHTTPSConnection(HTTPSConnection):
+    def connect(self):
+        start = time.time()
+        try:
+            super(_TimedHTTPSConnection, self).connect()
+        finally:
+            _timing.connect = getattr(_timing, 'connect', 0.0) + time.time() - start
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+_TIMED_POOL_CLASSES = {'http': _TimedHTTPConnectionPool, 'https': _TimedHTTPSConnectionPool}
+
+
+class TimingAdapter(HTTPAdapter):
+    """HTTPAdapter that stores the time spent establishing a connection for each request in the
+    connect_time attribute of its response."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(TimingAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+
+    def proxy_manager_for(self, proxy, **proxy_kwargs):
+        manager = super(TimingAdapter, self).proxy_manager_for(proxy, **proxy_kwargs)
+        manager.pool_classes_by_scheme = _TIMED_POOL_CLASSES
+        return manager
+
+    def send(self, request, *args, **kwargs):
+        _timing.connect = 0.0
+        response = super(TimingAdapter, self).send(request, *args, **kwargs)
+        response.connect_time = _timing.connect
+        return response
+
+
+class _Histogram(object):
+    def __init__(self, buckets):
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, buckets, value):
+        self.counts[bisect_left(buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = ['%s="%s"' % (n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append('%s="%s"' % extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+def _format_float(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value))
+
+
+class MetricsAggregator(object):
+    """Thread-safe observer that aggregates RequestEvent objects into counters and latency
+    histograms per method, path template and status, e.g.:
+
+        metrics = MetricsAggregator()
+        conn.add_observer(metrics)
+        ...
+        print(metrics.prometheus_text())
+    """
+
+    _PHASES = ('connect', 'ttfb', 'download')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, namespace='magnetsdk2'):
+        """Initializes an aggregator.
+        :param buckets: increasing upper bounds in seconds of the latency histogram buckets
+        :param namespace: prefix of the exported metric names
+        """
+        buckets = tuple(float(x) for x in buckets)
+        if not buckets or list(buckets) != sorted(set(buckets)):
+            raise ValueError("buckets must be a non-empty increasing sequence")
+        self.buckets = buckets
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Discards all aggregated data."""
+        with self._lock:
+            self._requests = {}
+            self._latency = {}
+            self._phases = {}
+            self._request_bytes = {}
+            self._response_bytes = {}
+            self._retries = {}
+            self._throttle_wait = 0.0
+
+    def __call__(self, event):
+        status = str(event.status) if event.status is not None else 'error'
+        key = (event.method, event.path, status, 'true' if event.from_cache else 'false')
+        endpoint = (event.method, event.path)
+        with self._lock:
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._request_bytes[endpoint] = \
+                self._request_bytes.get(endpoint, 0) + (event.request_bytes or 0)
+            self._response_bytes[endpoint] = \
+                self._response_bytes.get(endpoint, 0) + (event.response_bytes or 0)
+            if event.attempt > 1:
+                self._retries[endpoint] = self._retries.get(endpoint, 0) + 1
+            self._throttle_wait += event.throttle_wait or 0.0
+            if event.from_cache and event.ttfb is None:
+                return
+            self._observe(self._latency, endpoint + (status,), event.latency)
+            for phase in self._PHASES:
+                value = getattr(event, phase)
+                if value is not None:
+                    self._observe(self._phases, endpoint + (phase,), value)
+
+    def _observe(self, histograms, key, value):
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = _Histogram(self.buckets)
+        histogram.observe(self.buckets, value)
+
+    def snapshot(self):
+        """Returns the aggregated data as a dict with the total number of 'requests', the
+        number served 'from_cache', 'retries', 'errors', 'request_bytes', 'response_bytes',
+        'throttle_wait' and, per 'METHOD path' endpoint, the request 'count' and the 'sum' of
+        latencies in seconds."""
+        with self._lock:
+            endpoints = {}
+            for (method, path, status), histogram in six.iteritems(self._latency):
+                stats = endpoints.setdefault('%s %s' % (method, path), {'count': 0, 'sum': 0.0})
+                stats['count'] += histogram.count
+                stats['sum'] += histogram.sum
+            return {
+                'requests': sum(self._requests.values()),
+                'from_cache': sum(v for k, v in six.iteritems(self._requests) if k[3] == 'true'),
+                'errors': sum(v for k, v in six.iteritems(self._requests) if k[2] == 'error'),
+                'retries': sum(self._retries.values()),
+                'request_bytes': sum(self._request_bytes.values()),
+                'response_bytes': sum(self._response_bytes.values()),
+                'throttle_wait': self._throttle_wait,
+                'endpoints': endpoints
+            }
+
+    def prometheus_text(self):
+        """Exports the aggregated data in the Prometheus text exposition format (version 0.0.4).
+        :return: a string
+        """
+        ns = self.namespace
+        lines = []
+        with self._lock:
+            self._counter(lines, ns + '_requests_total', 'Requests performed.',
+                          ('method', 'path', 'status', 'cache'), self._requests)
+            self._counter(lines, ns + '_request_bytes_total', 'Bytes sent in request bodies.',
+                          ('method', 'path'), self._request_bytes)
+            self._counter(lines, ns + '_response_bytes_total',
+                          'Bytes received in decoded response bodies.', ('method', 'path'),
+                          self._response_bytes)
+            self._counter(lines, ns + '_retries_total', 'Requests that were retries.',
+                          ('method', 'path'), self._retries)
+            lines.append('# HELP %s_throttle_wait_seconds_total Time spent waiting for the rate '
+                         'limiter.' % ns)
+            lines.append('# TYPE %s_throttle_wait_seconds_total counter' % ns)
+            lines.append('%s_throttle_wait_seconds_total %s'
+                         % (ns, _format_float(self._throttle_wait)))
+            self._histogram(lines, ns + '_request_duration_seconds',
+                            'Request latency, not including throttling.',
+                            ('method', 'path', 'status'), self._latency)
+            self._histogram(lines, ns + '_request_phase_duration_seconds',
+                            'Request latency split into connect, time to first byte and '
+                            'download.', ('method', 'path', 'phase'), self._phases)
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _counter(lines, name, help, labels, values):
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s counter' % name)
+        for key in sorted(values):
+            lines.append('%s%s %d' % (name, _labels(labels, key), values[key]))
+
+    def _histogram(self, lines, name, help, labels, histograms):
+        lines.append('# HELP %s %s' % (name, help))
+        lines.append('# TYPE %s histogram' % name)
+        for key in sorted(histograms):
+            histogram = histograms[key]
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), histogram.counts):
+                cumulative += count
+                lines.append('%s_bucket%s %d' % (name, _labels(labels, key,
+                                                               ('le', _format_float(bound))),
+                                                 cumulative))
+            lines.append('%s_sum%s %s' % (name, _labels(labels, key),
+                                          _format_float(histogram.sum)))
+            lines.append('%s_count%s %d' % (name, _labels(labels, key), histogram.count))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements the page size policies used by magnetsdk2.Connection when walking through
+paginated API resources.
+"""
+import six
+
+# page size used when none is configured, and the largest page size the SDK will ever request
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def validate_page_size(page_size):
+    """Checks that a value is either an AdaptivePageSize instance or a valid fixed page size.
+    :return: the value itself
+    """
+    if isinstance(page_size, AdaptivePageSize):
+        return page_size
+    if not isinstance(page_size, six.integer_types) or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise ValueError("page size must be an integer between 1 and %d or an "
+                         "AdaptivePageSize instance" % MAX_PAGE_SIZE)
+    return page_size
+
+
+class AdaptivePageSize(object):
+    """Page size policy that grows or shrinks the page size based on how long each page took to
+    arrive and how large it was. Since pages are addressed by number, sizes are only ever doubled
+    or halved, and only when the number of records already read is a multiple of the new size, so
+    that no record is skipped or repeated."""
+
+    def __init__(self, initial=PAGE_SIZE, minimum=25, maximum=800, target_latency=1.0,
+                 max_bytes=4 * 1024 * 1024):
+        """Initializes an adaptive page size policy.
+        :param initial: page size of the first request
+        :param minimum: smallest page size to shrink to
+        :param maximum: largest page size to grow to, at most MAX_PAGE_SIZE
+        :param target_latency: pages taking longer than this number of seconds cause the page
+        size to shrink, while pages taking less than half of it allow the page size to grow
+        :param max_bytes: pages with response bodies larger than this number of bytes cause the
+        page size to shrink, while pages smaller than half of it allow the page size to grow
+        """
+        for name, value in (('initial', initial), ('minimum', minimum), ('maximum', maximum)):
+            if not isinstance(value, six.integer_types) or not 1 <= value <= MAX_PAGE_SIZE:
+                raise ValueError("%s page size must be an integer between 1 and %d"
+                                 % (name, MAX_PAGE_SIZE))
+        if not minimum <= initial <= maximum:
+            raise ValueError("initial page size must be between the minimum and the maximum")
+        if target_latency <= 0 or max_bytes <= 0:
+            raise ValueError("target latency and maximum bytes must be positive")
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self.max_bytes = max_bytes
+
+    def next_size(self, size, offset, latency, nbytes):
+        """Computes the size of the next page.
+        :param size: the size of the page that was just read
+        :param offset: number of records read so far, which is a multiple of size
+        :param latency: seconds it took to receive the page
+        :param nbytes: size of the page response body in bytes
+        :return: the size to use for the next page
+        """
+        if latency > self.target_latency or nbytes > self.max_bytes:
+            if size % 2 == 0 and size // 2 >= self.minimum:
+                return size // 2
+        elif latency < self.target_latency / 2 and nbytes < self.max_bytes / 2:
+            if size * 2 <= self.maximum and offset % (size * 2) == 0:
+                return size * 2
+        return size
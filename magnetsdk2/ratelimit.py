@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements a client-side token bucket rate limiter, which can be shared by all
+threads and magnetsdk2.Connection instances using the same API key to avoid triggering the
+server-side throttling of the Niddel Magnet v2 API.
+"""
+from __future__ import absolute_import
+
+import threading
+import time
+from math import ceil
+
+import six
+
+_clock = getattr(time, 'monotonic', time.time)
+
+
+class TokenBucket(object):
+    """Thread-safe token bucket. Tokens are added at a constant rate up to the burst size, and
+    each request consumes one. Callers that find the bucket empty reserve a future token and are
+    told how long to wait for it, so concurrent callers are served in arrival order."""
+
+    def __init__(self, rate, burst=None):
+        """Initializes a token bucket that starts full.
+        :param rate: number of requests per second allowed in the long run
+        :param burst: maximum number of requests that can be performed back to back, defaults to
+        the rate rounded up and at least 1
+        """
+        self._lock = threading.Lock()
+        self._tokens = 0.0
+        self._updated = _clock()
+        self._waits = 0
+        self._wait_time = 0.0
+        self._acquired = 0
+        self.configure(rate, burst)
+        self._tokens = float(self.burst)
+
+    def configure(self, rate, burst=None):
+        """Changes the rate and burst size of the bucket.
+        :param rate: number of requests per second allowed in the long run
+        :param burst: maximum number of requests that can be performed back to back
+        """
+        if not isinstance(rate, six.integer_types + (float,)) or rate <= 0:
+            raise ValueError("rate must be a positive number")
+        if burst is None:
+            burst = max(int(ceil(rate)), 1)
+        if not isinstance(burst, six.integer_types) or burst < 1:
+            raise ValueError("burst must be a positive integer")
+        with self._lock:
+            self.rate = float(rate)
+            self.burst = burst
+            self._tokens = min(self._tokens, float(burst))
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, tokens=1):
+        """Computes how long a caller would have to wait for tokens, without consuming them.
+        :param tokens: number of tokens needed
+        :return: the delay in seconds
+        """
+        with self._lock:
+            self._refill(_clock())
+            return max(tokens - self._tokens, 0.0) / self.rate
+
+    def reserve(self, tokens=1):
+        """Consumes tokens, possibly borrowing from the future.
+        :param tokens: number of tokens needed
+        :return: the delay in seconds the caller must wait before proceeding
+        """
+        with self._lock:
+            self._refill(_clock())
+            self._tokens -= tokens
+            self._acquired += tokens
+            delay = max(-self._tokens, 0.0) / self.rate
+            if delay > 0:
+                self._waits += 1
+                self._wait_time += delay
+            return delay
+
+    def acquire(self, tokens=1):
+        """Consumes tokens, sleeping until they are available.
+        :param tokens: number of tokens needed
+        :return: the time in seconds spent waiting
+        """
+        delay = self.reserve(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def stats(self):
+        """Returns a snapshot of the bucket usage.
+        :return: a dict with the number of tokens 'acquired', how many acquisitions had to wait
+        in 'waits' and the total 'wait_time' in seconds
+        """
+        with self._lock:
+            return {'acquired': self._acquired, 'waits': self._waits,
+                    'wait_time': self._wait_time}
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key, rate=None, burst=None):
+    """Returns the token bucket shared by everyone in this process using a given API key.
+    :param api_key: string containing the API key
+    :param rate: if provided, creates the bucket with this rate if it does not exist yet, or
+    reconfigures the existing one
+    :param burst: maximum number of requests that can be performed back to back
+    :return: a TokenBucket instance, or None if no rate was ever configured for the API key
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(api_key)
+        if rate is None:
+            return limiter
+        if limiter is None:
+            limiter = _limiters[api_key] = TokenBucket(rate, burst)
+            return limiter
+    if limiter.rate != rate or (burst is not None and limiter.burst != burst):
+        limiter.configure(rate, burst)
+    return limiter
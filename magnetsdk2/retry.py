@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements the retry policy, circuit breaker and retry counters used by
+magnetsdk2.Connection to deal with transient API and network failures.
+"""
+from __future__ import absolute_import
+
+import random
+import threading
+import time
+from email.utils import mktime_tz, parsedate_tz
+
+import six
+from requests.exceptions import RequestException
+
+_RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(RequestException):
+    """Raised instead of performing a request when the circuit breaker for its endpoint is open
+    because the API has been failing consistently."""
+    pass
+
+
+class RetryPolicy(object):
+    """Encapsulates how many times and how long to wait before retrying a request. Failures due to
+    retryable HTTP status codes and due to network exceptions have separate retry budgets, and
+    delays grow exponentially with optional jitter, unless the server explicitly provides one using
+    the Retry-After header."""
+
+    def __init__(self, status_retries=4, error_retries=4, backoff_factor=0.5, max_backoff=30.0,
+                 jitter=True, retry_statuses=_RETRY_STATUSES, retry_exceptions=(RequestException,),
+                 respect_retry_after=True, max_retry_after=120.0):
+        """Initializes a retry policy.
+        :param status_retries: how many times to retry a request that got a retryable status code
+        :param error_retries: how many times to retry a request that raised a network exception
+        :param backoff_factor: delay in seconds before the first retry, doubled on every retry
+        :param max_backoff: maximum delay in seconds between two attempts
+        :param jitter: if True, each delay is randomized between zero and its computed value
+        :param retry_statuses: HTTP status codes that should be retried
+        :param retry_exceptions: exception classes that should be retried
+        :param respect_retry_after: if True, the Retry-After header overrides shorter delays
+        :param max_retry_after: maximum delay in seconds accepted from a Retry-After header
+        """
+        for name, value in (('status_retries', status_retries), ('error_retries', error_retries)):
+            if not isinstance(value, six.integer_types) or value < 0:
+                raise ValueError("%s must be a non-negative integer" % name)
+        if backoff_factor < 0 or max_backoff < 0 or max_retry_after < 0:
+            raise ValueError("delays must not be negative")
+        self.status_retries = status_retries
+        self.error_retries = error_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.retry_exceptions = tuple(retry_exceptions)
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def is_retryable_status(self, status_code):
+        return status_code in self.retry_statuses
+
+    def is_retryable_exception(self, exception):
+        return isinstance(exception, self.retry_exceptions) \
+               and not isinstance(exception, CircuitOpenError)
+
+    def backoff(self, attempt):
+        """Computes the exponential backoff delay before a given retry.
+        :param attempt: the number of the retry about to be performed, starting at 1
+        :return: the delay in seconds
+        """
+        delay = min(self.max_backoff, self.backoff_factor * (2 ** (attempt - 1)))
+        if self.jitter:
+            delay = random.uniform(0, delay)
+        return delay
+
+    @staticmethod
+    def retry_after(response):
+        """Extracts the delay requested by the server through the Retry-After header.
+        :param response: a requests.Response object
+        :return: the delay in seconds, or None if the header is missing or invalid
+        """
+        value = response.headers.get('Retry-After') if response is not None else None
+        if not value:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return float(value)
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(mktime_tz(parsed) - time.time(), 0.0)
+
+    def delay(self, attempt, response=None):
+        """Computes how long to wait before a given retry.
+        :param attempt: the number of the retry about to be performed, starting at 1
+        :param response: the requests.Response object that triggered the retry, if any
+        :return: the delay in seconds
+        """
+        delay = self.backoff(attempt)
+        if self.respect_retry_after:
+            retry_after = self.retry_after(response)
+            if retry_after is not None:
+                delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+
+class CircuitBreaker(object):
+    """Per-endpoint circuit breaker. After a number of consecutive failed requests to an endpoint
+    the circuit opens and requests fail immediately with CircuitOpenError. Once the reset timeout
+    expires, a single trial request is let through, and its outcome either closes the circuit or
+    keeps it open for another timeout period."""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        """Initializes a circuit breaker.
+        :param failure_threshold: number of consecutive failures that opens an endpoint's circuit
+        :param reset_timeout: seconds to wait before letting a trial request through
+        """
+        if not isinstance(failure_threshold, six.integer_types) or failure_threshold < 1:
+            raise ValueError("failure threshold must be a positive integer")
+        if reset_timeout < 0:
+            raise ValueError("reset timeout must not be negative")
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = {}
+        self._opened_at = {}
+        self._trials = set()
+
+    def is_open(self, endpoint):
+        """Checks whether requests to an endpoint are currently failing fast."""
+        with self._lock:
+            return endpoint in self._opened_at
+
+    def before_request(self, endpoint):
+        """Must be called before each request to an endpoint.
+        :raise CircuitOpenError: if the circuit is open and requests should fail fast
+        """
+        with self._lock:
+            opened_at = self._opened_at.get(endpoint)
+            if opened_at is None:
+                return
+            if endpoint not in self._trials and time.time() - opened_at >= self.reset_timeout:
+                self._trials.add(endpoint)
+                return
+        raise CircuitOpenError('circuit open for endpoint %s after %d consecutive failures'
+                               % (endpoint, self.failure_threshold))
+
+    def record_success(self, endpoint):
+        with self._lock:
+            self._failures.pop(endpoint, None)
+            self._opened_at.pop(endpoint, None)
+            self._trials.discard(endpoint)
+
+    def record_failure(self, endpoint):
+        with self._lock:
+            failures = self._failures.get(endpoint, 0) + 1
+            self._failures[endpoint] = failures
+            if endpoint in self._trials or failures >= self.failure_threshold:
+                self._opened_at[endpoint] = time.time()
+                self._trials.discard(endpoint)
+
+
+class RetryStats(object):
+    """Thread-safe counters of the retries performed by a connection and their causes."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._retries = 0
+            self._statuses = {}
+            self._errors = {}
+            self._exhausted = 0
+            self._circuit_open = 0
+
+    def record_status(self, status_code):
+        with self._lock:
+            self._retries += 1
+            self._statuses[status_code] = self._statuses.get(status_code, 0) + 1
+
+    def record_error(self, exception):
+        name = exception.__class__.__name__
+        with self._lock:
+            self._retries += 1
+            self._errors[name] = self._errors.get(name, 0) + 1
+
+    def record_exhausted(self):
+        with self._lock:
+            self._exhausted += 1
+
+    def record_circuit_open(self):
+        with self._lock:
+            self._circuit_open += 1
+
+    def as_dict(self):
+        """Returns a snapshot of the counters.
+        :return: a dict with the total number of 'retries', retries per HTTP status code in
+        'statuses', retries per exception class name in 'errors', the number of requests that
+        'exhausted' their retry budget and the number that failed fast due to an open circuit
+        """
+        with self._lock:
+            return {
+                'retries': self._retries,
+                'statuses': dict(self._statuses),
+                'errors': dict(self._errors),
+                'exhausted': self._exhausted,
+                'circuit_open': self._circuit_open
+            }
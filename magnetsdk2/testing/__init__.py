@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the Niddel Magnet v2 API, serving generated datasets of configurable size
+with optional latency and failure injection, so that code using magnetsdk2 can be tested and
+benchmarked offline.
+"""
+from magnetsdk2.testing.dataset import Dataset
+from magnetsdk2.testing.server import Faults, StubServer
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Runs a stub Niddel Magnet v2 API server until interrupted, e.g. to point the 'niddel' CLI at it
+through the MAGNETSDK_API_ENDPOINT and MAGNETSDK_API_KEY environment variables.
+"""
+import argparse
+import logging
+
+from magnetsdk2.testing import Dataset, Faults, StubServer
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='python -m magnetsdk2.testing',
+                                     description='Runs a stub Niddel Magnet v2 API server')
+    parser.add_argument("--host", default='127.0.0.1', help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--organizations", type=int, default=3, help="number of organizations")
+    parser.add_argument("--alerts", type=int, default=1000,
+                        help="number of alerts of each organization")
+    parser.add_argument("--dates", type=int, default=10,
+                        help="number of batch dates the alerts are spread over")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the generated data")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before answering each request")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="probability of answering with a 429 or 5xx error")
+    parser.add_argument("--truncate-rate", type=float, default=0.0,
+                        help="probability of truncating a response body")
+    parser.add_argument("--api-key", default='stub-api-key',
+                        help="API key requests must provide")
+    args = parser.parse_args()
+
+    logger = logging.getLogger('magnetsdk2')
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.DEBUG)
+    faults = None
+    if args.error_rate or args.truncate_rate:
+        faults = Faults(error_rate=args.error_rate, truncate_rate=args.truncate_rate,
+                        seed=args.seed)
+    server = StubServer(Dataset(args.organizations, args.alerts, args.dates, seed=args.seed),
+                        latency=args.latency, faults=faults, api_key=args.api_key,
+                        host=args.host, port=args.port)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
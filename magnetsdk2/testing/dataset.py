@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements the synthetic data served by magnetsdk2.testing.StubServer. Alerts are
+generated on demand from their position, so datasets with millions of alerts cost no memory, and
+the same parameters always produce the same data.
+"""
+import datetime
+import uuid
+
+import six
+
+_EPOCH = datetime.date(2017, 1, 1)
+_STATUSES = ('new', 'under_investigation', 'rejected', 'resolved')
+_PROTOCOLS = (('tcp', 'https'), ('tcp', 'http'), ('udp', 'dns'), ('tcp', 'smtp'))
+_TAGS = ('botnet', 'c2', 'exfiltration', 'malware', 'phishing', 'scanner')
+
+
+def _ceil_div(a, b):
+    return -(-a // b)
+
+
+class Dataset(object):
+    """Organizations, alerts, white/black lists and users served by the stub server. Each
+    organization has the same number of alerts, spread evenly over consecutive batch dates starting
+    at 2017-01-02, with log dates one day before their batch dates."""
+
+    def __init__(self, organizations=3, alerts=1000, dates=10, list_entries=5, seed=0):
+        """Initializes a dataset.
+        :param organizations: number of organizations
+        :param alerts: number of alerts of each organization
+        :param dates: number of batch dates the alerts of each organization are spread over
+        :param list_entries: number of white list and of black list entries of each organization
+        :param seed: integer that varies the generated values
+        """
+        for name, value in (('organizations', organizations), ('dates', dates)):
+            if not isinstance(value, six.integer_types) or value < 1:
+                raise ValueError("%s must be a positive integer" % name)
+        for name, value in (('alerts', alerts), ('list_entries', list_entries)):
+            if not isinstance(value, six.integer_types) or value < 0:
+                raise ValueError("%s must be a non-negative integer" % name)
+        self.alerts_per_organization = alerts
+        self.dates = dates
+        self.list_entries = list_entries
+        self.seed = seed
+        self.organizations = [{'id': str(uuid.UUID(int=(seed << 96) | (i + 1))),
+                               'name': 'Organization %d' % (i + 1),
+                               'createdAt': '2016-12-01T00:00:00Z'}
+                              for i in range(organizations)]
+        self._index = dict((x['id'], i) for i, x in enumerate(self.organizations))
+
+    def organization_index(self, organization_id):
+        """:return: the position of an organization, or None if it does not exist"""
+        return self._index.get(str(organization_id).lower())
+
+    def me(self):
+        return {'id': str(uuid.UUID(int=(self.seed << 96) | 0xffffffff)),
+                'email': 'stub@example.com', 'name': 'Stub User',
+                'defaultOrganizationId': self.organizations[0]['id']}
+
+    def batch_date(self, index):
+        """:return: the ISO 8601 batch date with the given position"""
+        return (_EPOCH + datetime.timedelta(days=index + 1)).isoformat()
+
+    def alert_dates(self, sortBy='logDate'):
+        """:return: the ISO 8601 dates for which each organization has alerts"""
+        shift = 1 if sortBy == 'batchDate' else 0
+        return [(_EPOCH + datetime.timedelta(days=d + shift)).isoformat()
+                for d in range(self.dates) if self._date_range(d)[0] < self._date_range(d)[1]]
+
+    def _date_range(self, d):
+        n = self.alerts_per_organization
+        return _ceil_div(d * n, self.dates), _ceil_div((d + 1) * n, self.dates)
+
+    def _date_index(self, value, sortBy, upper):
+        """Converts a date filter into a batch date position."""
+        date = datetime.datetime.strptime(value[:10], '%Y-%m-%d').date()
+        d = (date - _EPOCH).days - (1 if sortBy == 'batchDate' else 0)
+        return min(max(d, -1), self.dates - 1) if upper else min(max(d, 0), self.dates)
+
+    def alert_range(self, fromDate=None, toDate=None, sortBy='logDate'):
+        """Computes which alerts of an organization have dates within a range.
+        :return: the start and stop positions of the alerts
+        """
+        first = self._date_index(fromDate, sortBy, False) if fromDate else 0
+        last = self._date_index(toDate, sortBy, True) if toDate else self.dates - 1
+        if last < first:
+            return 0, 0
+        return self._date_range(first)[0], self._date_range(last)[1]
+
+    def alert(self, organization, i):
+        """Generates an alert.
+        :param organization: position of the organization
+        :param i: position of the alert within the organization, in increasing date order
+        :return: a dict representing the alert
+        """
+        d = i * self.dates // self.alerts_per_organization
+        batch_date = self.batch_date(d)
+        log_date = (_EPOCH + datetime.timedelta(days=d)).isoformat()
+        h = (i * 2654435761 + organization * 40503 + self.seed) & 0xffffffff
+        seconds = h % 86000
+        l4, l7 = _PROTOCOLS[h % len(_PROTOCOLS)]
+        return {
+            'id': str(uuid.UUID(int=((self.seed << 96) | ((organization + 1) << 64) | (i + 1)))),
+            'organizationId': self.organizations[organization]['id'],
+            'batchDate': batch_date,
+            'logDate': log_date,
+            'aggFirst': '%02d:%02d:%02d' % (seconds // 3600, seconds // 60 % 60, seconds % 60),
+            'aggLast': '%02d:%02d:%02d' % ((seconds + 300) // 3600, (seconds + 300) // 60 % 60,
+                                           seconds % 60),
+            'aggCount': 1 + h % 50,
+            'confidence': h % 101,
+            'status': _STATUSES[i % len(_STATUSES)],
+            'netSrcIp': '10.%d.%d.%d' % (organization % 256, (i >> 8) % 256, i % 256),
+            'netSrcIpRdomain': 'host-%d.corp.example.com' % (i % 1000),
+            'netDstIp': '198.51.100.%d' % (h % 256),
+            'netDstDomain': 'c%d.example.net' % (h % 5000),
+            'netDstPort': 443 if l7 == 'https' else 80,
+            'netL4proto': l4,
+            'netL7proto': l7,
+            'netBlocked': bool(h & 1),
+            'netDeviceTypes': ['proxy', 'firewall'][:1 + h % 2],
+            'tags': sorted(set([_TAGS[h % len(_TAGS)], _TAGS[(h >> 4) % len(_TAGS)]])),
+            'createdAt': batch_date + 'T06:00:00Z',
+            'updatedAt': batch_date + 'T06:00:00Z'
+        }
+
+    def iter_alerts(self, organization, fromDate=None, toDate=None, sortBy='logDate',
+                    status=None):
+        """Generator over the alerts of an organization that match a set of filters, in
+        increasing date order."""
+        start, stop = self.alert_range(fromDate, toDate, sortBy)
+        for i in six.moves.range(start, stop):
+            if not status or _STATUSES[i % len(_STATUSES)] in status:
+                yield self.alert(organization, i)
+
+    def list_entry(self, scope, organization, i):
+        """Generates a white or black list entry.
+        :param scope: either 'white' or 'black'
+        :param organization: position of the organization
+        :param i: position of the entry
+        """
+        kind = 2 if scope == 'white' else 3
+        return {'id': str(uuid.UUID(int=((self.seed << 96) | (kind << 80) |
+                                          ((organization + 1) << 64) | (i + 1)))),
+                'type': 'domain', 'value': '%slisted-%d.example.org' % (scope, i),
+                'createdAt': '2017-01-01T00:00:00Z'}
+
+    def list_entries_of(self, scope, organization):
+        return [self.list_entry(scope, organization, i) for i in range(self.list_entries)]
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+"""
+This module implements StubServer, a local HTTP server that stands in for the Niddel Magnet v2 API
+so that Connection, the alert iterators and the CLI can be exercised and load-tested offline.
+"""
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from itertools import islice
+
+import six
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import urlsplit, parse_qs
+
+from magnetsdk2.testing.dataset import Dataset
+
+_PAGE_SIZE = 100
+
+
+class Faults(object):
+    """Failures injected by the stub server into its responses. Each request independently
+    fails with the given probabilities, using a pseudo-random sequence determined by the seed."""
+
+    def __init__(self, error_rate=0.0, error_statuses=(429, 500, 502, 503, 504), truncate_rate=0.0,
+                 truncate_length=True, retry_after=0, seed=None):
+        """Initializes a set of faults.
+        :param error_rate: probability of answering with one of error_statuses instead
+        :param error_statuses: HTTP status codes used for injected errors
+        :param truncate_rate: probability of closing the connection half way through a response
+        body
+        :param truncate_length: if True, truncated bodies announce their full length, otherwise
+        they are sent without a Content-Length header, so that clients can only tell that they
+        were cut short from their content
+        :param retry_after: value of the Retry-After header sent with 429 and 503 errors, or None
+        to omit it
+        :param seed: seed of the pseudo-random sequence, so that runs can be repeated
+        """
+        for name, value in (('error_rate', error_rate), ('truncate_rate', truncate_rate)):
+            if not 0 <= value <= 1:
+                raise ValueError("%s must be between 0 and 1" % name)
+        if error_rate and not error_statuses:
+            raise ValueError("error statuses must be provided along with an error rate")
+        self.error_rate = error_rate
+        self.error_statuses = tuple(error_statuses)
+        self.truncate_rate = truncate_rate
+        self.truncate_length = truncate_length
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Decides which fault, if any, to inject into a response.
+        :return: a tuple with the status code to answer with instead, or None, and whether the
+        body should be truncated
+        """
+        with self._lock:
+            if self._random.random() < self.error_rate:
+                return self._random.choice(self.error_statuses), False
+            return None, self._random.random() < self.truncate_rate
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, which Nagle's algorithm would delay
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub._record_request()
+        if stub.latency:
+            time.sleep(stub.latency)
+        url = urlsplit(self.path)
+        if not url.path.startswith(stub.prefix + '/'):
+            return self._send(404, {'error': 'not found'})
+        status, truncate = stub.faults.draw() if stub.faults is not None else (None, False)
+        if status is not None:
+            stub._record_fault()
+            return self._send(status, {'error': 'injected failure'})
+        if stub.api_key is not None and self.headers.get('X-Api-Key') != stub.api_key:
+            return self._send(401, {'error': 'invalid API key'})
+
+        segments = url.path[len(stub.prefix) + 1:].rstrip('/').split('/')
+        query = parse_qs(url.query)
+        try:
+            result = stub._route(segments, query)
+        except (KeyError, ValueError, IndexError):
+            return self._send(400, {'error': 'invalid request'})
+        if result is None:
+            return self._send(404, {'error': 'not found'})
+        if isinstance(result, tuple):
+            data, etag = result
+            if etag is not None and self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            return self._send(200, data, etag=etag, truncate=truncate)
+        self._send(200, result, truncate=truncate)
+
+    def _send(self, status, data, etag=None, truncate=False):
+        body = json.dumps(data, separators=(',', ':')).encode('UTF-8')
+        self.send_response(status)
+        if status in (429, 503) and self.server.stub.faults is not None \
+                and self.server.stub.faults.retry_after is not None:
+            self.send_header('Retry-After', str(self.server.stub.faults.retry_after))
+        if etag is not None:
+            self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        if not truncate or self.server.stub.faults.truncate_length:
+            self.send_header('Content-Length', str(len(body)))
+        if truncate:
+            self.send_header('Connection', 'close')
+            self.close_connection = True
+            self.server.stub._record_fault()
+            body = body[:len(body) // 2]
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(object):
+    """Local stand-in for the Niddel Magnet v2 API, serving a Dataset on a background thread:
+
+        with StubServer(Dataset(alerts=10000), latency=0.01) as server:
+            conn = Connection(profile=None, api_key=server.api_key, endpoint=server.endpoint)
+            ...
+
+    It serves /me, /organizations, /organizations/{id}, /organizations/{id}/alerts,
+    /organizations/{id}/alerts/dates, /organizations/{id}/credentials and the
+    /organizations/{id}/whitelists and /organizations/{id}/blacklists endpoints, optionally adding
+    latency and injecting failures."""
+
+    def __init__(self, dataset=None, latency=0.0, faults=None, api_key='stub-api-key',
+                 host='127.0.0.1', port=0, prefix='/v2'):
+        """Initializes a stub server, which is only started by start() or by using it as a
+        context manager.
+        :param dataset: the magnetsdk2.testing.Dataset to serve, a small default one is used if
+        omitted
+        :param latency: number of seconds to wait before answering each request
+        :param faults: a magnetsdk2.testing.Faults instance with the failures to inject
+        :param api_key: the API key requests must provide, or None to accept any
+        :param host: address to listen on
+        :param port: port to listen on, by default a free one is chosen
+        :param prefix: path under which the API is served
+        """
+        if latency < 0:
+            raise ValueError("latency must not be negative")
+        if faults is not None and not isinstance(faults, Faults):
+            raise ValueError("faults must be a Faults instance")
+        self.dataset = dataset or Dataset()
+        self.latency = latency
+        self.faults = faults
+        self.api_key = api_key
+        self.host = host
+        self.port = port
+        self.prefix = prefix.rstrip('/')
+        self._httpd = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'faults': 0}
+        self._logger = logging.getLogger('magnetsdk2')
+
+    @property
+    def endpoint(self):
+        """The URL to use as the endpoint of a Connection."""
+        return 'http://%s:%d%s' % (self.host, self.port, self.prefix)
+
+    def start(self):
+        """Starts serving requests on a background thread.
+        :return: the stub server itself
+        """
+        if self._httpd is not None:
+            return self
+        self._httpd = _ThreadingHTTPServer((self.host, self.port), _Handler)
+        self._httpd.stub = self
+        self.port = self._httpd.server_address[1]
+        self._thread = threading.Thread(target=self._httpd.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        self._logger.debug('stub server listening on %s', self.endpoint)
+        return self
+
+    def stop(self):
+        """Stops serving requests."""
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def serve_forever(self):
+        """Serves requests on the current thread until interrupted."""
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(1)
+        finally:
+            self.stop()
+
+    def _record_request(self):
+        with self._lock:
+            self._stats['requests'] += 1
+
+    def _record_fault(self):
+        with self._lock:
+            self._stats['faults'] += 1
+
+    def stats(self):
+        """:return: a dict with the number of 'requests' received and of 'faults' injected"""
+        with self._lock:
+            return dict(self._stats)
+
+    def _route(self, segments, query):
+        """Computes the response to a request.
+        :param segments: the parts of the path after the prefix
+        :param query: the parsed query string
+        :return: the data to send, a tuple with the data and its ETag, or None if not found
+        """
+        dataset = self.dataset
+        if segments == ['me']:
+            return dataset.me()
+        if segments[0] != 'organizations':
+            return None
+        if len(segments) == 1:
+            return self._page(query, dataset.organizations)
+        organization = dataset.organization_index(segments[1])
+        if organization is None:
+            return None
+        resource = segments[2:]
+        if not resource:
+            data = dataset.organizations[organization]
+            return data, '"%s"' % data['id']
+        if resource == ['alerts']:
+            return self._alerts(organization, query)
+        if resource == ['alerts', 'dates']:
+            sortBy = query.get('sortBy', ['logDate'])[0]
+            dates = dataset.alert_dates(sortBy)
+            return dates, '"%s-%d-%s"' % (sortBy, len(dates), dates[-1] if dates else '')
+        if resource == ['credentials']:
+            return self._credentials(organization)
+        if resource[0] in ('whitelists', 'blacklists'):
+            entries = dataset.list_entries_of(resource[0][:5], organization)
+            if len(resource) == 1:
+                return entries
+            if len(resource) == 2:
+                for entry in entries:
+                    if entry['id'] == resource[1].lower():
+                        return entry
+        return None
+
+    @staticmethod
+    def _page_bounds(query):
+        size = int(query.get('size', [_PAGE_SIZE])[0])
+        page = int(query.get('page', [1])[0])
+        if size < 1 or page < 1:
+            raise ValueError('invalid page')
+        return (page - 1) * size, page * size
+
+    def _page(self, query, items):
+        start, stop = self._page_bounds(query)
+        return items[start:stop]
+
+    def _alerts(self, organization, query):
+        dataset = self.dataset
+        start, stop = self._page_bounds(query)
+        sortBy = query.get('sortBy', ['logDate'])[0]
+        fromDate = query.get('fromDate', [None])[0]
+        toDate = query.get('toDate', [None])[0]
+        status = query.get('status')
+        if status:
+            alerts = dataset.iter_alerts(organization, fromDate, toDate, sortBy, status)
+            return list(islice(alerts, start, stop))
+        first, last = dataset.alert_range(fromDate, toDate, sortBy)
+        return [dataset.alert(organization, i)
+                for i in six.moves.range(first + start, min(first + stop, last))]
+
+    def _credentials(self, organization):
+        expiration = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+        return {'accessKeyId': 'ASIASTUB%08d' % organization,
+                'secretAccessKey': 'stub-secret-%d' % organization,
+                'sessionToken': 'stub-token-%d' % organization,
+                'expiration': expiration.strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'bucket': 'stub-bucket-%d' % organization, 'bucketRegion': 'us-east-1',
+                'prefix': self.dataset.organizations[organization]['id'] + '/'}
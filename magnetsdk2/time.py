@@ -1,7 +1,10 @@
+from __future__ import absolute_import, division
+
 import datetime
 
 import six
-import iso8601
+
+from magnetsdk2.validation import TIMESTAMP_MATCH, memoize
 
 
 class UTC(datetime.tzinfo):
@@ -24,10 +27,53 @@ UTC = UTC()
 
 UTC_EPOCH = datetime.datetime(1970, 1, 1, tzinfo=UTC)
 
+_EPOCH_ORDINAL = UTC_EPOCH.toordinal()
+
 
 def seconds_from_UTC_epoch(value):
+    """Converts a timestamp into seconds since the UNIX epoch. Strings without a time zone are
+    assumed to be in UTC.
+    :param value: a string with an ISO 8601 date or timestamp, or a datetime.datetime instance
+    :return: a float
+    """
     if isinstance(value, six.string_types):
+        match = TIMESTAMP_MATCH(value)
+        if match is not None:
+            seconds = _seconds_from_match(match)
+            if seconds is not None:
+                return seconds
+        import iso8601
         value = iso8601.parse_date(value)
     elif not isinstance(value, datetime.datetime):
         raise ValueError('timestamp expected')
     return (value - UTC_EPOCH).total_seconds()
+
+
+@memoize(4096)
+def _epoch_days(value):
+    """Returns the number of days between the epoch and a YYYY-MM-DD date."""
+    return datetime.date(int(value[:4]), int(value[5:7]), int(value[8:10])).toordinal() \
+        - _EPOCH_ORDINAL
+
+
+def _seconds_from_match(match):
+    """Computes the seconds since the epoch of a timestamp matched by TIMESTAMP_MATCH the same way
+    timedelta.total_seconds does, so that results are identical, or returns None if the time is
+    out of range. Dates are memoized, as many timestamps share them."""
+    value = match.string
+    seconds = _epoch_days(value[:10]) * 86400
+    if len(value) == 10:
+        return float(seconds)
+    hour, minute, second = int(value[11:13]), int(value[14:16]), int(value[17:19])
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    seconds += hour * 3600 + minute * 60 + second
+    fraction, zone = match.group(7, 8)
+    if zone is not None and zone != 'Z':
+        hours, minutes = int(zone[1:3]), int(zone[4:6])
+        if hours > 23 or minutes > 59:
+            return None
+        seconds += (hours * 3600 + minutes * 60) * (1 if zone[0] == '-' else -1)
+    if fraction:
+        return (seconds * 10 ** 6 + int((fraction + '00000')[:6])) / 10 ** 6
+    return float(seconds)
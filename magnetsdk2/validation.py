@@ -1,22 +1,88 @@
 # -*- coding: utf-8 -*-
 """
-This module implements basic validation and conversion logic for API data.
+This module implements basic validation and conversion logic for API data. Canonical UUIDs and
+ISO 8601 dates, which are what the API returns, are handled by precompiled fast paths with memoized
+results, and anything else by the general-purpose validators and iso8601 packages.
 """
+from __future__ import absolute_import
+
 import datetime
-from collections import Iterable
+import re
 from uuid import UUID
 
-import iso8601
-import validators
 import six
 
+try:
+    from collections.abc import Iterable
+except ImportError:
+    from collections import Iterable
+
+try:
+    from functools import lru_cache
+except ImportError:  # Python 2
+    lru_cache = None
+
+# UUIDs in the canonical 8-4-4-4-12 hexadecimal form the API uses; validators.uuid checks others
+UUID_MATCH = re.compile(r'[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-'
+                         r'[0-9a-fA-F]{12}\Z').match
+
+# YYYY-MM-DD dates and YYYY-MM-DDTHH:MM:SS[.ffffff][Z|+HH:MM] timestamps, the ISO 8601 forms the
+# API uses, as groups with the year, month, day, hour, minute, second, fraction and time zone
+TIMESTAMP_MATCH = re.compile(r'(\d{4})-(\d{2})-(\d{2})(?:T(\d{2}):(\d{2}):(\d{2})(?:\.(\d+))?'
+                             r'(Z|[+-]\d{2}:\d{2})?)?\Z').match
+
+
+def memoize(maxsize):
+    """Decorator that caches up to maxsize results of a function of hashable arguments, with
+    functools.lru_cache or, on Python 2, a dict that is emptied when full."""
+    if lru_cache is not None:
+        return lru_cache(maxsize=maxsize)
+
+    def decorator(func):
+        cache = {}
+
+        def wrapper(*args):
+            try:
+                return cache[args]
+            except KeyError:
+                pass
+            if len(cache) >= maxsize:
+                cache.clear()
+            result = cache[args] = func(*args)
+            return result
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
 
 def is_valid_uuid(value):
     """Validates if a value is a string representation of a UUID.
     :param value: string to validate
     :return: a boolean
     """
-    return isinstance(value, UUID) or validators.uuid(value)
+    if isinstance(value, UUID):
+        return True
+    if not isinstance(value, six.string_types):
+        return False
+    if UUID_MATCH(value) is not None:
+        return True
+    import validators
+    return validators.uuid(value)
+
+
+def are_valid_uuids(values):
+    """Validates if all values of an iterable are string representations of UUIDs, which is
+    faster than calling is_valid_uuid on each of them.
+    :param values: iterable of strings to validate
+    :return: a boolean
+    """
+    values = values if isinstance(values, (list, tuple)) else list(values)
+    if all(isinstance(x, six.string_types) for x in values) \
+            and all(map(UUID_MATCH, values)):
+        return True
+    return all(is_valid_uuid(x) for x in values)
 
 
 def is_valid_uri(value):
@@ -24,7 +90,10 @@ def is_valid_uri(value):
     :param value: string to validate
     :return: a boolean
     """
-    return isinstance(value, six.string_types) and validators.url(value)
+    if not isinstance(value, six.string_types):
+        return False
+    import validators
+    return validators.url(value)
 
 
 def is_valid_port(value):
@@ -66,10 +135,36 @@ def parse_date(value):
     :return: a datetime.date instance
     """
     if isinstance(value, six.string_types):
-        return iso8601.parse_date(value).date().isoformat()
+        return _parse_date_string(value)
     elif isinstance(value, datetime.datetime):
         return value.date().isoformat()
     elif isinstance(value, datetime.date):
         return value.isoformat()
     else:
         raise ValueError('date must be in ISO format: ' + repr(value))
+
+
+@memoize(4096)
+def _parse_date_string(value):
+    match = TIMESTAMP_MATCH(value)
+    if match is not None and is_valid_time(match):
+        return date_from_parts(*match.group(1, 2, 3)).isoformat()
+    import iso8601
+    return iso8601.parse_date(value).date().isoformat()
+
+
+@memoize(4096)
+def date_from_parts(year, month, day):
+    """Builds a datetime.date object from the strings matched by TIMESTAMP_MATCH, raising
+    ValueError if it is not a valid date."""
+    return datetime.date(int(year), int(month), int(day))
+
+
+def is_valid_time(match):
+    """Checks the time and time zone matched by TIMESTAMP_MATCH, if any, are within range."""
+    hour = match.group(4)
+    if hour is None:
+        return True
+    zone = match.group(8)
+    return int(hour) < 24 and int(match.group(5)) < 60 and int(match.group(6)) < 60 and \
+        (zone is None or zone == 'Z' or (int(zone[1:3]) < 24 and int(zone[4:6]) < 60))
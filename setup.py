@@ -23,11 +23,12 @@ setup(
     version=__version__,
     url='https://github.com/niddel/magnet-api2-sdk-python/',
     license='Apache Software License',
-    install_requires=['requests>=2.12.5,<3', 'six>=1.10,<2', 'iso8601>=0.1.12,<1',
-                      'validators>=0.12.0,<1', 'boto3>=1.4.5,<2'],
+    install_requires=['requests>=2.16,<3', 'six>=1.10,<2', 'iso8601>=0.1.12,<1',
+                      'validators>=0.12.0,<1', 'boto3>=1.4.5,<2',
+                      'futures>=3.0,<4; python_version < "3.2"'],
     tests_require=['pytest>=3.3,<4'],
     setup_requires=['pytest-runner>=3,<4'],
-    packages=['magnetsdk2'],
+    packages=['magnetsdk2', 'magnetsdk2.testing'],
     include_package_data=True,
     platforms='any',
     classifiers=[
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Shared fixtures for the magnetsdk2 tests.
+"""
+import json
+import sys
+import threading
+import uuid
+
+import pytest
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import urlsplit, parse_qs
+
+# AsyncConnection and its tests use syntax that requires Python 3.6
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 6) else []
+
+ORGANIZATIONS = [{'id': str(uuid.UUID(int=i + 1)), 'name': 'org%d' % i} for i in range(250)]
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        query = parse_qs(url.query)
+        status = 200
+        if url.path.startswith('/v2/status/'):
+            status = int(url.path.rsplit('/', 1)[1])
+            data = {'status': status}
+        elif url.path == '/v2/organizations':
+            page, size = int(query['page'][0]), int(query['size'][0])
+            data = ORGANIZATIONS[(page - 1) * size:page * size]
+        elif url.path.startswith('/v2/organizations/'):
+            data = ORGANIZATIONS[int(url.path.rsplit('-', 1)[1], 16) - 1]
+            etag = '"%s"' % data['id']
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+        else:
+            data = {'path': self.path, 'connection': self.headers.get('Connection')}
+        body = json.dumps(data).encode('UTF-8')
+        self.send_response(status)
+        if status in (429, 503):
+            self.send_header('Retry-After', '0')
+        if isinstance(data, dict) and 'id' in data:
+            self.send_header('ETag', '"%s"' % data['id'])
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = _ThreadingHTTPServer(('127.0.0.1', 0), _JSONHandler)
+    thread = threading.Thread(target=httpd.serve_forever)
+    thread.daemon = True
+    thread.start()
+    yield 'http://127.0.0.1:%d/v2' % httpd.server_address[1]
+    httpd.shutdown()
+    httpd.server_close()
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.aio.
+"""
+import asyncio
+
+from magnetsdk2.aio import AsyncConnection
+from tests.conftest import ORGANIZATIONS
+
+
+def test_async_connection(server):
+    async def run():
+        async with AsyncConnection(profile=None, api_key='secret', endpoint=server,
+                                   max_in_flight=2) as conn:
+            organizations = [x async for x in conn.iter_organizations()]
+            results = await asyncio.gather(*[conn.get_me() for _ in range(5)])
+            return organizations, results, conn.pool_stats()
+
+    loop = asyncio.new_event_loop()
+    try:
+        organizations, results, stats = loop.run_until_complete(run())
+    finally:
+        loop.close()
+    assert organizations == ORGANIZATIONS
+    assert all(x['path'] == '/v2/me' for x in results)
+    assert stats['connections'] <= 2
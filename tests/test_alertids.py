@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.alertids.
+"""
+from uuid import UUID, uuid4
+
+import pytest
+
+from magnetsdk2.alertids import AlertIdSet
+
+
+@pytest.mark.parametrize('bloom_capacity', [None, 100])
+def test_alert_id_set(bloom_capacity):
+    ids = [str(uuid4()) for _ in range(5000)]
+    alert_ids = AlertIdSet(ids[:1000], bloom_capacity=bloom_capacity)
+    for x in ids[1000:]:
+        alert_ids.add(x)
+    alert_ids.add(ids[0].upper())
+    assert len(alert_ids) == 5000
+    assert alert_ids == set(ids)
+    assert all(x in alert_ids for x in ids)
+    assert UUID(ids[1]) in alert_ids
+    assert ids[2].upper() in alert_ids
+    assert str(uuid4()) not in alert_ids
+    assert 'not an ID' not in alert_ids
+    assert None not in alert_ids
+    with pytest.raises(ValueError):
+        alert_ids.add('not an ID')
+
+    alert_ids.discard(ids[0])
+    alert_ids.discard(ids[-1])
+    assert ids[0] not in alert_ids and ids[-1] not in alert_ids and ids[1] in alert_ids
+    assert len(alert_ids) == 4998
+
+    decoded = AlertIdSet.from_bytes(alert_ids.to_bytes(), bloom_capacity=bloom_capacity)
+    assert decoded == alert_ids
+    assert ids[1] in decoded
+    with pytest.raises(ValueError):
+        AlertIdSet.from_bytes(alert_ids.to_bytes()[:-1])
+    alert_ids.clear()
+    assert not alert_ids and ids[1] not in alert_ids
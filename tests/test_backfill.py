@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.backfill.
+"""
+import json
+import os
+import uuid
+
+import pytest
+
+from magnetsdk2.backfill import Backfill
+
+ORGANIZATION_ID = str(uuid.UUID(int=1))
+DATES = ['2017-10-30', '2017-11-01', '2017-11-02', '2017-11-05', '2017-11-09']
+
+
+class _FakeConnection(object):
+    """Has 2 alerts on every date, and can be told to fail on a given date."""
+
+    def __init__(self, fail_on=None):
+        self.fail_on = fail_on
+        self.queries = []
+
+    def list_organization_alert_dates(self, organization_id, sortBy):
+        return set(DATES)
+
+    def iter_organization_alerts(self, organization_id, fromDate=None, toDate=None,
+                                 sortBy='logDate', status=None, page_size=None):
+        self.queries.append((fromDate, toDate))
+        for date in DATES:
+            if fromDate <= date <= toDate:
+                if date == self.fail_on:
+                    raise IOError('boom')
+                for i in range(2):
+                    yield {'id': '%s-%d' % (date, i), sortBy: date}
+
+
+def test_partitions():
+    backfill = Backfill(_FakeConnection(), ORGANIZATION_ID, '2017-11-01', '2017-11-08')
+    assert backfill.partitions() == [('2017-11-01', '2017-11-01'), ('2017-11-02', '2017-11-02'),
+                                     ('2017-11-05', '2017-11-05')]
+    backfill = Backfill(_FakeConnection(), ORGANIZATION_ID, '2017-11-01', '2017-11-08', days=3)
+    assert backfill.partitions() == [('2017-11-01', '2017-11-03'), ('2017-11-04', '2017-11-06')]
+    with pytest.raises(ValueError):
+        Backfill(_FakeConnection(), ORGANIZATION_ID, '2017-11-08', '2017-11-01')
+    with pytest.raises(ValueError):
+        Backfill(_FakeConnection(), ORGANIZATION_ID, '2017-11-01', '2017-11-08', workers=0)
+
+
+def test_backfill(tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    flushes = []
+    alerts = list(Backfill(_FakeConnection(), ORGANIZATION_ID, '2017-10-31', '2017-11-30',
+                           workers=2, checkpoint=checkpoint,
+                           before_checkpoint=lambda: flushes.append(1)))
+    assert sorted(x['id'] for x in alerts) == sorted('%s-%d' % (d, i) for d in DATES[1:]
+                                                     for i in range(2))
+    assert len(flushes) == 4
+    with open(checkpoint) as f:
+        assert json.load(f)['completed'] == DATES[1:]
+
+    # everything is already done
+    connection = _FakeConnection()
+    assert not list(Backfill(connection, ORGANIZATION_ID, '2017-10-31', '2017-11-30',
+                             checkpoint=checkpoint))
+    assert not connection.queries
+
+    # a checkpoint can't be reused with different settings
+    with pytest.raises(ValueError):
+        Backfill(connection, ORGANIZATION_ID, '2017-10-31', '2017-11-30', days=2,
+                 checkpoint=checkpoint)
+
+
+def test_resume(tmpdir):
+    checkpoint = str(tmpdir.join('checkpoint.json'))
+    with pytest.raises(IOError):
+        for _ in Backfill(_FakeConnection(fail_on='2017-11-05'), ORGANIZATION_ID, '2017-11-01',
+                          '2017-11-09', workers=1, checkpoint=checkpoint):
+            pass
+    assert os.path.exists(checkpoint)
+
+    connection = _FakeConnection()
+    alerts = list(Backfill(connection, ORGANIZATION_ID, '2017-11-01', '2017-11-09',
+                           checkpoint=checkpoint))
+    assert sorted(x['id'] for x in alerts) == ['2017-11-05-0', '2017-11-05-1', '2017-11-09-0',
+                                               '2017-11-09-1']
+    assert sorted(connection.queries) == [('2017-11-05', '2017-11-05'),
+                                          ('2017-11-09', '2017-11-09')]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.cache.
+"""
+import os
+
+from magnetsdk2.cache import HTTPCache, MemoryCacheBackend, FileCacheBackend, TTLCache, \
+    cache_filename
+from magnetsdk2.connection import Connection
+from tests.conftest import ORGANIZATIONS
+
+
+def test_memory_backend_lru():
+    backend = MemoryCacheBackend(max_entries=2)
+    backend.set('a', 1)
+    backend.set('b', 2)
+    assert backend.get('a') == 1
+    backend.set('c', 3)
+    assert backend.get('b') is None
+    assert backend.get('a') == 1
+    assert len(backend) == 2
+
+
+def test_file_backend(tmpdir):
+    backend = FileCacheBackend(str(tmpdir.join('cache')))
+    assert backend.get('a') is None
+    backend.set('a', {'x': 1})
+    assert FileCacheBackend(str(tmpdir.join('cache'))).get('a') == {'x': 1}
+    backend.clear()
+    assert backend.get('a') is None
+
+
+def test_conditional_requests(server, tmpdir):
+    organization = ORGANIZATIONS[3]
+    cache = HTTPCache(FileCacheBackend(str(tmpdir)), ttls={'organizations/{id}': 0, 'me': 3600})
+    conn = Connection(profile=None, api_key='secret', endpoint=server, cache=cache)
+
+    assert conn.get_organization(organization['id']) == organization
+    response = conn._request('GET', 'organizations/' + organization['id'])
+    assert response.from_cache
+    assert response.json() == organization
+    assert conn.get_organization(organization['id']) == organization
+    assert cache.stats() == {'hits': 0, 'revalidations': 2, 'misses': 1, 'stores': 1}
+
+    conn.get_me()
+    conn.get_me()
+    assert cache.stats()['hits'] == 1
+    assert conn.pool_stats()['requests'] == 4
+
+    other = Connection(profile=None, api_key='other', endpoint=server, cache=cache)
+    assert not other._request('GET', 'me').from_cache
+    conn.close()
+    other.close()
+
+
+def test_ttl_cache(tmpdir):
+    filename = str(tmpdir.join('organizations.json'))
+    cache = TTLCache(ttl=60, max_size=2, filename=filename)
+    cache.set('a', {'x': 1})
+    cache.set('b', {'x': 2})
+    assert cache.get('a') == {'x': 1}
+    cache.set('c', {'x': 3})
+    assert cache.get('b') is None
+    assert len(cache) == 2
+    # changes are only written when saved
+    assert not os.path.exists(filename)
+    cache.close()
+
+    other = TTLCache(ttl=60, max_size=2, filename=filename)
+    assert other.get('a') == {'x': 1}
+    assert other.get('c') == {'x': 3}
+    other.invalidate('a')
+    assert TTLCache(ttl=60, filename=filename).get('a') is None
+    assert TTLCache(ttl=0, filename=filename).get('c') is None
+
+
+def test_organization_cache(server, tmpdir):
+    organization = ORGANIZATIONS[5]
+    conn = Connection(profile=None, api_key='secret', endpoint=server,
+                      organization_cache=TTLCache(filename=cache_filename('secret', 'org',
+                                                                         str(tmpdir))))
+    assert conn.get_organization(organization['id']) == organization
+    assert conn.get_organization(organization['id']) == organization
+    assert conn.pool_stats()['requests'] == 1
+    conn.invalidate_organization(organization['id'])
+    assert conn.get_organization(organization['id']) == organization
+    assert conn.get_organization(organization['id'], cache=False) == organization
+    assert conn.pool_stats()['requests'] == 3
+    conn.close()
@@ -1,5 +1,11 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+
 from magnetsdk2.cef import escape_header_entry, header, escape_extension_value, extension, \
-    timestamp
+    timestamp, convert_alert, convert_alerts
+from magnetsdk2.testing import Dataset
 
 
 def test_escape_header_entry():
@@ -34,3 +40,27 @@ def test_extension():
 def test_timestamp():
     assert timestamp("1970-01-01T00:00:00Z") == '0'
     assert timestamp("2017-11-15T11:00:00Z") == '1510743600000'
+
+
+def test_convert_alerts():
+    dataset = Dataset(organizations=1, alerts=50, dates=2)
+    organization = dataset.organizations[0]['id']
+    alerts = [dataset.alert(0, i) for i in range(50)]
+    alerts[0].update(netDstDomain='a=b\\c\nd\re ', confidence=95)
+    alerts[1].update(tags=[' x', 'y\x00z'], netSrcProcessId=12, netBlocked=True)
+    alerts[2].update(netSrcUser=u'\xe9l\xe8ve\u2003', confidence=0.5, aggFirst='00:00:00.123')
+    alerts[3].update(netDstPort=0, netSrcIpRdomain='  ')
+    del alerts[4]['createdAt'], alerts[4]['tags']
+
+    expected = io.BytesIO()
+    for alert in alerts:
+        convert_alert(expected, alert, organization)
+        expected.write(b'\n')
+    out = io.BytesIO()
+    assert convert_alerts(out, alerts, organization, batch_size=7, separator='\n') == 50
+    assert out.getvalue() == expected.getvalue()
+
+    with pytest.raises(ValueError):
+        convert_alerts(io.BytesIO(), [dict(alerts[0], confidence=101)], organization)
+    with pytest.raises(ValueError):
+        convert_alerts(io.BytesIO(), alerts, organization, batch_size=0)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.connection.
+"""
+import pytest
+
+from magnetsdk2.connection import Connection
+from tests.conftest import ORGANIZATIONS
+
+
+def test_session_reuses_connections(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server)
+    assert conn.pool_stats()['requests'] == 0
+    for _ in range(5):
+        assert conn._request('GET', 'me').json()['path'] == '/v2/me'
+    stats = conn.pool_stats()
+    assert stats['requests'] == 5
+    assert stats['connections'] == 1
+    assert stats['reused'] == 4
+    assert stats['idle'] == 1
+
+    conn.close()
+    assert conn._session is None
+    assert conn.pool_stats()['requests'] == 0
+
+
+def test_keep_alive_disabled(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server, keep_alive=False)
+    assert conn._request('GET', 'me').json()['connection'] == 'close'
+    conn.close()
+
+
+def test_proxy_changes_rebuild_session(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server, pool_size=2)
+    session = conn.session
+    assert conn.session is session
+    conn.set_proxy('proxy.example.com', 3128)
+    assert conn._session is None
+    session = conn.session
+    conn.clear_proxy()
+    assert conn._session is None
+    assert conn.session is not session
+
+
+def test_invalid_pool_size():
+    with pytest.raises(ValueError):
+        Connection(profile=None, api_key='secret', pool_size=0)
+
+
+def test_prefetch_yields_pages_in_order(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server)
+    assert list(conn.iter_organizations(prefetch=4)) == ORGANIZATIONS
+    assert list(conn.iter_organizations(prefetch=1)) == ORGANIZATIONS
+    with pytest.raises(ValueError):
+        conn.iter_organizations(prefetch=0)
+    conn.close()
+
+
+def test_stream_pages(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server)
+    assert list(conn._iter_pages('organizations', stream=True)) == ORGANIZATIONS
+    with pytest.raises(ValueError):
+        conn._iter_pages('organizations', prefetch=2, stream=True)
+    conn.close()
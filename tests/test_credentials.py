@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.credentials.
+"""
+import threading
+import time
+from datetime import datetime
+
+from magnetsdk2.credentials import CredentialProvider
+
+ORGANIZATION_ID = '00000000-0000-0000-0000-000000000001'
+
+
+class _Fetcher(object):
+    def __init__(self, lifetime=3600, delay=0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, organization_id):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls += 1
+            calls = self.calls
+        expiration = datetime.utcfromtimestamp(time.time() + self.lifetime)
+        return {'accessKeyId': 'key%d' % calls,
+                'expiration': expiration.strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def _wait_for(condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+def test_cached_until_margin():
+    fetch = _Fetcher(lifetime=3600)
+    provider = CredentialProvider(background=False)
+    assert provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    assert provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    assert fetch.calls == 1
+
+    fetch = _Fetcher(lifetime=300)
+    provider = CredentialProvider(background=False)
+    assert provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    assert provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key2'
+
+
+def test_single_flight():
+    fetch = _Fetcher(delay=0.2)
+    provider = CredentialProvider(background=False)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(provider.get(ORGANIZATION_ID,
+                                                                           fetch)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert fetch.calls == 1
+    assert len(results) == 8
+    assert all(x is results[0] for x in results)
+
+
+def test_single_flight_late_caller():
+    # a caller that found no valid credentials, but only started refreshing them once another
+    # thread's refresh had ended, gets that thread's credentials
+    fetch = _Fetcher()
+    provider = CredentialProvider(background=False)
+    credentials = provider.get(ORGANIZATION_ID, fetch)
+    assert provider._refresh(ORGANIZATION_ID, fetch) is credentials
+    assert fetch.calls == 1
+
+
+def test_background_refresh():
+    fetch = _Fetcher(lifetime=4)
+    provider = CredentialProvider(refresh_margin=1, refresh_ahead=2.5)
+    assert provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    assert provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    _wait_for(lambda: provider.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key2')
+    assert fetch.calls == 2
+    provider.close()
+
+
+def test_shared_file(tmpdir):
+    filename = str(tmpdir.join('credentials.json'))
+    fetch = _Fetcher()
+    first = CredentialProvider(background=False, filename=filename)
+    second = CredentialProvider(background=False, filename=filename)
+    assert first.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    assert second.get(ORGANIZATION_ID, fetch)['accessKeyId'] == 'key1'
+    assert fetch.calls == 1
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.fanout.
+"""
+import uuid
+
+import pytest
+
+from magnetsdk2.fanout import iter_all_organization_alerts
+
+ORGANIZATION_IDS = [str(uuid.UUID(int=i + 1)) for i in range(6)]
+DATES = ['2017-11-0%d' % d for d in range(1, 6)]
+
+
+class _FakeConnection(object):
+    """Each organization has 3 alerts on every date, except the last one which always fails."""
+
+    def iter_organizations(self):
+        return [{'id': x} for x in ORGANIZATION_IDS]
+
+    def list_organization_alert_dates(self, organization_id, sortBy):
+        return set(DATES)
+
+    def iter_organization_alerts(self, organization_id, fromDate=None, toDate=None,
+                                 sortBy='logDate', status=None, page_size=None):
+        if organization_id == ORGANIZATION_IDS[-1]:
+            raise IOError('boom')
+        for date in DATES:
+            if (fromDate is None or date >= fromDate) and (toDate is None or date <= toDate):
+                for i in range(3):
+                    yield {'id': '%s-%s-%d' % (organization_id, date, i), sortBy: date}
+
+
+@pytest.mark.parametrize('merge', [False, True])
+def test_fan_out(merge):
+    reports = []
+    alerts = list(iter_all_organization_alerts(_FakeConnection(), max_workers=3, merge=merge,
+                                               progress=reports.append, buffer_size=2,
+                                               sortBy='batchDate', fromDate='2017-11-02'))
+    assert len(alerts) == 5 * 4 * 3
+    assert len(set(x[1]['id'] for x in alerts)) == len(alerts)
+    assert all(x[1]['id'].startswith(x[0]) for x in alerts)
+    if merge:
+        dates = [x[1]['batchDate'] for x in alerts]
+        assert dates == sorted(dates)
+    assert sorted(x.organization_id for x in reports) == ORGANIZATION_IDS
+    assert [x.organization_id for x in reports if x.failed] == ORGANIZATION_IDS[-1:]
+    assert all(x.alerts == 12 for x in reports if not x.failed)
+
+
+def test_early_close():
+    alerts = iter_all_organization_alerts(_FakeConnection(), ORGANIZATION_IDS[:2], buffer_size=1)
+    assert next(alerts)
+    alerts.close()
+    with pytest.raises(ValueError):
+        iter_all_organization_alerts(_FakeConnection(), ['not-a-uuid'])
@@ -0,0 +1,285 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.iterator.
+"""
+import sqlite3
+import threading
+
+import pytest
+
+from magnetsdk2.alertids import AlertIdSet
+from magnetsdk2.connection import Connection
+from magnetsdk2.iterator import AlertDateIndex, FilePersistentAlertIterator, PersistenceEntry, \
+    SQLitePersistenceStore, SQLitePersistentAlertIterator, _Prefetcher
+from magnetsdk2.testing import Dataset, StubServer
+
+
+@pytest.fixture
+def stub():
+    dataset = Dataset(organizations=1, alerts=230, dates=3)
+    with StubServer(dataset) as server:
+        conn = Connection(profile=None, api_key=server.api_key, endpoint=server.endpoint,
+                          page_size=20)
+        yield conn, dataset
+        conn.close()
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_exactly_once(stub, tmpdir, stream):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    filename = str(tmpdir.join('state.json'))
+    expected = [x['id'] for x in dataset.iter_alerts(0)]
+
+    # stop half way through the second batch date, and resume from the saved state
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id, stream=stream)
+    seen = [next(iterator)['id'] for _ in range(120)]
+    iterator.save()
+    if stream:
+        assert not iterator._alerts
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id, stream=stream)
+    seen.extend(x['id'] for x in iterator)
+    iterator.save()
+    assert sorted(seen) == sorted(expected)
+    if stream:
+        assert seen == expected
+
+    # nothing is returned again, but a reloaded iterator repeats what was not saved
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id, stream=stream)
+    assert not list(iterator)
+    iterator = FilePersistentAlertIterator(str(tmpdir.join('other.json')), conn,
+                                           organization_id, start_date='2017-01-04',
+                                           stream=stream)
+    assert next(iterator)['batchDate'] == '2017-01-04'
+    iterator.load()
+    assert len(list(iterator)) == len(list(dataset.iter_alerts(0, '2017-01-04',
+                                                               sortBy='batchDate')))
+
+
+def test_checkpoint_every(stub, tmpdir):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    filename = str(tmpdir.join('state.json'))
+    flushed = []
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id, stream=True,
+                                           checkpoint_every=50,
+                                           before_checkpoint=lambda: flushed.append(True))
+    seen = [next(iterator)['id'] for _ in range(51)]
+    assert len(flushed) == 1
+
+    # the state saved before the 51st alert was returned covers the first 50, so a new iterator
+    # resumes with the 51st
+    resumed = FilePersistentAlertIterator(filename, conn, organization_id, stream=True)
+    assert next(resumed)['id'] == seen[50]
+    resumed.close()
+    iterator.close()
+
+    with pytest.raises(ValueError):
+        FilePersistentAlertIterator(filename, conn, organization_id, checkpoint_every=0)
+    with pytest.raises(ValueError):
+        FilePersistentAlertIterator(filename, conn, organization_id, checkpoint_interval=-1)
+
+
+def test_lock(stub, tmpdir):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    filename = str(tmpdir.join('state.json'))
+    with FilePersistentAlertIterator(filename, conn, organization_id, lock=True) as iterator:
+        next(iterator)
+        other = FilePersistentAlertIterator(filename, conn, organization_id, lock=True,
+                                            lock_timeout=0)
+        with pytest.raises(IOError):
+            next(other)
+        iterator.save()
+    assert sorted(x.basename for x in tmpdir.listdir()) == ['state.json', 'state.json.lock']
+
+    with FilePersistentAlertIterator(filename, conn, organization_id, lock=True,
+                                     lock_timeout=0) as iterator:
+        assert len(list(iterator)) == len(list(dataset.iter_alerts(0))) - 1
+
+
+def test_sqlite_exactly_once(stub, tmpdir):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    filename = str(tmpdir.join('state.db'))
+    expected = [x['id'] for x in dataset.iter_alerts(0)]
+
+    with SQLitePersistentAlertIterator(filename, conn, organization_id, stream=True,
+                                       checkpoint_every=30) as iterator:
+        seen = [next(iterator)['id'] for _ in range(120)]
+        iterator.save()
+    with SQLitePersistentAlertIterator(filename, conn, organization_id, stream=True) as iterator:
+        seen.extend(x['id'] for x in iterator)
+        iterator.save()
+    assert seen == expected
+
+    with SQLitePersistenceStore(filename) as store:
+        entry = store.load(organization_id)
+        assert entry.latest_batch_date == '2017-01-04'
+        assert entry.latest_alert_ids == set(x['id'] for x in dataset.iter_alerts(
+            0, '2017-01-04', sortBy='batchDate'))
+        with SQLitePersistentAlertIterator(store, conn, organization_id) as iterator:
+            assert not list(iterator)
+        assert store.organization_ids() == [organization_id]
+
+
+def test_sqlite_store(tmpdir):
+    organization_ids = ['00000000-0000-4000-8000-%012d' % i for i in range(8)]
+    alert_ids = ['00000000-0000-4000-8000-1%011d' % i for i in range(200)]
+    filename = str(tmpdir.join('state.db'))
+    SQLitePersistenceStore(filename).close()
+
+    # writers on separate connections, as if in separate processes, wait for each other
+    def work(organization_id):
+        with SQLitePersistenceStore(filename) as store:
+            entry = PersistenceEntry(organization_id, '2017-01-02')
+            store.save(entry)
+            for i in range(0, len(alert_ids), 20):
+                new_alert_ids = alert_ids[i:i + 20]
+                for alert_id in new_alert_ids:
+                    entry.add_alert_id(alert_id)
+                store.save(entry, new_alert_ids, '2017-01-02')
+
+    threads = [threading.Thread(target=work, args=(x,)) for x in organization_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with SQLitePersistenceStore(filename) as store:
+        assert store.organization_ids() == organization_ids
+        for organization_id in organization_ids:
+            assert store.load(organization_id).latest_alert_ids == set(alert_ids)
+
+        # a new batch date replaces the saved alert IDs
+        entry = PersistenceEntry(organization_ids[0], '2017-01-03', alert_ids[:1])
+        store.save(entry, alert_ids[:1], '2017-01-02')
+        assert store.load(organization_ids[0]).latest_alert_ids == set(alert_ids[:1])
+        store.delete(organization_ids[0])
+        assert store.load(organization_ids[0]) is None
+
+    # readers don't wait for the write lock held by another connection
+    writer = sqlite3.connect(filename, isolation_level=None)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        with SQLitePersistenceStore(filename, timeout=0.1) as store:
+            assert store.load(organization_ids[1]).latest_alert_ids == set(alert_ids)
+            assert store.organization_ids() == organization_ids[1:]
+    finally:
+        writer.execute('ROLLBACK')
+        writer.close()
+
+
+def test_compact(stub, tmpdir):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    filename = str(tmpdir.join('state.json'))
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id)
+    seen = [next(iterator)['id'] for _ in range(10)]
+    iterator.save()
+
+    # a state saved as a list of IDs is loaded, and saved again in the binary encoding
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id, compact=True)
+    seen.append(next(iterator)['id'])
+    assert isinstance(iterator.persistence_entry.latest_alert_ids, AlertIdSet)
+    iterator.save()
+    assert 'latest_alert_ids": "' in tmpdir.join('state.json').read()
+
+    # IDs are kept in a plain set in memory unless compact is used
+    iterator = FilePersistentAlertIterator(filename, conn, organization_id)
+    assert type(iterator.persistence_entry.latest_alert_ids) is set
+    assert iterator.persistence_entry.latest_alert_ids == set(seen)
+    iterator = FilePersistentAlertIterator(str(tmpdir.join('new.json')), conn, organization_id,
+                                           compact=True)
+    next(iterator)
+    assert isinstance(iterator.persistence_entry.latest_alert_ids, AlertIdSet)
+
+
+@pytest.mark.parametrize('stream', [False, True])
+def test_prefetch(stub, tmpdir, stream):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    expected = [x['id'] for x in dataset.iter_alerts(0)]
+
+    requests = []
+    conn.add_observer(requests.append)
+    with FilePersistentAlertIterator(str(tmpdir.join('state.json')), conn, organization_id,
+                                     stream=stream) as iterator:
+        assert sorted(x['id'] for x in iterator) == sorted(expected)
+    expected_requests = len(requests)
+
+    # prefetched dates are used instead of being retrieved again
+    del requests[:]
+    with FilePersistentAlertIterator(str(tmpdir.join('prefetch.json')), conn, organization_id,
+                                     stream=stream, prefetch=2) as iterator:
+        seen = [next(iterator)['id']]
+        assert sorted(iterator._prefetcher._futures) == ['2017-01-03', '2017-01-04']
+        seen.extend(x['id'] for x in iterator)
+        assert sorted(seen) == sorted(expected)
+    assert len(requests) == expected_requests
+    conn.remove_observer(requests.append)
+
+    # dates with more alerts than the memory cap are retrieved when they are reached instead
+    with FilePersistentAlertIterator(str(tmpdir.join('other.json')), conn, organization_id,
+                                     stream=stream, prefetch=1,
+                                     prefetch_max_alerts=10) as iterator:
+        assert sorted(x['id'] for x in iterator) == sorted(expected)
+        assert iterator._prefetcher._buffered == 0
+
+
+
+class _FailingConnection(object):
+    """Returns a few alerts of a date, then fails as if the connection was lost."""
+
+    def iter_organization_alerts(self, **kwargs):
+        for i in range(5):
+            yield {'id': '%s-%d' % (kwargs['fromDate'], i)}
+        raise IOError('connection lost')
+
+
+def test_prefetch_failure():
+    # alerts counted towards the memory cap by a failed prefetch are given back
+    prefetcher = _Prefetcher(_FailingConnection(), '00000000-0000-4000-8000-000000000000', 2,
+                             10, None)
+    try:
+        for date in ('2017-01-02', '2017-01-03', '2017-01-04'):
+            prefetcher.schedule([date])
+            assert prefetcher.take(date) is None
+            assert prefetcher._buffered == 0
+    finally:
+        prefetcher.close()
+
+
+def test_alert_date_index(stub, tmpdir):
+    conn, dataset = stub
+    organization_id = dataset.organizations[0]['id']
+    dates = dataset.alert_dates('batchDate')
+
+    index = AlertDateIndex()
+    assert index.refresh(conn, organization_id)
+    assert index.dates == dates and index.etag and index.changed
+    assert index.since('2017-01-03') == dates[1:]
+    assert index.since('2017-01-03T12:00:00Z') == dates[1:]
+    assert index.since(None) == dates
+    assert not index.refresh(conn, organization_id)
+
+    # the index is saved with the state, so the next run only makes a conditional request
+    statuses = []
+    conn.add_observer(lambda e: statuses.append((e.path, e.status)))
+    filename = str(tmpdir.join('state.json'))
+    with FilePersistentAlertIterator(filename, conn, organization_id, stream=True) as iterator:
+        list(iterator)
+        iterator.save()
+    assert ('organizations/{id}/alerts/dates', 200) in statuses
+    del statuses[:]
+    with FilePersistentAlertIterator(filename, conn, organization_id, stream=True) as iterator:
+        assert iterator.persistence_entry.alert_dates.dates == dates
+        assert not list(iterator)
+    assert ('organizations/{id}/alerts/dates', 304) in statuses
+    assert ('organizations/{id}/alerts/dates', 200) not in statuses
+
+    filename = str(tmpdir.join('state.db'))
+    with SQLitePersistenceStore(filename) as store:
+        store.save(PersistenceEntry(organization_id, alert_dates=index))
+        assert not index.changed
+        assert store.load(organization_id).alert_dates.as_dict() == index.as_dict()
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.jsonlog.
+"""
+import json
+import logging
+
+from magnetsdk2.jsonlog import JSONFormatter, RequestLogger, UTCFormatter
+from magnetsdk2.metrics import RequestEvent
+
+
+class _ListHandler(logging.Handler):
+    def __init__(self):
+        super(_ListHandler, self).__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def test_request_logger():
+    logger = logging.getLogger('magnetsdk2.test_jsonlog')
+    logger.propagate = False
+    handler = _ListHandler()
+    handler.setFormatter(JSONFormatter())
+    logger.addHandler(handler)
+    observer = RequestLogger(logger)
+
+    logger.setLevel(logging.WARNING)
+    observer(RequestEvent('GET', 'me', 200, 0.1, 0.2, 0.3))
+    assert not handler.lines
+
+    logger.setLevel(logging.INFO)
+    observer(RequestEvent('GET', 'me', 200, 0.1, 0.2, 0.3, response_bytes=10))
+    observer(RequestEvent('GET', 'me', attempt=2, error=IOError('boom')))
+    first, second = [json.loads(x) for x in handler.lines]
+    assert first['message'] == 'GET me 200 in 0.600s'
+    assert first['level'] == 'INFO'
+    assert first['time'].endswith('Z')
+    assert first['request']['response_bytes'] == 10
+    assert second['message'] == 'GET me failed in 0.000s'
+    assert second['request']['attempt'] == 2
+    assert 'boom' in second['request']['error']
+
+
+def test_utc_formatter():
+    record = logging.LogRecord('magnetsdk2', logging.INFO, __file__, 1, 'hello', None, None)
+    record.created = 0
+    assert UTCFormatter('%(asctime)s', '%Y-%m-%dT%H:%M:%SZ').format(record) == \
+        '1970-01-01T00:00:00Z'
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.jsonstream.
+"""
+import json
+
+import pytest
+
+from magnetsdk2.jsonstream import IncompleteJSONError, iter_json_array
+
+DATA = [{'id': 1, 'name': u'café [,]', 'tags': ['a', 'b"]']}, 12345, -1.5e3, 'x', None,
+        [], {}, True]
+
+
+def _chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 4096])
+def test_chunk_boundaries(size):
+    text = json.dumps(DATA, ensure_ascii=False, indent=2)
+    assert list(iter_json_array(_chunks(text.encode('UTF-8'), size))) == DATA
+    assert list(iter_json_array(_chunks(text, size))) == DATA
+
+
+def test_yields_incrementally():
+    chunks = iter(['[{"a": 1}, ', '{"b": 2}', ']'])
+    items = iter_json_array(chunks)
+    assert next(items) == {'a': 1}
+    assert next(chunks) == '{"b": 2}'
+
+
+def test_empty_arrays():
+    assert list(iter_json_array(['[]'])) == []
+    assert list(iter_json_array([' [ ', ' ] ', '\n'])) == []
+
+
+@pytest.mark.parametrize('text', ['', '{}', '[', '[1', '[1,]', '[,1]', '[1 2]', '[1]x', '[{"a":'])
+def test_invalid(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(_chunks(text, 1)))
+
+
+@pytest.mark.parametrize('text', ['', '[', '[1', '[1,', '[{"a":', '[{"a": 1} '])
+def test_incomplete(text):
+    with pytest.raises(IncompleteJSONError):
+        list(iter_json_array(_chunks(text, 1)))
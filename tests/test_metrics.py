@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.metrics.
+"""
+import pytest
+
+from magnetsdk2.connection import Connection
+from magnetsdk2.metrics import MetricsAggregator, RequestEvent
+from magnetsdk2.retry import RetryPolicy
+
+
+def test_observers(server):
+    events = []
+    conn = Connection(profile=None, api_key='secret', endpoint=server, observers=[events.append],
+                      retry_policy=RetryPolicy(status_retries=1, backoff_factor=0))
+    conn._request_retry('GET', 'organizations/00000000-0000-0000-0000-000000000001')
+    conn._request_retry('GET', 'status/503', ok_status=())
+    conn.remove_observer(events.append)
+    conn._request_retry('GET', 'me')
+    conn.close()
+
+    assert [(x.method, x.path, x.status, x.attempt) for x in events] == [
+        ('GET', 'organizations/{id}', 200, 1), ('GET', 'status/503', 503, 1),
+        ('GET', 'status/503', 503, 2)]
+    first = events[0]
+    assert first.connect > 0 and first.ttfb >= 0 and first.download >= 0
+    assert first.response_bytes > 0 and not first.from_cache
+    assert events[1].connect == 0
+    with pytest.raises(ValueError):
+        conn.add_observer('not callable')
+
+
+def test_failing_observer(server):
+    def fail(event):
+        raise RuntimeError('boom')
+
+    conn = Connection(profile=None, api_key='secret', endpoint=server, observers=[fail])
+    assert conn._request('GET', 'me').status_code == 200
+    conn.close()
+
+
+def test_aggregator():
+    metrics = MetricsAggregator(buckets=(0.1, 1.0))
+    metrics(RequestEvent('GET', 'me', 200, 0.01, 0.02, 0.03, 0, 100))
+    metrics(RequestEvent('GET', 'me', 200, 0.0, 0.5, 0.1, 0, 100, attempt=2,
+                         throttle_wait=0.25))
+    metrics(RequestEvent('GET', 'me', 200, response_bytes=100, from_cache=True))
+    metrics(RequestEvent('GET', 'organizations/{id}', error=IOError('boom')))
+    snapshot = metrics.snapshot()
+    assert snapshot['requests'] == 4
+    assert snapshot['from_cache'] == 1
+    assert snapshot['errors'] == 1
+    assert snapshot['retries'] == 1
+    assert snapshot['response_bytes'] == 300
+    assert snapshot['endpoints']['GET me']['count'] == 2
+
+    text = metrics.prometheus_text()
+    assert 'magnetsdk2_requests_total{method="GET",path="me",status="200",cache="true"} 1' \
+           in text
+    assert 'magnetsdk2_request_duration_seconds_bucket{method="GET",path="me",status="200",' \
+           'le="0.1"} 1' in text
+    assert 'magnetsdk2_request_duration_seconds_bucket{method="GET",path="me",status="200",' \
+           'le="+Inf"} 2' in text
+    assert 'magnetsdk2_request_phase_duration_seconds_count{method="GET",path="me",' \
+           'phase="ttfb"} 2' in text
+    assert 'magnetsdk2_throttle_wait_seconds_total 0.25' in text
+
+    metrics.reset()
+    assert metrics.snapshot()['requests'] == 0
+    with pytest.raises(ValueError):
+        MetricsAggregator(buckets=(1.0, 0.5))
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.pagination.
+"""
+import pytest
+
+from magnetsdk2.connection import Connection
+from magnetsdk2.pagination import AdaptivePageSize, validate_page_size
+from tests.conftest import ORGANIZATIONS
+
+
+def test_validate_page_size():
+    assert validate_page_size(50) == 50
+    for value in (0, 1001, '100', None):
+        with pytest.raises(ValueError):
+            validate_page_size(value)
+    with pytest.raises(ValueError):
+        AdaptivePageSize(initial=10, minimum=25)
+
+
+def test_next_size():
+    policy = AdaptivePageSize(initial=100, minimum=25, maximum=400, target_latency=1.0,
+                              max_bytes=1000)
+    assert policy.next_size(100, 200, 0.1, 100) == 200
+    assert policy.next_size(100, 100, 0.1, 100) == 100
+    assert policy.next_size(400, 400, 0.1, 100) == 400
+    assert policy.next_size(100, 100, 0.7, 100) == 100
+    assert policy.next_size(100, 100, 2.0, 100) == 50
+    assert policy.next_size(100, 100, 0.1, 5000) == 50
+    assert policy.next_size(25, 100, 2.0, 100) == 25
+
+
+@pytest.mark.parametrize('page_size', [49, 100, 250, 1000,
+                                       AdaptivePageSize(initial=25, minimum=25, maximum=200,
+                                                        target_latency=60),
+                                       AdaptivePageSize(initial=100, minimum=25,
+                                                        target_latency=1e-9)])
+def test_page_sizes(server, page_size):
+    conn = Connection(profile=None, api_key='secret', endpoint=server, page_size=page_size)
+    assert list(conn.iter_organizations()) == ORGANIZATIONS
+    assert list(conn.iter_organizations(prefetch=3)) == ORGANIZATIONS
+    assert list(conn._iter_pages('organizations', stream=True)) == ORGANIZATIONS
+    conn.close()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.ratelimit.
+"""
+import threading
+import time
+
+import pytest
+
+from magnetsdk2.connection import Connection
+from magnetsdk2.ratelimit import TokenBucket, get_rate_limiter
+
+
+def test_token_bucket():
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert 0.09 < bucket.wait_time() <= 0.1
+    assert 0.09 < bucket.reserve() <= 0.1
+    assert 0.19 < bucket.reserve() <= 0.2
+    stats = bucket.stats()
+    assert stats['acquired'] == 4
+    assert stats['waits'] == 2
+
+    with pytest.raises(ValueError):
+        TokenBucket(rate=0)
+    assert TokenBucket(rate=2.5).burst == 3
+
+
+def test_token_bucket_threads():
+    bucket = TokenBucket(rate=200, burst=1)
+    threads = [threading.Thread(target=bucket.acquire) for _ in range(10)]
+    start = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.time() - start >= 0.04
+    assert bucket.stats()['acquired'] == 10
+
+
+def test_shared_rate_limiter(server):
+    assert get_rate_limiter('test-shared-key') is None
+    conn1 = Connection(profile=None, api_key='test-shared-key', endpoint=server, rate_limit=100,
+                       rate_burst=1)
+    conn2 = Connection(profile=None, api_key='test-shared-key', endpoint=server)
+    assert conn1.rate_limiter is conn2.rate_limiter is get_rate_limiter('test-shared-key')
+    conn1._request('GET', 'me')
+    response = conn2._request('GET', 'me')
+    assert response.throttle_wait > 0
+    stats = conn2.throttle_stats()
+    assert stats['requests'] == 1
+    assert stats['throttled'] == 1
+    assert stats['wait_time'] == response.throttle_wait
+    conn1.close()
+    conn2.close()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.retry.
+"""
+import pytest
+from requests import Response
+from requests.exceptions import ConnectionError
+
+from magnetsdk2.connection import Connection, _path_template
+from magnetsdk2.retry import RetryPolicy, CircuitBreaker, CircuitOpenError
+
+
+def _response(retry_after):
+    response = Response()
+    response.headers['Retry-After'] = retry_after
+    return response
+
+
+def test_backoff():
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5, jitter=False)
+    assert [policy.backoff(x) for x in range(1, 6)] == [1, 2, 4, 5, 5]
+    policy = RetryPolicy(backoff_factor=1, max_backoff=5)
+    assert all(0 <= policy.backoff(4) <= 5 for _ in range(100))
+
+
+def test_retry_after():
+    policy = RetryPolicy(backoff_factor=0.1, jitter=False, max_retry_after=10)
+    assert policy.delay(1, _response('3')) == 3
+    assert policy.delay(1, _response('3600')) == 10
+    assert policy.delay(1, _response('Wed, 21 Oct 2015 07:28:00 GMT')) == 0.1
+    assert policy.delay(1, _response('garbage')) == 0.1
+    assert RetryPolicy(jitter=False, respect_retry_after=False).delay(1, _response('3')) == 0.5
+
+
+def test_retryable_exceptions():
+    policy = RetryPolicy()
+    assert policy.is_retryable_exception(ConnectionError())
+    assert not policy.is_retryable_exception(CircuitOpenError())
+    assert not policy.is_retryable_exception(ValueError())
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=3600)
+    breaker.record_failure('me')
+    breaker.before_request('me')
+    breaker.record_failure('me')
+    assert breaker.is_open('me')
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request('me')
+    breaker.before_request('organizations')
+
+    breaker.reset_timeout = 0
+    breaker.before_request('me')
+    with pytest.raises(CircuitOpenError):
+        breaker.before_request('me')
+    breaker.record_success('me')
+    assert not breaker.is_open('me')
+
+
+def test_circuit_breaker_trial_error(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server,
+                      retry_policy=RetryPolicy(status_retries=0, backoff_factor=0),
+                      circuit_breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+    assert conn._request_retry('GET', 'status/503').status_code == 503
+    assert conn.circuit_breaker.is_open('status/503')
+
+    # a trial request that raises a non-retryable exception keeps the circuit open, and lets
+    # another trial through later
+    def fail(*args):
+        raise ValueError('bad request')
+
+    conn._request = fail
+    with pytest.raises(ValueError):
+        conn._request_retry('GET', 'status/503')
+    assert conn.circuit_breaker.is_open('status/503')
+    del conn._request
+    assert conn._request_retry('GET', 'status/503').status_code == 503
+
+
+def test_path_template():
+    assert _path_template('organizations/00000000-0000-0000-0000-000000000001/alerts') == \
+           'organizations/{id}/alerts'
+    assert _path_template('00000000-0000-0000-0000-000000000001') == '{id}'
+    assert _path_template('me') == 'me'
+
+
+def test_request_retry(server):
+    conn = Connection(profile=None, api_key='secret', endpoint=server,
+                      retry_policy=RetryPolicy(status_retries=2, backoff_factor=0),
+                      circuit_breaker=CircuitBreaker(failure_threshold=2, reset_timeout=3600))
+    assert conn._request_retry('GET', 'status/503').status_code == 503
+    assert conn._request_retry('GET', 'status/400').status_code == 400
+    assert conn._request_retry('GET', 'status/429').status_code == 429
+    assert conn._request_retry('GET', 'status/503').status_code == 503
+    with pytest.raises(CircuitOpenError):
+        conn._request_retry('GET', 'status/503')
+    assert conn._request_retry('GET', 'status/429').status_code == 429
+    stats = conn.retry_stats.as_dict()
+    assert stats['retries'] == 8
+    assert stats['statuses'] == {503: 4, 429: 4}
+    assert stats['exhausted'] == 4
+    assert stats['circuit_open'] == 1
+    conn.close()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+"""
+Modules imported on startup of the niddel CLI, which is often started from cron jobs and shell
+pipelines.
+"""
+import json
+import os
+import subprocess
+import sys
+
+# modules only some commands or options need, which must not be imported on startup
+LAZY_MODULES = ('boto3', 'botocore', 's3transfer', 'validators', 'iso8601', 'sqlite3', '_sqlite3',
+                'concurrent', 'asyncio')
+
+
+def _imported_modules(module):
+    """Imports a module in a new interpreter.
+    :return: a list with the names of all modules imported by then
+    """
+    output = subprocess.check_output(
+        [sys.executable, '-c',
+         'import json, sys; import {0:s}; print(json.dumps(sorted(sys.modules)))'.format(module)],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return json.loads(output.decode('UTF-8'))
+
+
+def test_cli_lazy_imports():
+    modules = _imported_modules('magnetsdk2.cli')
+    assert 'magnetsdk2.cli' in modules
+    eager = [x for x in modules if x.split('.')[0] in LAZY_MODULES]
+    assert not eager, 'modules imported eagerly: %s' % ', '.join(eager)
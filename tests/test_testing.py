@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.testing.
+"""
+import pytest
+import requests
+
+from magnetsdk2.connection import Connection
+from magnetsdk2.iterator import FilePersistentAlertIterator
+from magnetsdk2.retry import RetryPolicy
+from magnetsdk2.testing import Dataset, Faults, StubServer
+
+
+def _connection(server, **kwargs):
+    return Connection(profile=None, api_key=server.api_key, endpoint=server.endpoint, **kwargs)
+
+
+def test_dataset():
+    dataset = Dataset(organizations=2, alerts=95, dates=10)
+    assert len(dataset.alert_dates()) == 10
+    assert list(dataset.iter_alerts(1)) == [dataset.alert(1, i) for i in range(95)]
+    alerts = list(dataset.iter_alerts(0, '2017-01-03', '2017-01-04', 'batchDate'))
+    assert set(x['batchDate'] for x in alerts) == set(['2017-01-03', '2017-01-04'])
+    assert alerts == [x for x in dataset.iter_alerts(0)
+                      if '2017-01-03' <= x['batchDate'] <= '2017-01-04']
+    assert not list(dataset.iter_alerts(0, '2018-01-01'))
+    assert not list(dataset.iter_alerts(0, toDate='2016-01-01'))
+    assert len(list(dataset.iter_alerts(0, status=['new', 'resolved']))) == 47
+    assert Dataset(seed=1).alert(0, 0) != Dataset(seed=2).alert(0, 0)
+
+
+def test_endpoints():
+    dataset = Dataset(organizations=3, alerts=250, dates=5)
+    with StubServer(dataset) as server:
+        conn = _connection(server, page_size=40)
+        organization_id = dataset.organizations[1]['id']
+        assert conn.get_me()['defaultOrganizationId'] == dataset.organizations[0]['id']
+        assert list(conn.iter_organizations()) == dataset.organizations
+        assert conn.get_organization(organization_id) == dataset.organizations[1]
+        assert conn.get_organization('00000000-0000-0000-0000-00000000ffff') is None
+        assert list(conn.iter_organization_alerts(organization_id)) == \
+            list(dataset.iter_alerts(1))
+        assert list(conn.iter_organization_alerts(organization_id, stream=True,
+                                                  status=['new'])) == \
+            list(dataset.iter_alerts(1, status=['new']))
+        assert conn.list_organization_alert_dates(organization_id, 'batchDate') == \
+            set(dataset.alert_dates('batchDate'))
+        assert conn.get_organization_credentials(organization_id)['bucket'] == 'stub-bucket-1'
+        whitelist = conn.list_organization_whitelists(organization_id)
+        assert len(whitelist) == 5
+        assert conn.get_organization_whitelists(organization_id, whitelist[2]['id']) == \
+            whitelist[2]
+        assert len(conn.list_organization_blacklists(organization_id)) == 5
+
+        # a different API key is rejected
+        with pytest.raises(Exception):
+            Connection(profile=None, api_key='wrong', endpoint=server.endpoint).get_me()
+        conn.close()
+
+
+def test_faults(tmpdir):
+    dataset = Dataset(organizations=1, alerts=300, dates=3)
+    faults = Faults(error_rate=0.2, truncate_rate=0.1, seed=42)
+    with StubServer(dataset, faults=faults) as server:
+        conn = _connection(server, page_size=25,
+                           retry_policy=RetryPolicy(status_retries=10, error_retries=10,
+                                                    backoff_factor=0))
+        organization_id = dataset.organizations[0]['id']
+        assert list(conn.iter_organization_alerts(organization_id)) == \
+            list(dataset.iter_alerts(0))
+        iterator = FilePersistentAlertIterator(str(tmpdir.join('state.json')), conn,
+                                               organization_id)
+        assert sorted(x['id'] for x in iterator) == sorted(x['id'] for x in dataset.iter_alerts(0))
+        assert server.stats()['faults'] > 0
+        conn.close()
+
+    with pytest.raises(ValueError):
+        Faults(error_rate=2)
+
+
+def test_faults_stream(tmpdir):
+    # truncated bodies are only detected while streamed pages are read, after the request
+    dataset = Dataset(organizations=1, alerts=300, dates=3)
+    with StubServer(dataset, faults=Faults(truncate_rate=0.3, seed=7)) as server:
+        conn = _connection(server, page_size=25,
+                           retry_policy=RetryPolicy(error_retries=10, backoff_factor=0))
+        organization_id = dataset.organizations[0]['id']
+        assert list(conn.iter_organization_alerts(organization_id, stream=True)) == \
+            list(dataset.iter_alerts(0))
+        iterator = FilePersistentAlertIterator(str(tmpdir.join('state.json')), conn,
+                                               organization_id, stream=True)
+        assert sorted(x['id'] for x in iterator) == sorted(x['id'] for x in dataset.iter_alerts(0))
+        assert server.stats()['faults'] > 0
+        assert conn.retry_stats.as_dict()['retries'] > 0
+        conn.close()
+
+    with StubServer(dataset, faults=Faults(truncate_rate=1.0)) as server:
+        conn = _connection(server, retry_policy=RetryPolicy(error_retries=2, backoff_factor=0))
+        with pytest.raises(requests.RequestException):
+            list(conn.iter_organization_alerts(organization_id, stream=True))
+        assert server.stats()['requests'] == 3
+        conn.close()
+
+    # without a Content-Length, truncated bodies are only detected as incomplete JSON arrays
+    with StubServer(dataset, faults=Faults(truncate_rate=0.3, truncate_length=False,
+                                           seed=7)) as server:
+        conn = _connection(server, page_size=25,
+                           retry_policy=RetryPolicy(error_retries=10, backoff_factor=0))
+        assert list(conn.iter_organization_alerts(organization_id, stream=True)) == \
+            list(dataset.iter_alerts(0))
+        assert server.stats()['faults'] > 0
+        assert conn.retry_stats.as_dict()['retries'] > 0
+        conn.close()
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Test module for magnetsdk2.validation and magnetsdk2.time, checking the fast paths against the
+validators and iso8601 packages they replace.
+"""
+import random
+from uuid import UUID, uuid4
+
+import iso8601
+import pytest
+import validators
+
+from magnetsdk2.time import UTC_EPOCH, seconds_from_UTC_epoch
+from magnetsdk2.validation import are_valid_uuids, is_valid_uuid, parse_date
+
+
+def _timestamps(n):
+    generator = random.Random(0)
+    for _ in range(n):
+        value = '%04d-%02d-%02d' % (generator.randint(1970, 2100), generator.randint(1, 12),
+                                    generator.randint(1, 28))
+        if generator.random() < 0.8:
+            value += 'T%02d:%02d:%02d' % (generator.randint(0, 23), generator.randint(0, 59),
+                                          generator.randint(0, 59))
+            if generator.random() < 0.5:
+                value += '.%d' % generator.randint(0, 10 ** generator.randint(1, 9))
+            zone = generator.random()
+            if zone < 0.4:
+                value += 'Z'
+            elif zone < 0.7:
+                value += '%s%02d:%02d' % (generator.choice('+-'), generator.randint(0, 14),
+                                          generator.choice([0, 30, 45]))
+        yield value
+
+
+def test_timestamps():
+    # the last ones are only handled by iso8601
+    for value in list(_timestamps(1000)) + ['2017-01-02 12:34:56', '20170102T123456Z',
+                                            '2017-01-02T12:34:56,5+0100', '2017-01-02T12:34']:
+        expected = iso8601.parse_date(value)
+        assert seconds_from_UTC_epoch(value) == (expected - UTC_EPOCH).total_seconds(), value
+        assert parse_date(value) == expected.date().isoformat(), value
+
+
+@pytest.mark.parametrize('value', ['2017-02-30', '2017-01-02T24:00:00Z', '2017-01-02T12:60:00',
+                                   '2017-01-02T12:00:00+25:00', 'yesterday'])
+def test_invalid_timestamps(value):
+    with pytest.raises(ValueError):
+        seconds_from_UTC_epoch(value)
+    with pytest.raises(ValueError):
+        parse_date(value)
+
+
+def test_uuids():
+    ids = [str(uuid4()) for _ in range(100)]
+    for value in ids + [x.upper() for x in ids]:
+        assert is_valid_uuid(value) and validators.uuid(value)
+    for value in ['', 'not a UUID', ids[0][:-1], ids[0] + '0', ids[0] + '\n', None, 1]:
+        assert not is_valid_uuid(value)
+        assert not are_valid_uuids(ids + [value])
+    # other forms validators.uuid accepts are still valid
+    assert is_valid_uuid(ids[0].replace('-', '')) == bool(validators.uuid(ids[0].replace('-', '')))
+    assert is_valid_uuid(UUID(ids[0]))
+    assert are_valid_uuids(ids)
+    assert are_valid_uuids(iter(ids + [UUID(ids[0])]))
+    assert are_valid_uuids([])